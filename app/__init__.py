@@ -8,7 +8,7 @@ This module builds shared parts for other modules.
 
 import json
 
-from fastapi.templating import Jinja2Templates
+from app.utils.templating import create_templates
 
 
 # --------------------------------------------------------------------------------
@@ -19,6 +19,21 @@ with open('config.json') as config_json:
   config = json.load(config_json)
   users = config['users']
   db_path = config['db_path']
+  db_backend = config.get('db_backend', 'json')
+  persistence = config.get('persistence', {})
+  oplog = config.get('oplog', {})
+  sqlite = config.get('sqlite', {})
+  tiering = config.get('tiering', {})
+  storage_threads = config.get('storage_threads', 8)
+  sessions = config.get('sessions', {})
+  logins = config.get('logins', {})
+  fragments = config.get('fragments', {})
+  template_options = config.get('templates', {})
+  assets = config.get('assets', {})
+  compression = config.get('compression', {})
+  metrics_options = config.get('metrics', {})
+  profiling_options = config.get('profiling', {})
+  tracing_options = config.get('tracing', {})
 
 
 # --------------------------------------------------------------------------------
@@ -32,4 +47,7 @@ secret_key = config['secret_key']
 # Templates
 # --------------------------------------------------------------------------------
 
-templates = Jinja2Templates(directory="templates")
+templates = create_templates(
+  directory="templates",
+  bytecode_cache_dir=template_options.get('bytecode_cache_dir'),
+  auto_reload=template_options.get('auto_reload', True))
@@ -6,32 +6,132 @@ This module is the main module for the FastAPI app.
 # Imports
 # --------------------------------------------------------------------------------
 
-from app.utils.exceptions import UnauthorizedPageException
-from app.routers import api, login, reminders, root
-
+import logging
+import time
+
+from app import assets, compression, db_backend, db_path, logins, metrics_options, oplog, profiling_options, persistence, sqlite, storage_threads, templates, tiering, tracing_options
+from app.utils.assets import AssetFiles, build_assets, load_manifest
+from app.utils.auth import SessionRenewalMiddleware
+from app.utils.backends import JsonBackend, OpLogBackend
+from app.utils.compression import DEFAULT_CONTENT_TYPES, DEFAULT_MINIMUM_SIZE, CompressionMiddleware
+from app.utils.events import ChangeHub
+from app.utils.exceptions import TooManyRequestsException, UnauthorizedPageException
+from app.utils.metrics import MetricsMiddleware
+from app.utils.profiling import start_tracing
+from app.utils.sqlite_storage import SqliteEngine
+from app.utils.storage import SessionRevocations, StorageEngine
+from app.utils.templating import warm_templates
+from app.utils.tiered_storage import TieredEngine
+from app.utils.tracing import TracingMiddleware
+from app.routers import api, login, metrics, profiling, reminders, root
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
 from starlette.exceptions import HTTPException
 
 
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------------------------------------------------------------
+# Lifespan
+# --------------------------------------------------------------------------------
+
+def create_storage_engine() -> StorageEngine:
+  if db_backend == 'sqlite':
+    return SqliteEngine(db_path, **sqlite)
+  elif db_backend == 'tiered':
+    return TieredEngine(SqliteEngine(db_path, **sqlite), **tiering)
+  elif db_backend == 'oplog':
+    backend = OpLogBackend(db_path, **oplog)
+  else:
+    backend = JsonBackend(db_path, **persistence)
+  
+  return StorageEngine(backend)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  if assets.get('build_on_startup', True):
+    build_assets('static')
+  load_manifest('static')
+  warm_templates(templates)
+
+  # Tracing before the engine loads lets memory snapshots include the whole database
+  if profiling_options.get('enabled', False) and profiling_options.get('trace_memory_at_startup', False):
+    start_tracing()
+
+  app.state.storage_engine = create_storage_engine()
+  SessionRevocations(app.state.storage_engine).purge_expired(time.time())
+  app.state.storage_executor = None
+  if storage_threads:
+    app.state.storage_executor = ThreadPoolExecutor(storage_threads, thread_name_prefix='storage')
+  app.state.login_executor = ThreadPoolExecutor(logins.get('hash_threads', 2), thread_name_prefix='login')
+  app.state.change_hub = ChangeHub()
+  app.state.profile_session = None
+  
+  yield
+
+  if app.state.storage_executor:
+    app.state.storage_executor.shutdown()
+  app.state.login_executor.shutdown()
+  app.state.storage_engine.close()
+
+
 # --------------------------------------------------------------------------------
 # App Creation
 # --------------------------------------------------------------------------------
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(SessionRenewalMiddleware)
+
+if compression.get('enabled', True):
+  app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=compression.get('minimum_size', DEFAULT_MINIMUM_SIZE),
+    content_types=compression.get('content_types', DEFAULT_CONTENT_TYPES),
+    gzip_level=compression.get('gzip_level', 6),
+    brotli_quality=compression.get('brotli_quality', 4))
+
+if tracing_options.get('enabled', False):
+  app.add_middleware(
+    TracingMiddleware,
+    threshold=tracing_options.get('slow_request_seconds', 0.5),
+    sample_rate=tracing_options.get('sample_rate', 0.1),
+    max_spans=tracing_options.get('max_spans', 200))
+
+# Outermost, so request timings include compression and session renewal
+if metrics_options.get('enabled', False):
+  app.add_middleware(MetricsMiddleware)
+
 app.include_router(root.router)
 app.include_router(api.router)
 app.include_router(login.router)
 app.include_router(reminders.router)
 
+if metrics_options.get('enabled', False):
+  if not metrics_options.get('bearer_token'):
+    logger.warning(
+      "Metrics are enabled without a bearer_token, so anyone who can reach the app can read /metrics; "
+      "set metrics.bearer_token in config.json or keep /metrics off the public network")
+  app.include_router(metrics.router)
+
+if profiling_options.get('enabled', False):
+  app.include_router(profiling.router)
+
 
 # --------------------------------------------------------------------------------
 # Static Files
 # --------------------------------------------------------------------------------
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", AssetFiles(directory="static"), name="static")
 
 
 # --------------------------------------------------------------------------------
@@ -43,6 +143,12 @@ async def unauthorized_exception_handler(request: Request, exc: UnauthorizedPage
   return RedirectResponse('/login?unauthorized=True', status_code=302)
 
 
+@app.exception_handler(TooManyRequestsException)
+async def too_many_requests_exception_handler(request: Request, exc: TooManyRequestsException):
+  context = {'request': request, 'throttled': True}
+  return templates.TemplateResponse("pages/login.html", context, status_code=exc.status_code, headers=exc.headers)
+
+
 @app.exception_handler(404)
 async def page_not_found_exception_handler(request: Request, exc: HTTPException):
   if request.url.path.startswith('/api/'):
@@ -8,11 +8,14 @@ which provides a "backdoor" for reminder data management.
 # --------------------------------------------------------------------------------
 
 from app.utils.auth import get_storage_for_api
-from app.utils.storage import ReminderList, ReminderItem, ReminderStorage
+from app.utils.etags import etag_matches, make_etag, not_modified, set_etag
+from app.utils.storage import AsyncReminderStorage, ReminderList, ReminderItem, ReminderStorage
+from app.utils.tracing import TracedRoute
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Literal, Optional, Tuple, Union
 
 
 # --------------------------------------------------------------------------------
@@ -21,7 +24,8 @@ from typing import Dict, List, Optional
 
 router = APIRouter(
   prefix="/api",
-  tags=["API"]
+  tags=["API"],
+  route_class=TracedRoute
 )
 
 
@@ -41,6 +45,191 @@ class SelectedListId(BaseModel):
   list_id: Optional[int]
 
 
+class BatchOperation(BaseModel):
+  op: Literal[
+    'create_list', 'update_list_name', 'delete_list', 'select_list',
+    'add_item', 'update_item_description', 'strike_item', 'delete_item']
+  list_id: Optional[Union[int, str]] = None
+  item_id: Optional[Union[int, str]] = None
+  name: Optional[str] = None
+  description: Optional[str] = None
+
+
+class BatchResult(BaseModel):
+  op: str
+  reminder_list: Optional[ReminderList] = None
+  reminder_item: Optional[ReminderItem] = None
+
+
+class BatchResponse(BaseModel):
+  results: List[BatchResult]
+
+
+# What a batch operation created, as ('list', id) or ('item', id)
+CreatedId = Tuple[str, int]
+
+
+# --------------------------------------------------------------------------------
+# Pagination
+# --------------------------------------------------------------------------------
+
+next_cursor_header = 'X-Next-Cursor'
+max_page_size = 1000
+
+PageLimit = Query(None, ge=1, le=max_page_size, description="The maximum number of results to return")
+PageCursor = Query(None, description=f"The `{next_cursor_header}` header from the previous page")
+
+
+def _paginate(page: list, limit: Optional[int], response: Response) -> list:
+  # Pages are fetched with one extra row to tell whether another page follows.
+  if limit is not None and len(page) > limit:
+    page = page[:limit]
+    response.headers[next_cursor_header] = str(page[-1].id)
+
+  return page
+
+
+# --------------------------------------------------------------------------------
+# Streaming
+# --------------------------------------------------------------------------------
+
+ndjson_media_type = 'application/x-ndjson'
+ndjson_chunk_size = 100
+
+
+def _wants_ndjson(request: Request) -> bool:
+  return ndjson_media_type in request.headers.get('accept', '')
+
+
+async def _stream_ndjson(models: AsyncIterator[BaseModel]) -> AsyncIterator[str]:
+  # Lines are sent in small batches rather than one network write per model.
+  lines = []
+  async for model in models:
+    lines.append(model.model_dump_json())
+    if len(lines) >= ndjson_chunk_size:
+      yield '\n'.join(lines) + '\n'
+      lines = []
+
+  if lines:
+    yield '\n'.join(lines) + '\n'
+
+
+# --------------------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------------------
+
+def _create_new_lists(storage: ReminderStorage) -> None:
+  storage.delete_lists()
+
+  # Chores
+  chores_id = storage.create_list("Chores")
+  storage.set_selected_list(chores_id)
+  storage.add_item(chores_id, "Buy groceries")
+  storage.add_item(chores_id, "Mow the lawn")
+  storage.strike_item(storage.add_item(chores_id, "Walk the dog"))
+  storage.strike_item(storage.add_item(chores_id, "Wash the dishes"))
+  storage.add_item(chores_id, "Do laundry")
+
+  # Groceries
+  groceries_id = storage.create_list("Groceries")
+  storage.add_item(groceries_id, "Tomatoes")
+  storage.add_item(groceries_id, "Garlic")
+  storage.add_item(groceries_id, "Olive oil")
+  storage.add_item(groceries_id, "Spaghetti")
+  storage.add_item(groceries_id, "Parmesan cheese")
+  storage.add_item(groceries_id, "Garlic bread")
+
+  # Projects
+  projects_id = storage.create_list("Projects")
+  storage.strike_item(storage.add_item(projects_id, "Paint the fence"))
+  storage.add_item(projects_id, "Replace the toilet")
+  storage.add_item(projects_id, "Install new curtain rods")
+
+
+def _require(value, field: str):
+  if value is None:
+    raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, f"'{field}' is required")
+  return value
+
+
+def _resolve_id(value, field: str, created_ids: List[Optional[CreatedId]]) -> int:
+  # "$N" refers to the id created by operation N earlier in the same batch,
+  # which must be the kind of doc the field names
+  value = _require(value, field)
+  if isinstance(value, int):
+    return value
+  
+  index = value[1:]
+  created = None
+  if value.startswith('$') and index.isdigit() and int(index) < len(created_ids):
+    created = created_ids[int(index)]
+  if created is None:
+    raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, f"'{value}' is not an id created earlier in the batch")
+  
+  kind, created_id = created
+  if field != f'{kind}_id':
+    raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, f"'{value}' is a {kind}, not a valid {field}")
+  
+  return created_id
+
+
+def _apply_operation(
+  storage: ReminderStorage,
+  operation: BatchOperation,
+  created_ids: List[Optional[CreatedId]]
+) -> Tuple[BatchResult, Optional[CreatedId]]:
+  result = BatchResult(op=operation.op)
+  created_id = None
+
+  if operation.op == 'create_list':
+    list_id = storage.create_list(_require(operation.name, 'name'))
+    result.reminder_list = storage.get_list(list_id)
+    created_id = ('list', list_id)
+  elif operation.op == 'update_list_name':
+    list_id = _resolve_id(operation.list_id, 'list_id', created_ids)
+    storage.update_list_name(list_id, _require(operation.name, 'name'))
+    result.reminder_list = storage.get_list(list_id)
+  elif operation.op == 'delete_list':
+    storage.delete_list(_resolve_id(operation.list_id, 'list_id', created_ids))
+  elif operation.op == 'select_list':
+    list_id = operation.list_id
+    storage.set_selected_list(None if list_id is None else _resolve_id(list_id, 'list_id', created_ids))
+  elif operation.op == 'add_item':
+    list_id = _resolve_id(operation.list_id, 'list_id', created_ids)
+    item_id = storage.add_item(list_id, _require(operation.description, 'description'))
+    result.reminder_item = storage.get_item(item_id)
+    created_id = ('item', item_id)
+  elif operation.op == 'update_item_description':
+    item_id = _resolve_id(operation.item_id, 'item_id', created_ids)
+    storage.update_item_description(item_id, _require(operation.description, 'description'))
+    result.reminder_item = storage.get_item(item_id)
+  elif operation.op == 'strike_item':
+    item_id = _resolve_id(operation.item_id, 'item_id', created_ids)
+    storage.strike_item(item_id)
+    result.reminder_item = storage.get_item(item_id)
+  elif operation.op == 'delete_item':
+    storage.delete_item(_resolve_id(operation.item_id, 'item_id', created_ids))
+
+  return result, created_id
+
+
+def _apply_batch(storage: ReminderStorage, operations: List[BatchOperation]) -> List[BatchResult]:
+  results = []
+  created_ids = []
+
+  for index, operation in enumerate(operations):
+    try:
+      result, created_id = _apply_operation(storage, operation, created_ids)
+    except HTTPException as e:
+      detail = {'index': index, 'op': operation.op, 'detail': e.detail}
+      raise HTTPException(e.status_code, detail)
+    
+    results.append(result)
+    created_ids.append(created_id)
+
+  return results
+
+
 # --------------------------------------------------------------------------------
 # Routes for reminder lists
 # --------------------------------------------------------------------------------
@@ -48,14 +237,29 @@ class SelectedListId(BaseModel):
 @router.get(
   path="/reminders",
   summary="Get the user's reminder lists",
-  response_model=List[ReminderList]
+  response_model=List[ReminderList],
+  responses={304: {'description': "Not Modified"}}
 )
 async def get_reminders(
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  request: Request,
+  response: Response,
+  limit: Optional[int] = PageLimit,
+  cursor: Optional[int] = PageCursor,
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> list[ReminderList]:
-  """Gets the list of all reminder lists owned by the user."""
+  """
+  Gets the list of all reminder lists owned by the user.
+  With `limit`, returns one page and sets the `X-Next-Cursor` header if more lists follow.
+  Answers a matching `If-None-Match` with 304 Not Modified.
+  """
 
-  return storage.get_lists()
+  etag = make_etag(storage.owner, 'lists', await storage.get_lists_version())
+  if etag_matches(request, etag):
+    return not_modified(etag)
+
+  set_etag(response, etag)
+  page = await storage.get_lists(cursor, None if limit is None else limit + 1)
+  return _paginate(page, limit, response)
 
 
 @router.post(
@@ -65,12 +269,12 @@ async def get_reminders(
 )
 async def post_reminders(
   reminder_list: NewReminderListName,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> ReminderList:
   """Creates a new reminder list for the user."""
 
-  list_id = storage.create_list(reminder_list.name)
-  return storage.get_list(list_id)
+  list_id = await storage.create_list(reminder_list.name)
+  return await storage.get_list(list_id)
 
 
 @router.get(
@@ -80,11 +284,11 @@ async def post_reminders(
 )
 async def get_list_id(
   list_id: int,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> ReminderList:
   """Gets a reminder list by ID."""
 
-  return storage.get_list(list_id)
+  return await storage.get_list(list_id)
 
 
 @router.patch(
@@ -95,12 +299,12 @@ async def get_list_id(
 async def patch_list_id(
   list_id: int,
   reminder_list: NewReminderListName,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> ReminderList:
   """Updates a reminder list's name."""
   
-  storage.update_list_name(list_id, reminder_list.name)
-  return storage.get_list(list_id)
+  await storage.update_list_name(list_id, reminder_list.name)
+  return await storage.get_list(list_id)
 
 
 @router.delete(
@@ -110,11 +314,11 @@ async def patch_list_id(
 )
 async def delete_list_id(
   list_id: int,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> Dict:
   """Deletes a reminder list by ID."""
 
-  storage.delete_list(list_id)
+  await storage.delete_list(list_id)
   return dict()
 
 
@@ -125,15 +329,40 @@ async def delete_list_id(
 @router.get(
   path="/reminders/{list_id}/items",
   summary="Get all reminder items for a list",
-  response_model=List[ReminderItem]
+  response_model=List[ReminderItem],
+  responses={200: {'content': {ndjson_media_type: {}}}, 304: {'description': "Not Modified"}}
 )
 async def get_list_id_items(
   list_id: int,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  request: Request,
+  response: Response,
+  limit: Optional[int] = PageLimit,
+  cursor: Optional[int] = PageCursor,
+  completed: Optional[bool] = Query(None, description="Only return items that are (or are not) completed"),
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> List[ReminderItem]:
-  """Gets all reminder items for a list."""
-
-  return storage.get_items(list_id)
+  """
+  Gets all reminder items for a list, optionally filtered by `completed`.
+  With `limit`, returns one page and sets the `X-Next-Cursor` header if more items follow.
+  Without `limit`, a request that accepts `application/x-ndjson` gets the items streamed one per line.
+  Answers a matching `If-None-Match` with 304 Not Modified.
+  """
+
+  stream = limit is None and _wants_ndjson(request)
+  etag = make_etag(storage.owner, 'items', list_id, stream, await storage.get_items_version(list_id))
+  if etag_matches(request, etag):
+    return not_modified(etag)
+
+  if stream:
+    await storage.get_list(list_id)
+    items = storage.iter_items(list_id, completed)
+    streamed = StreamingResponse(_stream_ndjson(items), media_type=ndjson_media_type)
+    set_etag(streamed, etag)
+    return streamed
+
+  set_etag(response, etag)
+  page = await storage.get_items(list_id, cursor, None if limit is None else limit + 1, completed)
+  return _paginate(page, limit, response)
 
 
 @router.post(
@@ -144,12 +373,12 @@ async def get_list_id_items(
 async def post_reminders_list_id_items(
   list_id: int,
   reminder_item: NewReminderItem,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> ReminderItem:
   """Adds a new item to a reminder list."""
 
-  item_id = storage.add_item(list_id, reminder_item.description)
-  return storage.get_item(item_id)
+  item_id = await storage.add_item(list_id, reminder_item.description)
+  return await storage.get_item(item_id)
 
 
 @router.get(
@@ -159,11 +388,11 @@ async def post_reminders_list_id_items(
 )
 async def get_items_item_id(
   item_id: int,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> ReminderItem:
   """Gets a reminder item by ID."""
 
-  return storage.get_item(item_id)
+  return await storage.get_item(item_id)
 
 
 @router.patch(
@@ -174,12 +403,12 @@ async def get_items_item_id(
 async def patch_items_item_id(
   item_id: int,
   reminder_item: NewReminderItem,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> ReminderItem:
   """Updates a reminder item's description."""
   
-  storage.update_item_description(item_id, reminder_item.description)
-  return storage.get_item(item_id)
+  await storage.update_item_description(item_id, reminder_item.description)
+  return await storage.get_item(item_id)
 
 
 @router.patch(
@@ -189,12 +418,12 @@ async def patch_items_item_id(
 )
 async def patch_items_strike_item_id(
   item_id: int,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> ReminderItem:
   """Toggles the completed status of a reminder item."""
   
-  storage.strike_item(item_id)
-  return storage.get_item(item_id)
+  await storage.strike_item(item_id)
+  return await storage.get_item(item_id)
 
 
 @router.delete(
@@ -204,11 +433,11 @@ async def patch_items_strike_item_id(
 )
 async def delete_items_item_id(
   item_id: int,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> Dict:
   """Deletes a reminder item by ID."""
 
-  storage.delete_item(item_id)
+  await storage.delete_item(item_id)
   return dict()
 
 
@@ -222,11 +451,11 @@ async def delete_items_item_id(
   response_model=SelectedListId
 )
 async def get_selected(
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> SelectedListId:
   """Gets the selected reminder list."""
 
-  list_id = storage.get_selected_list_id()
+  list_id = await storage.get_selected_list_id()
   return SelectedListId(list_id=list_id)
 
 
@@ -237,11 +466,11 @@ async def get_selected(
 )
 async def post_select_list_id(
   list_id: int,
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> Dict:
   """Selects a reminder list."""
 
-  storage.set_selected_list(list_id)
+  await storage.set_selected_list(list_id)
   return {}
 
 
@@ -251,11 +480,11 @@ async def post_select_list_id(
   response_model=Dict
 )
 async def post_unselect(
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> Dict:
   """Unselects any reminder list."""
 
-  storage.set_selected_list(None)
+  await storage.set_selected_list(None)
   return {}
 
 
@@ -269,11 +498,11 @@ async def post_unselect(
   response_model=Dict
 )
 async def delete_delete_lists(
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> Dict:
   """Deletes all the user's reminder lists."""
 
-  storage.delete_lists()
+  await storage.delete_lists()
   return {}
 
 
@@ -283,34 +512,34 @@ async def delete_delete_lists(
   response_model=Dict
 )
 async def post_create_new_lists(
-  storage: ReminderStorage = Depends(get_storage_for_api)
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
 ) -> Dict:
   """Creates an entirely new set of reminders after deleting old reminders."""
 
-  storage.delete_lists()
-
-  # Chores
-  chores_id = storage.create_list("Chores")
-  storage.set_selected_list(chores_id)
-  storage.add_item(chores_id, "Buy groceries")
-  storage.add_item(chores_id, "Mow the lawn")
-  storage.strike_item(storage.add_item(chores_id, "Walk the dog"))
-  storage.strike_item(storage.add_item(chores_id, "Wash the dishes"))
-  storage.add_item(chores_id, "Do laundry")
+  await storage.run_transaction(_create_new_lists)
+  return {}
 
-  # Groceries
-  groceries_id = storage.create_list("Groceries")
-  storage.add_item(groceries_id, "Tomatoes")
-  storage.add_item(groceries_id, "Garlic")
-  storage.add_item(groceries_id, "Olive oil")
-  storage.add_item(groceries_id, "Spaghetti")
-  storage.add_item(groceries_id, "Parmesan cheese")
-  storage.add_item(groceries_id, "Garlic bread")
 
-  # Projects
-  projects_id = storage.create_list("Projects")
-  storage.strike_item(storage.add_item(projects_id, "Paint the fence"))
-  storage.add_item(projects_id, "Replace the toilet")
-  storage.add_item(projects_id, "Install new curtain rods")
+# --------------------------------------------------------------------------------
+# Routes for batch operations
+# --------------------------------------------------------------------------------
 
-  return {}
+@router.post(
+  path="/batch",
+  summary="Apply several reminder operations at once",
+  response_model=BatchResponse
+)
+async def post_batch(
+  operations: List[BatchOperation],
+  storage: AsyncReminderStorage = Depends(get_storage_for_api)
+) -> BatchResponse:
+  """Applies an ordered array of reminder operations in one transaction.
+  
+  An operation may refer to a list or item created earlier in the same batch as `"$N"`,
+  where `N` is that operation's index; a list's `"$N"` only fits `list_id` and an item's only `item_id`.
+  If any operation fails, none of them take effect,
+  and the error detail gives the index of the failing operation.
+  """
+
+  results = await storage.run_transaction(lambda sync_storage: _apply_batch(sync_storage, operations))
+  return BatchResponse(results=results)
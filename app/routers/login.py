@@ -7,8 +7,9 @@ This module provides routes for authentication.
 # --------------------------------------------------------------------------------
 
 from app import templates
-from app.utils.auth import AuthCookie, get_login_form_creds, get_auth_cookie
+from app.utils.auth import AuthCookie, get_login_form_creds, get_auth_cookie, revoke_session
 from app.utils.exceptions import UnauthorizedPageException
+from app.utils.tracing import TracedRoute
 
 from fastapi import APIRouter, Depends, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
@@ -19,7 +20,7 @@ from typing import Optional
 # Router
 # --------------------------------------------------------------------------------
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 # --------------------------------------------------------------------------------
@@ -64,10 +65,11 @@ logout = dict(
 )
 @router.get(**logout)
 @router.post(**logout)
-async def post_login(cookie: Optional[AuthCookie] = Depends(get_auth_cookie)) -> dict:
+async def post_login(request: Request, cookie: Optional[AuthCookie] = Depends(get_auth_cookie)) -> dict:
   if not cookie:
     raise UnauthorizedPageException()
   
+  await revoke_session(request, cookie)
   response = RedirectResponse('/login?logged_out=True', status_code=302)
   response.set_cookie(key=cookie.name, value=cookie.token, expires=-1)
   return response
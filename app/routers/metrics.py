@@ -0,0 +1,54 @@
+"""
+This module provides the Prometheus metrics route.
+It is only included when `metrics.enabled` is set in `config.json`.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import secrets
+
+from app import metrics_options
+from app.utils.exceptions import UnauthorizedException
+from app.utils.metrics import content_type, render_metrics
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import PlainTextResponse
+
+
+# --------------------------------------------------------------------------------
+# Router
+# --------------------------------------------------------------------------------
+
+router = APIRouter()
+
+bearer_token = metrics_options.get('bearer_token')
+
+
+# --------------------------------------------------------------------------------
+# Authorization
+# --------------------------------------------------------------------------------
+
+def verify_scraper(request: Request) -> None:
+  if not bearer_token:
+    return
+
+  authorization = request.headers.get('authorization', '')
+  if not secrets.compare_digest(authorization.encode(), f'Bearer {bearer_token}'.encode()):
+    raise UnauthorizedException()
+
+
+# --------------------------------------------------------------------------------
+# Routes
+# --------------------------------------------------------------------------------
+
+@router.get(
+  path="/metrics",
+  summary="Gets request, template, auth, and storage metrics in the Prometheus text format",
+  tags=["Metrics"],
+  response_class=PlainTextResponse,
+  dependencies=[Depends(verify_scraper)]
+)
+async def get_metrics():
+  return PlainTextResponse(render_metrics(), media_type=content_type)
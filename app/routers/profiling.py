@@ -0,0 +1,158 @@
+"""
+This module provides admin-only routes for profiling a live worker.
+It is only included when `profiling.enabled` is set in `config.json`.
+Each worker process profiles itself, so requests reach whichever worker serves them.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import os
+import time
+
+from app import profiling_options
+from app.utils.auth import get_username_for_api
+from app.utils.exceptions import ConflictException, ForbiddenException
+from app.utils.profiling import (
+  ProfileSession, dump_snapshot, dump_stacks, start_tracing, stop_tracing,
+  summarize_snapshot, take_app_snapshot, tracing_status)
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import PlainTextResponse
+from typing import Literal
+
+
+# --------------------------------------------------------------------------------
+# Router
+# --------------------------------------------------------------------------------
+
+router = APIRouter(prefix="/admin/profiling")
+
+admins = frozenset(profiling_options.get('admins', []))
+max_seconds = profiling_options.get('max_seconds', 60)
+sample_interval = profiling_options.get('sample_interval', 0.005)
+
+
+# --------------------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------------------
+
+def get_admin(username: str = Depends(get_username_for_api)) -> str:
+  if username not in admins:
+    raise ForbiddenException()
+
+  return username
+
+
+def _download(content: bytes, name: str, extension: str) -> Response:
+  filename = f"{name}-{os.getpid()}-{int(time.time())}.{extension}"
+  headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+  return Response(content, media_type='application/octet-stream', headers=headers)
+
+
+# --------------------------------------------------------------------------------
+# Routes for CPU profiles
+# --------------------------------------------------------------------------------
+
+@router.post(
+  path="/cpu",
+  summary="Profiles this worker for some seconds, then downloads the profile",
+  description=(
+    "`collapsed` samples every thread's stack and writes flamegraph-collapsed stacks. "
+    "`pstats` runs cProfile on the event loop thread and writes a file for `pstats.Stats`."),
+  tags=["Profiling"],
+  dependencies=[Depends(get_admin)]
+)
+async def post_cpu_profile(
+  request: Request,
+  seconds: float = Query(10.0, gt=0),
+  output: Literal['collapsed', 'pstats'] = 'collapsed'
+):
+  if getattr(request.app.state, 'profile_session', None):
+    raise ConflictException("A profile is already running")
+
+  session = ProfileSession(output, sample_interval)
+  request.app.state.profile_session = session
+  try:
+    content = await session.run(min(seconds, max_seconds))
+  finally:
+    request.app.state.profile_session = None
+
+  extension = 'pstats' if output == 'pstats' else 'collapsed.txt'
+  return _download(content, 'profile', extension)
+
+
+@router.post(
+  path="/cpu/stop",
+  summary="Stops the running profile early, so its download returns now",
+  tags=["Profiling"],
+  status_code=204,
+  dependencies=[Depends(get_admin)]
+)
+async def post_cpu_profile_stop(request: Request):
+  session = getattr(request.app.state, 'profile_session', None)
+  if session:
+    session.stop()
+
+
+# --------------------------------------------------------------------------------
+# Routes for stacks
+# --------------------------------------------------------------------------------
+
+@router.get(
+  path="/stacks",
+  summary="Dumps the stacks of every event loop task and thread",
+  tags=["Profiling"],
+  response_class=PlainTextResponse,
+  dependencies=[Depends(get_admin)]
+)
+async def get_stacks():
+  return PlainTextResponse(dump_stacks())
+
+
+# --------------------------------------------------------------------------------
+# Routes for memory
+# --------------------------------------------------------------------------------
+
+@router.post(
+  path="/memory/start",
+  summary="Starts tracing memory allocations",
+  tags=["Profiling"],
+  dependencies=[Depends(get_admin)]
+)
+async def post_memory_start(frames: int = Query(10, ge=1, le=100)):
+  start_tracing(frames)
+  return tracing_status()
+
+
+@router.post(
+  path="/memory/stop",
+  summary="Stops tracing memory allocations and frees the traces",
+  tags=["Profiling"],
+  dependencies=[Depends(get_admin)]
+)
+async def post_memory_stop():
+  stop_tracing()
+  return tracing_status()
+
+
+@router.get(
+  path="/memory/snapshot",
+  summary="Snapshots allocations made by app code, like the storage engine's documents and indexes",
+  description=(
+    "`text` lists the biggest allocation sites. "
+    "`pickle` downloads a file for `tracemalloc.Snapshot.load`."),
+  tags=["Profiling"],
+  dependencies=[Depends(get_admin)]
+)
+async def get_memory_snapshot(output: Literal['text', 'pickle'] = 'text'):
+  if not tracing_status()['tracing']:
+    raise ConflictException("Memory tracing is not running")
+
+  # Snapshots of a large heap take a while, so they run off the event loop
+  snapshot = await asyncio.to_thread(take_app_snapshot)
+  if output == 'pickle':
+    return _download(await asyncio.to_thread(dump_snapshot, snapshot), 'memory', 'tracemalloc')
+  return PlainTextResponse(await asyncio.to_thread(summarize_snapshot, snapshot))
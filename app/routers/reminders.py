@@ -6,28 +6,74 @@ This module provides routes for the reminders pages.
 # Imports
 # --------------------------------------------------------------------------------
 
-from app import templates
-from app.utils.auth import get_storage_for_page
-from app.utils.storage import ReminderStorage
+from app import fragments, templates
+from app.utils.auth import get_change_hub, get_storage_for_page, get_username_for_page
+from app.utils.cache import LruCache
+from app.utils.etags import etag_matches, make_etag, not_modified, set_etag
+from app.utils.events import ChangeHub
+from app.utils.exceptions import ForbiddenException, NotFoundException
+from app.utils.storage import AsyncReminderStorage
+from app.utils.templating import build_fingerprint
+from app.utils.tracing import TracedRoute
 
 from fastapi import APIRouter, Depends, Form, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
 
 
 # --------------------------------------------------------------------------------
 # Router
 # --------------------------------------------------------------------------------
 
-router = APIRouter(prefix="/reminders")
+router = APIRouter(prefix="/reminders", route_class=TracedRoute)
+
+# Idle event streams send a comment this often, so proxies keep them open
+event_keepalive_seconds = 15.0
+
+
+# --------------------------------------------------------------------------------
+# Fragment Cache
+# --------------------------------------------------------------------------------
+
+# Maps (build fingerprint, owner, template, entity id, storage version) to rendered HTML.
+# A mutation bumps the version and a template or asset change the fingerprint,
+# so stale fragments are simply never looked up again.
+fragment_cache: LruCache[Tuple, str] = LruCache(
+  max_size=fragments.get('cache_size', 5000),
+  max_weight=fragments.get('max_chars', 32 * 1024 * 1024))
+
+
+async def _render_cached(
+  key: Tuple,
+  template: str,
+  build_context: Callable[[], Awaitable[dict]]
+) -> str:
+  key = (build_fingerprint(templates),) + key
+  html = fragment_cache.get(key)
+
+  if html is None:
+    context = await build_context()
+    html = templates.get_template(template).render(context)
+    fragment_cache.put(key, html)
+  
+  return html
+
+
+async def _render_static(template: str) -> str:
+  return await _render_cached((template,), template, _empty_context)
+
+
+async def _empty_context() -> dict:
+  return {}
 
 
 # --------------------------------------------------------------------------------
 # Helpers
 # --------------------------------------------------------------------------------
 
-def _build_full_page_context(request: Request, storage: ReminderStorage):
-  reminder_lists = storage.get_lists()
-  selected_list = storage.get_selected_list()
+async def _build_full_page_context(request: Request, storage: AsyncReminderStorage):
+  reminder_lists = await storage.get_lists()
+  selected_list = await storage.get_selected_list()
 
   return {
     'request': request,
@@ -36,9 +82,64 @@ def _build_full_page_context(request: Request, storage: ReminderStorage):
     'selected_list': selected_list}
 
 
-def _get_reminders_grid(request: Request, storage: ReminderStorage):
-  context = _build_full_page_context(request, storage)
-  return templates.TemplateResponse("partials/reminders/content.html", context)
+async def _render_page(request: Request, storage: AsyncReminderStorage, template: str, version: str) -> str:
+  key = (storage.owner, template, version)
+  return await _render_cached(key, template, lambda: _build_full_page_context(request, storage))
+
+
+async def _render_list_row(
+  request: Request,
+  storage: AsyncReminderStorage,
+  list_id: int,
+  template: str = "partials/reminders/list-row.html",
+  oob: bool = False
+) -> str:
+  async def build_context():
+    reminder_list = await storage.get_list(list_id)
+    selected_list_id = await storage.get_selected_list_id()
+    return {'request': request, 'reminder_list': reminder_list, 'selected_list_id': selected_list_id, 'oob': oob}
+
+  version = await storage.get_list_version(list_id)
+  return await _render_cached((storage.owner, template, list_id, oob, version), template, build_context)
+
+
+async def _render_item_row(
+  request: Request,
+  storage: AsyncReminderStorage,
+  item_id: int,
+  template: str = "partials/reminders/item-row.html"
+) -> str:
+  async def build_context():
+    reminder_item = await storage.get_item(item_id)
+    return {'request': request, 'reminder_item': reminder_item}
+
+  version = await storage.get_item_version(item_id)
+  return await _render_cached((storage.owner, template, item_id, version), template, build_context)
+
+
+async def _render_selected_list(request: Request, storage: AsyncReminderStorage, oob: bool = False) -> str:
+  template = "partials/reminders/selected-list.html"
+
+  async def build_context():
+    selected_list = await storage.get_selected_list()
+    return {'request': request, 'selected_list': selected_list, 'oob': oob}
+
+  version = await storage.get_selected_list_version()
+  return await _render_cached((storage.owner, template, oob, version), template, build_context)
+
+
+async def _render_selection_rows(request: Request, storage: AsyncReminderStorage, *list_ids: Optional[int]) -> str:
+  # Out-of-band swaps for list rows whose "selected" highlight may have changed
+  rows = []
+  for list_id in dict.fromkeys(list_ids):
+    if list_id is None:
+      continue
+    try:
+      rows.append(await _render_list_row(request, storage, list_id, oob=True))
+    except (NotFoundException, ForbiddenException):
+      pass
+
+  return ''.join(rows)
 
 
 # --------------------------------------------------------------------------------
@@ -53,10 +154,68 @@ def _get_reminders_grid(request: Request, storage: ReminderStorage):
 )
 async def get_reminders(
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
+):
+  version = await storage.get_page_version()
+  etag = make_etag(storage.owner, 'page', build_fingerprint(templates), version)
+  if etag_matches(request, etag):
+    return not_modified(etag)
+
+  response = HTMLResponse(await _render_page(request, storage, "pages/reminders.html", version))
+  set_etag(response, etag)
+  return response
+
+
+@router.get(
+  path="/content",
+  summary="Partial: Gets the reminders grid",
+  tags=["HTMX Partials"],
+  response_class=HTMLResponse
+)
+async def get_reminders_content(
+  request: Request,
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
+):
+  version = await storage.get_page_version()
+  etag = make_etag(storage.owner, 'content', build_fingerprint(templates), version)
+  if etag_matches(request, etag):
+    return not_modified(etag)
+
+  response = HTMLResponse(await _render_page(request, storage, "partials/reminders/content.html", version))
+  set_etag(response, etag)
+  return response
+
+
+# --------------------------------------------------------------------------------
+# Routes for change events
+# --------------------------------------------------------------------------------
+
+async def _stream_events(hub: ChangeHub, owner: str, tab_id: Optional[str]) -> AsyncIterator[str]:
+  # Subscribing inside the generator ties the subscription's lifetime to the stream's
+  subscription = hub.subscribe(owner, tab_id)
+  try:
+    yield "retry: 5000\n\n"
+    while True:
+      if await subscription.wait(event_keepalive_seconds):
+        yield "event: change\ndata: \n\n"
+      else:
+        yield ": keepalive\n\n"
+  finally:
+    hub.unsubscribe(subscription)
+
+
+@router.get(
+  path="/events",
+  summary="Streams server-sent events when the user's reminders change",
+  tags=["Pages"]
+)
+async def get_reminders_events(
+  tab: Optional[str] = None,
+  username: str = Depends(get_username_for_page),
+  hub: ChangeHub = Depends(get_change_hub)
 ):
-  context = _build_full_page_context(request, storage)
-  return templates.TemplateResponse("pages/reminders.html", context)
+  headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+  return StreamingResponse(_stream_events(hub, username, tab), media_type='text/event-stream', headers=headers)
 
 
 # --------------------------------------------------------------------------------
@@ -72,12 +231,9 @@ async def get_reminders(
 async def get_reminders_list_row(
   list_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
-  reminder_list = storage.get_list(list_id)
-  selected_list = storage.get_selected_list()
-  context = {'request': request, 'reminder_list': reminder_list, 'selected_list': selected_list}
-  return templates.TemplateResponse("partials/reminders/list-row.html", context)
+  return HTMLResponse(await _render_list_row(request, storage, list_id, "partials/reminders/list-row.html"))
 
 
 @router.delete(
@@ -89,11 +245,19 @@ async def get_reminders_list_row(
 async def delete_reminders_list_row(
   list_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
-  storage.delete_list(list_id)
-  storage.reset_selected_after_delete(list_id)
-  return _get_reminders_grid(request, storage)
+  previous_id = await storage.get_selected_list_id()
+  await storage.delete_list(list_id)
+  await storage.reset_selected_after_delete(list_id)
+
+  # The deleted row is swapped out for nothing
+  if previous_id != list_id:
+    return HTMLResponse("")
+
+  selected_list_id = await storage.get_selected_list_id()
+  rows = await _render_selection_rows(request, storage, selected_list_id)
+  return HTMLResponse(rows + await _render_selected_list(request, storage, oob=True))
 
 
 @router.patch(
@@ -105,12 +269,16 @@ async def delete_reminders_list_row(
 async def patch_reminders_list_row_name(
   list_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page),
+  storage: AsyncReminderStorage = Depends(get_storage_for_page),
   new_name: str = Form()
 ):
-  storage.update_list_name(list_id, new_name)
-  storage.set_selected_list(list_id)
-  return _get_reminders_grid(request, storage)
+  previous_id = await storage.get_selected_list_id()
+  await storage.update_list_name(list_id, new_name)
+  await storage.set_selected_list(list_id)
+
+  row = await _render_list_row(request, storage, list_id)
+  rows = await _render_selection_rows(request, storage, *({previous_id} - {list_id}))
+  return HTMLResponse(row + rows + await _render_selected_list(request, storage, oob=True))
 
 
 @router.get(
@@ -122,12 +290,9 @@ async def patch_reminders_list_row_name(
 async def get_reminders_list_row_edit(
   list_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
-  reminder_list = storage.get_list(list_id)
-  selected_list = storage.get_selected_list()
-  context = {'request': request, 'reminder_list': reminder_list, 'selected_list': selected_list}
-  return templates.TemplateResponse("partials/reminders/list-row-edit.html", context)
+  return HTMLResponse(await _render_list_row(request, storage, list_id, "partials/reminders/list-row-edit.html"))
 
 
 @router.get(
@@ -138,7 +303,7 @@ async def get_reminders_list_row_edit(
 )
 async def get_reminders_new_list_row(
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
   context = {'request': request}
   return templates.TemplateResponse("partials/reminders/new-list-row.html", context)
@@ -152,12 +317,17 @@ async def get_reminders_new_list_row(
 )
 async def post_reminders_new_list_row(
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page),
+  storage: AsyncReminderStorage = Depends(get_storage_for_page),
   reminder_list_name: str = Form()
 ):
-  list_id = storage.create_list(reminder_list_name)
-  storage.set_selected_list(list_id)
-  return _get_reminders_grid(request, storage)
+  previous_id = await storage.get_selected_list_id()
+  list_id = await storage.create_list(reminder_list_name)
+  await storage.set_selected_list(list_id)
+
+  row = await _render_list_row(request, storage, list_id)
+  new_row = await _render_static("partials/reminders/new-list-row.html")
+  rows = await _render_selection_rows(request, storage, previous_id)
+  return HTMLResponse(row + new_row + rows + await _render_selected_list(request, storage, oob=True))
 
 
 @router.get(
@@ -168,7 +338,7 @@ async def post_reminders_new_list_row(
 )
 async def get_reminders_new_list_row_edit(
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
   context = {'request': request}
   return templates.TemplateResponse("partials/reminders/new-list-row-edit.html", context)
@@ -183,10 +353,13 @@ async def get_reminders_new_list_row_edit(
 async def post_reminders_select(
   list_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
-  storage.set_selected_list(list_id)
-  return _get_reminders_grid(request, storage)
+  previous_id = await storage.get_selected_list_id()
+  await storage.set_selected_list(list_id)
+
+  selected_list = await _render_selected_list(request, storage)
+  return HTMLResponse(selected_list + await _render_selection_rows(request, storage, previous_id, list_id))
 
 
 # --------------------------------------------------------------------------------
@@ -202,11 +375,9 @@ async def post_reminders_select(
 async def get_reminders_item_row(
   item_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
-  reminder_item = storage.get_item(item_id)
-  context = {'request': request, 'reminder_item': reminder_item}
-  return templates.TemplateResponse("partials/reminders/item-row.html", context)
+  return HTMLResponse(await _render_item_row(request, storage, item_id, "partials/reminders/item-row.html"))
 
 
 @router.delete(
@@ -217,9 +388,9 @@ async def get_reminders_item_row(
 )
 async def delete_reminders_item_row(
   item_id: int,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
-  storage.delete_item(item_id)
+  await storage.delete_item(item_id)
   return ""
 
 
@@ -232,13 +403,11 @@ async def delete_reminders_item_row(
 async def patch_reminders_item_row_description(
   item_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page),
+  storage: AsyncReminderStorage = Depends(get_storage_for_page),
   new_description: str = Form()
 ):
-  storage.update_item_description(item_id, new_description)
-  reminder_item = storage.get_item(item_id)
-  context = {'request': request, 'reminder_item': reminder_item}
-  return templates.TemplateResponse("partials/reminders/item-row.html", context)
+  await storage.update_item_description(item_id, new_description)
+  return HTMLResponse(await _render_item_row(request, storage, item_id, "partials/reminders/item-row.html"))
 
 
 @router.patch(
@@ -250,12 +419,10 @@ async def patch_reminders_item_row_description(
 async def patch_reminders_item_row_strike(
   item_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
-  storage.strike_item(item_id)
-  reminder_item = storage.get_item(item_id)
-  context = {'request': request, 'reminder_item': reminder_item}
-  return templates.TemplateResponse("partials/reminders/item-row.html", context)
+  await storage.strike_item(item_id)
+  return HTMLResponse(await _render_item_row(request, storage, item_id, "partials/reminders/item-row.html"))
 
 
 @router.get(
@@ -267,11 +434,9 @@ async def patch_reminders_item_row_strike(
 async def get_reminders_item_row_edit(
   item_id: int,
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
-  reminder_item = storage.get_item(item_id)
-  context = {'request': request, 'reminder_item': reminder_item}
-  return templates.TemplateResponse("partials/reminders/item-row-edit.html", context)
+  return HTMLResponse(await _render_item_row(request, storage, item_id, "partials/reminders/item-row-edit.html"))
 
 
 @router.get(
@@ -282,7 +447,7 @@ async def get_reminders_item_row_edit(
 )
 async def get_reminders_new_item_row(
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
   context = {'request': request}
   return templates.TemplateResponse("partials/reminders/new-item-row.html", context)
@@ -296,12 +461,14 @@ async def get_reminders_new_item_row(
 )
 async def post_reminders_new_item_row(
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page),
+  storage: AsyncReminderStorage = Depends(get_storage_for_page),
   reminder_item_name: str = Form()
 ):
-  selected_list = storage.get_selected_list()
-  storage.add_item(selected_list.id, reminder_item_name)
-  return _get_reminders_grid(request, storage)
+  selected_list_id = await storage.get_selected_list_id()
+  item_id = await storage.add_item(selected_list_id, reminder_item_name)
+
+  row = await _render_item_row(request, storage, item_id)
+  return HTMLResponse(row + await _render_static("partials/reminders/new-item-row.html"))
 
 
 @router.get(
@@ -312,7 +479,7 @@ async def post_reminders_new_item_row(
 )
 async def get_reminders_new_item_row_edit(
   request: Request,
-  storage: ReminderStorage = Depends(get_storage_for_page)
+  storage: AsyncReminderStorage = Depends(get_storage_for_page)
 ):
   context = {'request': request}
   return templates.TemplateResponse("partials/reminders/new-item-row-edit.html", context)
@@ -8,6 +8,7 @@ This module provides routes for authentication.
 
 from app import templates
 from app.utils.auth import AuthCookie, get_auth_cookie
+from app.utils.tracing import TracedRoute
 
 from fastapi import APIRouter, Depends, Request
 from fastapi.responses import FileResponse, RedirectResponse
@@ -18,7 +19,7 @@ from typing import Optional
 # Router
 # --------------------------------------------------------------------------------
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 # --------------------------------------------------------------------------------
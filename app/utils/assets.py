@@ -0,0 +1,247 @@
+"""
+This module builds and serves fingerprinted static assets.
+
+The build copies every file under `static/` into `static/dist/`
+with a content hash in its name (like `css/shared.3f9a1c2b7d40.css`)
+and precompresses text assets with gzip and, when installed, brotli.
+Hashed URLs never change content, so browsers may cache them forever.
+Run this module to build the assets ahead of time:
+
+  python -m app.utils.assets
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+import tempfile
+
+import anyio
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+
+from typing import Dict, FrozenSet, Optional, Tuple
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+
+# --------------------------------------------------------------------------------
+# Parameters
+# --------------------------------------------------------------------------------
+
+STATIC_URL = '/static'
+DIST_DIRNAME = 'dist'
+MANIFEST_FILENAME = 'manifest.json'
+HASH_BYTES = 6
+
+# Only text-like assets shrink enough to be worth a compressed copy
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.ttf', '.ico', '.json', '.txt')
+
+# A compressed copy is kept only if it saves at least this fraction of the original
+MIN_COMPRESSION_SAVINGS = 0.1
+
+# Preferred encodings first, as (Content-Encoding, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+immutable_cache_control = "public, max-age=31536000, immutable"
+
+_CSS_URL = re.compile(r'url\(\s*(["\']?)(/static/[^"\')]+)\1\s*\)')
+
+
+# --------------------------------------------------------------------------------
+# Manifest
+# --------------------------------------------------------------------------------
+
+# Maps each source path (like 'css/shared.css') to its fingerprinted path under dist/
+manifest: Dict[str, str] = {}
+
+
+def static_url(path: str) -> str:
+  """Returns the fingerprinted URL for a static asset, or its plain URL if it was not built."""
+
+  return f"{STATIC_URL}/{manifest.get(path, path)}"
+
+
+def load_manifest(static_dir: str) -> None:
+  manifest_path = os.path.join(static_dir, DIST_DIRNAME, MANIFEST_FILENAME)
+  try:
+    with open(manifest_path) as manifest_file:
+      entries = json.load(manifest_file)
+  except FileNotFoundError:
+    entries = {}
+
+  manifest.clear()
+  manifest.update(entries)
+
+
+# --------------------------------------------------------------------------------
+# Build
+# --------------------------------------------------------------------------------
+
+def _fingerprint(path: str, content: bytes) -> str:
+  digest = hashlib.blake2b(content, digest_size=HASH_BYTES).hexdigest()
+  stem, extension = posixpath.splitext(path)
+  return f"{DIST_DIRNAME}/{stem}.{digest}{extension}"
+
+
+def _write_atomically(path: str, content: bytes) -> None:
+  # Workers may build at the same time, so readers must never see a partial file
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+  with os.fdopen(fd, 'wb') as temp_file:
+    temp_file.write(content)
+  os.replace(temp_path, path)
+
+
+def _compress(content: bytes) -> Dict[str, bytes]:
+  variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+  if brotli:
+    variants['.br'] = brotli.compress(content, quality=11)
+  return variants
+
+
+def _rewrite_css_urls(content: bytes, paths: Dict[str, str]) -> bytes:
+  def replace(match: re.Match) -> str:
+    quote, url = match.groups()
+    source = url[len(STATIC_URL) + 1:]
+    return f"url({quote}{STATIC_URL}/{paths.get(source, source)}{quote})"
+
+  return _CSS_URL.sub(replace, content.decode()).encode()
+
+
+def build_assets(static_dir: str) -> Dict[str, str]:
+  """
+  Fingerprints and precompresses every asset, then writes and returns the manifest.
+  Output files are named by their content, so rebuilding skips files that already exist.
+  """
+
+  sources = []
+  for root, dirs, files in os.walk(static_dir):
+    if os.path.abspath(root) == os.path.abspath(static_dir):
+      dirs[:] = [name for name in dirs if name != DIST_DIRNAME]
+    for name in files:
+      relative = os.path.relpath(os.path.join(root, name), static_dir)
+      sources.append(relative.replace(os.sep, '/'))
+
+  # Stylesheets refer to other assets by URL, so they are hashed after rewriting those URLs
+  sources.sort(key=lambda path: (path.endswith('.css'), path))
+  paths: Dict[str, str] = {}
+
+  for source in sources:
+    with open(os.path.join(static_dir, source), 'rb') as source_file:
+      content = source_file.read()
+    if source.endswith('.css'):
+      content = _rewrite_css_urls(content, paths)
+
+    target = _fingerprint(source, content)
+    paths[source] = target
+    target_path = os.path.join(static_dir, target)
+    if os.path.exists(target_path):
+      continue
+
+    if source.endswith(COMPRESSIBLE_EXTENSIONS):
+      for suffix, compressed in _compress(content).items():
+        if len(compressed) <= len(content) * (1 - MIN_COMPRESSION_SAVINGS):
+          _write_atomically(target_path + suffix, compressed)
+
+    # The plain file is written last, since its existence marks the asset as built
+    _write_atomically(target_path, content)
+
+  manifest_path = os.path.join(static_dir, DIST_DIRNAME, MANIFEST_FILENAME)
+  _write_atomically(manifest_path, json.dumps(paths, indent=2, sort_keys=True).encode())
+  return paths
+
+
+# --------------------------------------------------------------------------------
+# AssetFiles Class
+# --------------------------------------------------------------------------------
+
+def _accepted_encodings(accept_encoding: str) -> FrozenSet[str]:
+  accepted = set()
+  for entry in accept_encoding.split(','):
+    coding, _, params = entry.partition(';')
+    params = params.strip()
+    try:
+      quality = float(params[2:]) if params.startswith('q=') else 1.0
+    except ValueError:
+      quality = 1.0
+    if quality > 0:
+      accepted.add(coding.strip().lower())
+  return frozenset(accepted)
+
+
+class AssetFiles(StaticFiles):
+  """
+  Serves static files like `StaticFiles`, plus fingerprinted files under `dist/`
+  with immutable caching and their precompressed variant when the client accepts it.
+  """
+
+  def _find_variant(self, path: str, scope: Scope) -> Tuple[str, Optional[os.stat_result], Optional[str]]:
+    accepted = _accepted_encodings(Headers(scope=scope).get('accept-encoding', ''))
+    for encoding, suffix in ENCODINGS:
+      if encoding in accepted:
+        full_path, stat_result = self.lookup_path(path + suffix)
+        if stat_result and stat.S_ISREG(stat_result.st_mode):
+          return full_path, stat_result, encoding
+
+    full_path, stat_result = self.lookup_path(path)
+    return full_path, stat_result, None
+
+
+  async def get_response(self, path: str, scope: Scope) -> Response:
+    is_fingerprinted = path.startswith(DIST_DIRNAME + os.sep) and path != os.path.join(DIST_DIRNAME, MANIFEST_FILENAME)
+    if not is_fingerprinted or scope['method'] not in ('GET', 'HEAD'):
+      return await super().get_response(path, scope)
+
+    full_path, stat_result, encoding = await anyio.to_thread.run_sync(self._find_variant, path, scope)
+    if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+      return await super().get_response(path, scope)
+
+    headers = {'Cache-Control': immutable_cache_control, 'Vary': 'Accept-Encoding'}
+    if encoding:
+      headers['Content-Encoding'] = encoding
+
+    media_type, _ = mimetypes.guess_type(path)
+    response = FileResponse(
+      full_path,
+      stat_result=stat_result,
+      method=scope['method'],
+      media_type=media_type,
+      headers=headers)
+
+    if self.is_not_modified(response.headers, Headers(scope=scope)):
+      return NotModifiedResponse(response.headers)
+    return response
+
+
+# --------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Fingerprint and precompress the static assets.")
+  parser.add_argument('static_dir', nargs='?', default='static')
+  args = parser.parse_args()
+
+  paths = build_assets(args.static_dir)
+  print(f"Built {len(paths)} assets into {os.path.join(args.static_dir, DIST_DIRNAME)}")
+
+
+if __name__ == '__main__':
+  main()
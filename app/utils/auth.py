@@ -6,17 +6,29 @@ This module provides security and authentication.
 # Imports
 # --------------------------------------------------------------------------------
 
+import asyncio
+import functools
 import jwt
 import secrets
+import time
 
-from app import db_path, users, secret_key
-from app.utils.exceptions import UnauthorizedException, UnauthorizedPageException
-from app.utils.storage import ReminderStorage
+from app import logins, sessions, users, secret_key
+from app.utils.cache import LruCache
+from app.utils.events import ChangeHub
+from app.utils.exceptions import TooManyRequestsException, UnauthorizedException, UnauthorizedPageException
+from app.utils.limits import TokenBucketLimiter
+from app.utils.metrics import jwt_decode_duration, timed
+from app.utils.passwords import PasswordHash, hash_password, is_password_hash, parse_password_hash, verify_password
+from app.utils.storage import AsyncReminderStorage, ReminderStorage, SessionRevocations, StorageEngine
+from app.utils.tracing import traced
 
-from fastapi import Cookie, Depends, Form
+from concurrent.futures import Executor
+from fastapi import Cookie, Depends, Form, Request
 from fastapi.security import HTTPBasic
 from pydantic import BaseModel
-from typing import Optional
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, Optional
 
 
 # --------------------------------------------------------------------------------
@@ -25,6 +37,31 @@ from typing import Optional
 
 basic_auth = HTTPBasic(auto_error=False)
 auth_cookie_name = "reminders_session"
+renewed_cookie_key = "renewed_auth_cookie"
+
+token_lifetime = sessions.get('token_lifetime', 604800)
+token_renew_after = sessions.get('token_renew_after', 3600)
+
+
+# --------------------------------------------------------------------------------
+# Credentials
+# --------------------------------------------------------------------------------
+
+def _load_credentials(configured: Dict[str, str]) -> Dict[str, PasswordHash]:
+  # Plaintext passwords from older configs are hashed once here rather than on every login
+  return {
+    username: parse_password_hash(value if is_password_hash(value) else hash_password(value))
+    for username, value in configured.items()}
+
+
+credentials = _load_credentials(users)
+
+# Unknown usernames are checked against this hash,
+# so a failed login takes as long whether or not the user exists
+_unknown_user_hash = parse_password_hash(hash_password(secrets.token_urlsafe()))
+
+login_limits_by_ip = TokenBucketLimiter(**logins.get('per_ip', {'rate': 5.0, 'burst': 50}))
+login_limits_by_username = TokenBucketLimiter(**logins.get('per_username', {'rate': 1.0, 'burst': 10}))
 
 
 # --------------------------------------------------------------------------------
@@ -35,56 +72,180 @@ class AuthCookie(BaseModel):
   name: str
   token: str
   username: str
+  session_id: str
+  issued_at: int
+  expires_at: int
+
+
+# --------------------------------------------------------------------------------
+# Session Cache
+# --------------------------------------------------------------------------------
+
+# Maps session tokens to their verified cookies,
+# so chatty HTMX requests skip the JWT signature check.
+session_cache: LruCache[str, AuthCookie] = LruCache(
+  max_size=sessions.get('cache_size', 10000),
+  ttl=sessions.get('cache_ttl', 300))
+
+
+def forget_session(token: str) -> None:
+  session_cache.pop(token)
 
 
 # --------------------------------------------------------------------------------
 # Serializers
 # --------------------------------------------------------------------------------
 
-def serialize_token(username: str) -> str:
-  return jwt.encode({"username": username}, secret_key, algorithm="HS256")
+def serialize_token(username: str, session_id: Optional[str] = None, now: Optional[float] = None) -> str:
+  issued_at = int(time.time() if now is None else now)
+  claims = {
+    "username": username,
+    "sid": session_id or secrets.token_urlsafe(16),
+    "iat": issued_at,
+    "exp": issued_at + token_lifetime,
+  }
+  return jwt.encode(claims, secret_key, algorithm="HS256")
 
 
-def deserialize_token(token: str) -> str:
+@timed(jwt_decode_duration)
+def deserialize_claims(token: str) -> Optional[dict]:
   try:
-    data = jwt.decode(token, secret_key, algorithms=["HS256"])
-    return data['username']
-  except:
+    return jwt.decode(token, secret_key, algorithms=["HS256"], options={"require": ["sid", "iat", "exp"]})
+  except jwt.InvalidTokenError:
+    return None
+
+
+def deserialize_token(token: str) -> Optional[str]:
+  claims = deserialize_claims(token)
+  return claims.get('username') if claims else None
+
+
+def build_auth_cookie(token: str) -> Optional[AuthCookie]:
+  claims = deserialize_claims(token)
+  if not claims or not isinstance(claims.get('username'), str):
     return None
 
+  return AuthCookie(
+    name=auth_cookie_name,
+    token=token,
+    username=claims['username'],
+    session_id=claims['sid'],
+    issued_at=claims['iat'],
+    expires_at=claims['exp'])
+
+
+# --------------------------------------------------------------------------------
+# Session Renewal
+# --------------------------------------------------------------------------------
+
+class SessionRenewalMiddleware:
+  """
+  Sets the session cookie to a freshly issued token
+  whenever `get_auth_cookie` renewed the request's token.
+  Written as plain ASGI middleware so streamed responses pass straight through.
+  """
+
+  def __init__(self, app: ASGIApp) -> None:
+    self.app = app
+
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+    
+    state = scope.setdefault('state', {})
+
+    async def send_with_cookie(message: Message) -> None:
+      renewed = state.get(renewed_cookie_key)
+      if message['type'] == 'http.response.start' and renewed:
+        headers = MutableHeaders(scope=message)
+        headers.append('set-cookie', f'{renewed.name}={renewed.token}; Path=/; SameSite=lax')
+      await send(message)
+
+    await self.app(scope, receive, send_with_cookie)
+
+
+def renew_auth_cookie(request: Request, cookie: AuthCookie) -> AuthCookie:
+  renewed = build_auth_cookie(serialize_token(cookie.username, cookie.session_id))
+  session_cache.put(renewed.token, renewed)
+  setattr(request.state, renewed_cookie_key, renewed)
+  return renewed
+
 
 # --------------------------------------------------------------------------------
 # Authentication Checkers
 # --------------------------------------------------------------------------------
 
-def get_login_form_creds(username: str = Form(), password: str = Form()) -> Optional[AuthCookie]:
-  cookie = None
+async def get_login_form_creds(
+  request: Request,
+  username: str = Form(),
+  password: str = Form()
+) -> Optional[AuthCookie]:
+  # Throttled attempts are rejected before they cost a password hash
+  client_ip = request.client.host if request.client else ''
+  retry_after = login_limits_by_ip.acquire(client_ip) or login_limits_by_username.acquire(username)
+  if retry_after:
+    raise TooManyRequestsException(retry_after)
+
+  stored = credentials.get(username, _unknown_user_hash)
+  verify = functools.partial(verify_password, password, stored)
+  valid = await asyncio.get_running_loop().run_in_executor(get_login_executor(request), verify)
+
+  if not valid or username not in credentials:
+    return None
+
+  return build_auth_cookie(serialize_token(username))
 
-  if username in users:
-    if secrets.compare_digest(password, users[username]):
-      token = serialize_token(username)
-      cookie = AuthCookie(
-        name=auth_cookie_name,
-        username=username,
-        token=token)
+
+def authenticate_token(token: str, revocations: SessionRevocations) -> Optional[AuthCookie]:
+  cookie = session_cache.get(token)
+  if not cookie:
+    cookie = build_auth_cookie(token)
+    if not cookie:
+      return None
+    session_cache.put(token, cookie)
+
+  # Checked on every hit, so removed users, expired tokens,
+  # and sessions revoked by other workers are never served from the cache
+  if (cookie.username not in credentials
+      or cookie.expires_at <= time.time()
+      or revocations.is_revoked(cookie.session_id)):
+    session_cache.pop(token)
+    return None
 
   return cookie
 
 
-def get_auth_cookie(reminders_session: Optional[str] = Cookie(default=None)) -> Optional[AuthCookie]:
-  cookie = None
+@traced()
+def get_auth_cookie(request: Request, reminders_session: Optional[str] = Cookie(default=None)) -> Optional[AuthCookie]:
+  if not reminders_session:
+    return None
+
+  revocations = SessionRevocations(get_storage_engine(request))
+  cookie = authenticate_token(reminders_session, revocations)
 
-  if reminders_session:
-    username = deserialize_token(reminders_session)
-    if username and username in users:
-      cookie = AuthCookie(
-        name=auth_cookie_name,
-        username=username,
-        token=reminders_session)
+  if cookie and time.time() - cookie.issued_at >= token_renew_after:
+    cookie = renew_auth_cookie(request, cookie)
   
   return cookie
 
 
+async def revoke_session(request: Request, cookie: AuthCookie) -> None:
+  forget_session(cookie.token)
+  if hasattr(request.state, renewed_cookie_key):
+    delattr(request.state, renewed_cookie_key)
+
+  revocations = SessionRevocations(get_storage_engine(request))
+  revoke = functools.partial(revocations.revoke, cookie.session_id, cookie.expires_at)
+  executor = get_storage_executor(request)
+
+  if executor is None:
+    revoke()
+  else:
+    await asyncio.get_running_loop().run_in_executor(executor, revoke)
+
+
 def get_username_for_api(cookie: Optional[AuthCookie] = Depends(get_auth_cookie)) -> str:
   if not cookie:
     raise UnauthorizedException()
@@ -99,9 +260,38 @@ def get_username_for_page(cookie: Optional[AuthCookie] = Depends(get_auth_cookie
   return cookie.username
 
 
-def get_storage_for_api(username: str = Depends(get_username_for_api)) -> ReminderStorage:
-  return ReminderStorage(owner=username, db_path=db_path)
+# --------------------------------------------------------------------------------
+# Storage Providers
+# --------------------------------------------------------------------------------
+
+def get_storage_engine(request: Request) -> StorageEngine:
+  return request.app.state.storage_engine
+
+
+def get_storage_executor(request: Request) -> Optional[Executor]:
+  return request.app.state.storage_executor
+
+
+def get_login_executor(request: Request) -> Optional[Executor]:
+  return request.app.state.login_executor
+
+
+def get_change_hub(request: Request) -> ChangeHub:
+  return request.app.state.change_hub
+
+
+@traced()
+def _build_async_storage(request: Request, username: str) -> AsyncReminderStorage:
+  # Changes are announced to the owner's event streams,
+  # except the browser tab that made them (named by the X-Tab-Id header)
+  on_change = functools.partial(get_change_hub(request).publish, username, request.headers.get('x-tab-id'))
+  storage = ReminderStorage(owner=username, engine=get_storage_engine(request))
+  return AsyncReminderStorage(storage, get_storage_executor(request), on_change)
+
+
+def get_storage_for_api(request: Request, username: str = Depends(get_username_for_api)) -> AsyncReminderStorage:
+  return _build_async_storage(request, username)
 
 
-def get_storage_for_page(username: str = Depends(get_username_for_page)) -> ReminderStorage:
-  return ReminderStorage(owner=username, db_path=db_path)
+def get_storage_for_page(request: Request, username: str = Depends(get_username_for_page)) -> AsyncReminderStorage:
+  return _build_async_storage(request, username)
@@ -0,0 +1,597 @@
+"""
+This module provides persistence backends for the in-memory storage engine.
+
+A backend loads the TinyDB-format document set at startup
+and is handed every committed change set afterwards.
+With `shared`, several processes (such as uvicorn workers) can use one database:
+commits are serialized by a file lock,
+and each process picks up the others' commits through a generation counter.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import json
+import logging
+import os
+import threading
+import time
+
+from app.utils.metrics import storage_bytes, storage_flush_duration
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Iterator, List, Optional, Tuple
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+# A change is (table, doc_id, doc), where a doc of None means the doc was removed
+Change = Tuple[str, int, Optional[dict]]
+
+# What `poll` returns: a full document set to reload (or None) plus changes to apply on top
+Update = Tuple[Optional[dict], List[Change]]
+
+# The write-behind flusher doubles its retry delay after each failed flush, up to this many seconds
+MAX_RETRY_DELAY = 5.0
+
+
+# --------------------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------------------
+
+def write_atomically(path: str, text: str, fsync: bool) -> None:
+  tmp_path = f'{path}.tmp'
+
+  with open(tmp_path, 'w') as tmp_file:
+    tmp_file.write(text)
+    if fsync:
+      tmp_file.flush()
+      os.fsync(tmp_file.fileno())
+
+  os.replace(tmp_path, path)
+
+  if fsync:
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+      os.fsync(dir_fd)
+    finally:
+      os.close(dir_fd)
+
+
+def read_json(path: str, backend: str) -> dict:
+  if not os.path.exists(path) or os.path.getsize(path) == 0:
+    return {}
+
+  with open(path) as db_json:
+    text = db_json.read()
+  storage_bytes.labels(backend, 'read').inc(len(text))
+  return json.loads(text)
+
+
+# --------------------------------------------------------------------------------
+# CommitLock Class
+# --------------------------------------------------------------------------------
+
+class CommitLock:
+  """
+  Serializes commits across threads and, when `path` is given, across processes.
+  Processes take an `flock` on `path`,
+  and the first 8 bytes of the same file hold a generation counter
+  that each committer bumps after its data is written.
+  Reading the counter is one `pread`, so checking for other processes' commits is cheap.
+  """
+
+  def __init__(self, path: Optional[str] = None) -> None:
+    self._mutex = threading.RLock()
+    self._depth = 0
+    self._fd = None
+
+    if path:
+      if fcntl is None:
+        raise RuntimeError("shared storage needs fcntl file locks, which this platform lacks")
+      self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+  # Private Methods
+
+  @contextmanager
+  def _hold(self, operation: int) -> Iterator[None]:
+    # Re-entrant: a thread that already holds the lock keeps its original mode
+    with self._mutex:
+      self._depth += 1
+      try:
+        if self._depth == 1 and self._fd is not None:
+          fcntl.flock(self._fd, operation)
+        yield
+      finally:
+        if self._depth == 1 and self._fd is not None:
+          fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._depth -= 1
+
+
+  # Locking
+
+  def exclusive(self) -> ContextManager[None]:
+    return self._hold(fcntl.LOCK_EX if fcntl else 0)
+
+
+  def shared(self) -> ContextManager[None]:
+    return self._hold(fcntl.LOCK_SH if fcntl else 0)
+
+
+  # Generations
+
+  def generation(self) -> int:
+    if self._fd is None:
+      return 0
+
+    return int.from_bytes(os.pread(self._fd, 8, 0).ljust(8, b'\0'), 'little')
+
+
+  def bump(self) -> int:
+    # Only call this while holding the exclusive lock
+    generation = self.generation() + 1
+    if self._fd is not None:
+      os.pwrite(self._fd, generation.to_bytes(8, 'little'), 0)
+    return generation
+
+
+  def close(self) -> None:
+    if self._fd is not None:
+      os.close(self._fd)
+      self._fd = None
+
+
+# --------------------------------------------------------------------------------
+# StorageBackend Class
+# --------------------------------------------------------------------------------
+
+class StorageBackend:
+  """
+  The interface the `StorageEngine` expects from a backend.
+  `commit` is called while the engine lock is held and returns a ticket,
+  and `wait` is called with that ticket after the lock is released.
+  The engine holds `lock` around each outermost transaction
+  and calls `poll` before reads to pick up commits from other processes.
+  """
+
+  def load(self) -> dict:
+    raise NotImplementedError()
+
+
+  def lock(self) -> ContextManager[None]:
+    return nullcontext()
+
+
+  def poll(self) -> Optional[Update]:
+    return None
+
+
+  def commit(self, changes: List[Change], dump: Callable[[], str]) -> int:
+    raise NotImplementedError()
+
+
+  def wait(self, ticket: int) -> None:
+    pass
+
+
+  def close(self) -> None:
+    pass
+
+
+# --------------------------------------------------------------------------------
+# JsonBackend Class
+# --------------------------------------------------------------------------------
+
+class JsonBackend(StorageBackend):
+  """
+  Persists the whole document set as one TinyDB-compatible JSON file.
+  Each flush writes a temp file and renames it over the database,
+  so readers never see a half-written file.
+
+  With `write_behind`, commits only mark the database dirty,
+  and a background thread flushes once `max_delay` seconds have passed since the first pending commit
+  or `max_batch` commits are pending, whichever comes first.
+  Mutations from many concurrent requests therefore coalesce into one flush.
+  With `fsync`, each commit also blocks until a flush that covers it is on disk,
+  so concurrent committers share one fsync (group commit).
+  Without it, up to `max_delay` seconds of commits can be lost on a crash.
+  If a flush fails, the commits waiting on it raise the flush error,
+  and the flusher retries with a growing delay until a flush succeeds.
+
+  With `shared`, every commit writes the file before releasing the file lock,
+  so `write_behind` is ignored,
+  and another process's commit makes the next read reload the whole file.
+  """
+
+  def __init__(
+    self,
+    db_path: str = 'reminder_db.json',
+    write_behind: bool = False,
+    max_delay: float = 0.05,
+    max_batch: int = 100,
+    fsync: bool = True,
+    shared: bool = False
+  ) -> None:
+    self.db_path = db_path
+    self.write_behind = write_behind and not shared
+    self.max_delay = max_delay
+    self.max_batch = max_batch
+    self.fsync = fsync
+    self.shared = shared
+
+    self._commit_lock = CommitLock(f'{db_path}.lock' if shared else None)
+    self._generation = 0
+
+    self._cond = threading.Condition()
+    self._dump: Optional[Callable[[], str]] = None
+    self._commit_seq = 0
+    self._flushed_seq = 0
+    self._failed_seq = 0
+    self._flush_error: Optional[Exception] = None
+    self._pending = 0
+    self._first_pending_at = 0.0
+    self._closing = False
+    self._flusher: Optional[threading.Thread] = None
+
+    if self.write_behind:
+      self._flusher = threading.Thread(target=self._run_flusher, name='storage-flusher', daemon=True)
+      self._flusher.start()
+
+
+  # Private Methods
+
+  def _flush(self, dump: Callable[[], str]) -> None:
+    start = time.perf_counter()
+    text = dump()
+    write_atomically(self.db_path, text, self.fsync)
+    storage_flush_duration.labels('json').observe(time.perf_counter() - start)
+    storage_bytes.labels('json', 'written').inc(len(text))
+
+
+  def _run_flusher(self) -> None:
+    retry_delay = max(self.max_delay, 0.01)
+
+    while True:
+      with self._cond:
+        while not self._pending and not self._closing:
+          self._cond.wait()
+
+        if not self._pending:
+          return
+
+        deadline = self._first_pending_at + self.max_delay
+        while self._pending < self.max_batch and not self._closing:
+          remaining = deadline - time.monotonic()
+          if remaining <= 0:
+            break
+          self._cond.wait(remaining)
+
+        seq = self._commit_seq
+        pending = self._pending
+        self._pending = 0
+        dump = self._dump
+
+      try:
+        self._flush(dump)
+      except Exception as error:
+        with self._cond:
+          # Fail the commits this flush covered; the retry still persists them for later waiters
+          self._failed_seq = max(self._failed_seq, seq)
+          self._flush_error = error
+          self._cond.notify_all()
+          closing = self._closing
+
+        if closing:
+          logger.exception("Failed to flush %s on close; %d commits are lost", self.db_path, pending)
+          return
+
+        logger.exception("Failed to flush %s; retrying in %.2f seconds", self.db_path, retry_delay)
+        with self._cond:
+          if not self._pending:
+            self._first_pending_at = time.monotonic()
+          self._pending += pending
+
+          # New commits notify the condition, so wait out the whole delay unless closing
+          deadline = time.monotonic() + retry_delay
+          while not self._closing:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+              break
+            self._cond.wait(remaining)
+
+        retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+        continue
+
+      retry_delay = max(self.max_delay, 0.01)
+      with self._cond:
+        self._flushed_seq = max(self._flushed_seq, seq)
+        self._cond.notify_all()
+
+
+  # Backend Methods
+
+  def load(self) -> dict:
+    with self._commit_lock.exclusive():
+      self._generation = self._commit_lock.generation()
+      if not os.path.exists(self.db_path) or os.path.getsize(self.db_path) == 0:
+        write_atomically(self.db_path, '{}', self.fsync)
+      
+      return read_json(self.db_path, 'json')
+
+
+  def lock(self) -> ContextManager[None]:
+    return self._commit_lock.exclusive() if self.shared else nullcontext()
+
+
+  def poll(self) -> Optional[Update]:
+    if not self.shared:
+      return None
+
+    # Read the counter first: a commit that lands mid-read just triggers one more reload
+    generation = self._commit_lock.generation()
+    if generation == self._generation:
+      return None
+
+    self._generation = generation
+    return read_json(self.db_path, 'json'), []
+
+
+  def commit(self, changes: List[Change], dump: Callable[[], str]) -> int:
+    if not self.write_behind:
+      self._flush(dump)
+      if self.shared:
+        self._generation = self._commit_lock.bump()
+      return 0
+
+    with self._cond:
+      self._dump = dump
+      self._commit_seq += 1
+      if not self._pending:
+        self._first_pending_at = time.monotonic()
+      self._pending += 1
+      self._cond.notify_all()
+      return self._commit_seq
+
+
+  def wait(self, ticket: int) -> None:
+    if not (self.write_behind and self.fsync):
+      return
+
+    with self._cond:
+      while self._flushed_seq < ticket:
+        if self._failed_seq >= ticket:
+          raise OSError(f"Failed to flush {self.db_path}") from self._flush_error
+        self._cond.wait()
+
+
+  def close(self) -> None:
+    if self._flusher:
+      with self._cond:
+        self._closing = True
+        self._cond.notify_all()
+      self._flusher.join()
+      self._flusher = None
+
+    self._commit_lock.close()
+
+
+# --------------------------------------------------------------------------------
+# OpLogBackend Class
+# --------------------------------------------------------------------------------
+
+class OpLogBackend(StorageBackend):
+  """
+  Appends each committed change as one JSON line to `<db_path>.log`,
+  so a write costs the size of the change rather than the size of the database.
+  Startup loads the `db_path` snapshot (the same file format as `JsonBackend`) and replays the log over it.
+  Records hold whole documents, so replaying a record twice is harmless.
+
+  Once the log grows past `compact_threshold` bytes, a background thread compacts it.
+  It builds a new snapshot from the snapshot and log on disk without blocking commits,
+  then briefly takes the commit lock to install the snapshot and cut the log down to the records appended since.
+  A crash between those two renames leaves the old log over the new snapshot, which replays to the same state.
+
+  With `shared`, other processes' commits are read incrementally from the log tail,
+  and a full reload is needed only after another process compacts the log.
+  """
+
+  def __init__(
+    self,
+    db_path: str = 'reminder_db.json',
+    compact_threshold: int = 4 * 1024 * 1024,
+    fsync: bool = True,
+    shared: bool = False
+  ) -> None:
+    self.db_path = db_path
+    self.log_path = f'{db_path}.log'
+    self.compact_threshold = compact_threshold
+    self.fsync = fsync
+    self.shared = shared
+
+    self._commit_lock = CommitLock(f'{db_path}.lock' if shared else None)
+    self._generation = 0
+    self._log = None
+    self._log_ino = None
+    self._offset = 0
+    self._compactor: Optional[threading.Thread] = None
+
+
+  # Private Methods
+
+  def _parse(self, chunk: bytes) -> Tuple[List[Change], int]:
+    # Only whole lines count: a trailing partial line is an append still in progress
+    end = chunk.rfind(b'\n') + 1
+    changes = []
+
+    for line in chunk[:end].splitlines():
+      try:
+        record = json.loads(line)
+      except ValueError:
+        logger.warning("Skipping unreadable record in %s", self.log_path)
+        continue
+      changes.append((record['table'], record['id'], record.get('doc')))
+
+    return changes, end
+
+
+  def _replay(self, data: dict, changes: List[Change]) -> None:
+    for table, doc_id, doc in changes:
+      docs = data.setdefault(table, {})
+      if doc is None:
+        docs.pop(str(doc_id), None)
+      else:
+        docs[str(doc_id)] = doc
+
+
+  def _read_all(self) -> Tuple[dict, int, Optional[int]]:
+    data = read_json(self.db_path, 'oplog')
+    if not os.path.exists(self.log_path):
+      return data, 0, None
+
+    with open(self.log_path, 'rb') as log_file:
+      chunk = log_file.read()
+      log_ino = os.fstat(log_file.fileno()).st_ino
+
+    storage_bytes.labels('oplog', 'read').inc(len(chunk))
+    changes, end = self._parse(chunk)
+
+    self._replay(data, changes)
+    return data, end, log_ino
+
+
+  def _open_log(self) -> None:
+    if self._log:
+      self._log.close()
+    self._log = open(self.log_path, 'ab')
+    self._log_ino = os.fstat(self._log.fileno()).st_ino
+
+
+  def _compact(self) -> None:
+    try:
+      data, split, log_ino = self._read_all()
+      text = json.dumps(data)
+
+      with self._commit_lock.exclusive():
+        if log_ino != os.stat(self.log_path).st_ino:
+          # Another process compacted first
+          return
+        
+        with open(self.log_path, 'rb') as log_file:
+          log_file.seek(split)
+          tail = log_file.read()
+
+        write_atomically(self.db_path, text, self.fsync)
+        with open(f'{self.log_path}.tmp', 'wb') as tmp_file:
+          tmp_file.write(tail)
+        storage_bytes.labels('oplog', 'written').inc(len(text) + len(tail))
+        os.replace(f'{self.log_path}.tmp', self.log_path)
+
+        self._open_log()
+        self._offset = self._offset - split if self._offset >= split else -1
+    except Exception:
+      logger.exception("Failed to compact %s", self.log_path)
+
+
+  # Backend Methods
+
+  def load(self) -> dict:
+    with self._commit_lock.exclusive():
+      data, end, _ = self._read_all()
+
+      # Drop a torn final line left by a crash, so the next append starts on a fresh line
+      if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > end:
+        os.truncate(self.log_path, end)
+
+      self._open_log()
+      self._offset = end
+      self._generation = self._commit_lock.generation()
+      return data
+
+
+  def lock(self) -> ContextManager[None]:
+    return self._commit_lock.exclusive() if self.shared else nullcontext()
+
+
+  def poll(self) -> Optional[Update]:
+    if not self.shared:
+      return None
+
+    if self._commit_lock.generation() == self._generation:
+      return None
+
+    with self._commit_lock.shared():
+      self._generation = self._commit_lock.generation()
+
+      with open(self.log_path, 'rb') as log_file:
+        if os.fstat(log_file.fileno()).st_ino == self._log_ino and self._offset >= 0:
+          log_file.seek(self._offset)
+          chunk = log_file.read()
+          storage_bytes.labels('oplog', 'read').inc(len(chunk))
+          changes, end = self._parse(chunk)
+          self._offset += end
+          return None, changes
+
+      # The log was compacted, so start over from the new snapshot
+      data, self._offset, _ = self._read_all()
+      self._open_log()
+      return data, []
+
+
+  def commit(self, changes: List[Change], dump: Callable[[], str]) -> int:
+    lines = []
+    for table, doc_id, doc in changes:
+      if doc is None:
+        record = {'op': 'delete', 'table': table, 'id': doc_id}
+      else:
+        record = {'op': 'put', 'table': table, 'id': doc_id, 'doc': doc}
+      lines.append(json.dumps(record) + '\n')
+
+    record_bytes = ''.join(lines).encode()
+
+    with self._commit_lock.exclusive():
+      # Another process may have compacted the log since this one last appended
+      if self.shared and os.stat(self.log_path).st_ino != self._log_ino:
+        self._open_log()
+
+      start = time.perf_counter()
+      self._log.write(record_bytes)
+      self._log.flush()
+      if self.fsync:
+        os.fsync(self._log.fileno())
+      storage_flush_duration.labels('oplog').observe(time.perf_counter() - start)
+      storage_bytes.labels('oplog', 'written').inc(len(record_bytes))
+      
+      log_size = self._log.tell()
+      self._offset = log_size
+      if self.shared:
+        self._generation = self._commit_lock.bump()
+
+    compacting = self._compactor and self._compactor.is_alive()
+    if log_size > self.compact_threshold and not compacting:
+      self._compactor = threading.Thread(target=self._compact, name='storage-compactor', daemon=True)
+      self._compactor.start()
+
+    return 0
+
+
+  def close(self) -> None:
+    if self._compactor:
+      self._compactor.join()
+      self._compactor = None
+
+    with self._commit_lock.exclusive():
+      if self._log:
+        self._log.close()
+        self._log = None
+
+    self._commit_lock.close()
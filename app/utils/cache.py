@@ -0,0 +1,109 @@
+"""
+This module provides in-process caches for hot-path lookups.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+
+# --------------------------------------------------------------------------------
+# Types
+# --------------------------------------------------------------------------------
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+# --------------------------------------------------------------------------------
+# LruCache Class
+# --------------------------------------------------------------------------------
+
+class LruCache(Generic[K, V]):
+  """
+  Thread-safe cache that holds at most `max_size` entries,
+  evicting the least recently used one first.
+  With `ttl` (in seconds), entries also expire that long after they were stored.
+  With `max_weight`, the entries' total `weigh(value)` also stays within `max_weight`,
+  and a value heavier than that on its own is never stored.
+  """
+
+  def __init__(
+    self,
+    max_size: int = 1024,
+    ttl: Optional[float] = None,
+    clock: Callable[[], float] = time.monotonic,
+    max_weight: Optional[int] = None,
+    weigh: Callable[[V], int] = len
+  ) -> None:
+    self.max_size = max_size
+    self.ttl = ttl
+    self.max_weight = max_weight
+    self.weigh = weigh
+    self.weight = 0
+    self._clock = clock
+    self._entries: OrderedDict[K, Tuple[float, V, int]] = OrderedDict()
+    self._lock = threading.Lock()
+
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+
+  def get(self, key: K) -> Optional[V]:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+
+      expires, value, weight = entry
+      if expires <= self._clock():
+        del self._entries[key]
+        self.weight -= weight
+        return None
+
+      self._entries.move_to_end(key)
+      return value
+
+
+  def put(self, key: K, value: V) -> None:
+    if self.max_size <= 0:
+      return
+
+    expires = self._clock() + self.ttl if self.ttl is not None else float('inf')
+    weight = self.weigh(value) if self.max_weight is not None else 0
+
+    with self._lock:
+      old_entry = self._entries.pop(key, None)
+      if old_entry:
+        self.weight -= old_entry[2]
+      if self.max_weight is not None and weight > self.max_weight:
+        return
+
+      self._entries[key] = (expires, value, weight)
+      self.weight += weight
+      while len(self._entries) > self.max_size or (self.max_weight is not None and self.weight > self.max_weight):
+        _, (_, _, evicted_weight) = self._entries.popitem(last=False)
+        self.weight -= evicted_weight
+
+
+  def pop(self, key: K) -> Optional[V]:
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        return None
+
+      self.weight -= entry[2]
+      return entry[1]
+
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self.weight = 0
@@ -0,0 +1,231 @@
+"""
+This module compresses responses on the fly with brotli or gzip.
+
+The middleware compresses each body chunk as it is sent,
+so streamed responses (like NDJSON items) are never buffered whole.
+Small bodies, other content types, and already-encoded responses pass through untouched.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from typing import Iterable, Optional, Protocol
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+
+# --------------------------------------------------------------------------------
+# Parameters
+# --------------------------------------------------------------------------------
+
+# Event streams are left out on purpose: each event must reach the browser as soon as it is sent
+DEFAULT_CONTENT_TYPES = (
+  'text/html',
+  'text/css',
+  'text/plain',
+  'application/json',
+  'application/x-ndjson',
+  'application/javascript',
+  'image/svg+xml',
+)
+
+DEFAULT_MINIMUM_SIZE = 1024
+
+
+# --------------------------------------------------------------------------------
+# Compressors
+# --------------------------------------------------------------------------------
+
+class Compressor(Protocol):
+  def compress(self, data: bytes) -> bytes: ...
+  def flush(self) -> bytes: ...
+  def finish(self) -> bytes: ...
+
+
+class GzipCompressor:
+  def __init__(self, level: int) -> None:
+    self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+
+  def compress(self, data: bytes) -> bytes:
+    return self._compressor.compress(data)
+
+
+  def flush(self) -> bytes:
+    return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+  def finish(self) -> bytes:
+    return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+  def __init__(self, quality: int) -> None:
+    self._compressor = brotli.Compressor(quality=quality)
+
+
+  def compress(self, data: bytes) -> bytes:
+    return self._compressor.process(data)
+
+
+  def flush(self) -> bytes:
+    return self._compressor.flush()
+
+
+  def finish(self) -> bytes:
+    return self._compressor.finish()
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+  for entry in accept_encoding.split(','):
+    name, _, params = entry.partition(';')
+    if name.strip().lower() not in (coding, '*'):
+      continue
+    params = params.strip()
+    try:
+      return not params.startswith('q=') or float(params[2:]) > 0
+    except ValueError:
+      return True
+  return False
+
+
+# --------------------------------------------------------------------------------
+# CompressionMiddleware Class
+# --------------------------------------------------------------------------------
+
+class CompressionMiddleware:
+  """
+  Compresses responses whose content type is in `content_types`,
+  preferring brotli (when installed) over gzip.
+  Bodies sent in one message are compressed only if they are at least `minimum_size` bytes.
+  Streamed bodies are compressed and flushed chunk by chunk,
+  unless their Content-Length says they are below the threshold.
+  """
+
+  def __init__(
+    self,
+    app: ASGIApp,
+    minimum_size: int = DEFAULT_MINIMUM_SIZE,
+    content_types: Iterable[str] = DEFAULT_CONTENT_TYPES,
+    gzip_level: int = 6,
+    brotli_quality: int = 4
+  ) -> None:
+    self.app = app
+    self.minimum_size = minimum_size
+    self.content_types = frozenset(content_types)
+    self.gzip_level = gzip_level
+    self.brotli_quality = brotli_quality
+
+
+  def _choose_encoding(self, scope: Scope) -> Optional[str]:
+    accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+    if brotli and _accepts(accept_encoding, 'br'):
+      return 'br'
+    if _accepts(accept_encoding, 'gzip'):
+      return 'gzip'
+    return None
+
+
+  def _build_compressor(self, encoding: str) -> Compressor:
+    if encoding == 'br':
+      return BrotliCompressor(self.brotli_quality)
+    return GzipCompressor(self.gzip_level)
+
+
+  def _is_compressible(self, start: Message) -> bool:
+    if start['status'] < 200 or start['status'] in (204, 304):
+      return False
+
+    headers = Headers(raw=start['headers'])
+    if 'content-encoding' in headers:
+      return False
+
+    media_type = headers.get('content-type', '').partition(';')[0].strip().lower()
+    if media_type not in self.content_types:
+      return False
+
+    content_length = headers.get('content-length')
+    return content_length is None or int(content_length) >= self.minimum_size
+
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+
+    encoding = self._choose_encoding(scope)
+    if not encoding:
+      await self.app(scope, receive, send)
+      return
+
+    start: Optional[Message] = None
+    compressor: Optional[Compressor] = None
+    passthrough = False
+
+    def encode_headers(message: Message, body_length: Optional[int]) -> None:
+      headers = MutableHeaders(scope=message)
+      headers['Content-Encoding'] = encoding
+      headers.add_vary_header('Accept-Encoding')
+      if body_length is None:
+        del headers['Content-Length']
+      else:
+        headers['Content-Length'] = str(body_length)
+
+      # The compressed bytes differ from the original, so a strong validator no longer holds
+      etag = headers.get('etag')
+      if etag and not etag.startswith('W/'):
+        headers['ETag'] = f'W/{etag}'
+
+    async def send_compressed(message: Message) -> None:
+      nonlocal start, compressor, passthrough
+
+      if message['type'] == 'http.response.start':
+        start = message
+        passthrough = not self._is_compressible(message)
+        if passthrough:
+          await send(message)
+        return
+
+      if message['type'] != 'http.response.body' or passthrough:
+        await send(message)
+        return
+
+      body = message.get('body', b'')
+      more_body = message.get('more_body', False)
+
+      if compressor is None:
+        if not more_body:
+          # The whole body is here, so it is compressed only if it is worth it
+          if len(body) < self.minimum_size:
+            await send(start)
+            await send(message)
+            return
+
+          compressor = self._build_compressor(encoding)
+          compressed = compressor.compress(body) + compressor.finish()
+          encode_headers(start, len(compressed))
+          await send(start)
+          await send({'type': 'http.response.body', 'body': compressed})
+          return
+
+        compressor = self._build_compressor(encoding)
+        encode_headers(start, None)
+        await send(start)
+
+      if more_body:
+        # Flushing each chunk keeps streamed responses progressive
+        compressed = compressor.compress(body) + compressor.flush()
+      else:
+        compressed = compressor.compress(body) + compressor.finish()
+      await send({'type': 'http.response.body', 'body': compressed, 'more_body': more_body})
+
+    await self.app(scope, receive, send_compressed)
@@ -0,0 +1,54 @@
+"""
+This module provides ETags and conditional GET support.
+
+ETags are built from the storage versions of the data a response shows,
+so a route can answer `If-None-Match` with 304 Not Modified
+before it reads any data or renders any template.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import hashlib
+
+from fastapi import Request, Response
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+# Responses hold one user's data, so shared caches must not keep them,
+# and browsers must revalidate before reusing them
+cache_control = "private, no-cache"
+
+
+# --------------------------------------------------------------------------------
+# ETags
+# --------------------------------------------------------------------------------
+
+def make_etag(*parts: object) -> str:
+  digest = hashlib.blake2b('\0'.join(map(str, parts)).encode(), digest_size=12).hexdigest()
+  return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+  if_none_match = request.headers.get('if-none-match')
+  if not if_none_match:
+    return False
+
+  # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+  candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+  return any(
+    candidate == '*' or candidate.removeprefix('W/') == etag
+    for candidate in candidates)
+
+
+def not_modified(etag: str) -> Response:
+  return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': cache_control})
+
+
+def set_etag(response: Response, etag: str) -> None:
+  response.headers['ETag'] = etag
+  response.headers['Cache-Control'] = cache_control
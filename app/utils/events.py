@@ -0,0 +1,89 @@
+"""
+This module provides in-process publish/subscribe for reminder changes.
+
+Each open `/reminders/events` stream subscribes for its owner,
+and every storage mutation publishes to that owner's subscribers.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+
+from typing import Dict, Optional
+
+
+# --------------------------------------------------------------------------------
+# Subscription Class
+# --------------------------------------------------------------------------------
+
+class Subscription:
+  """
+  One event stream's interest in an owner's changes.
+  Notifications coalesce into a single pending flag,
+  so an idle or slow subscriber holds constant memory no matter how many changes it misses.
+  """
+
+  def __init__(self, owner: str, tab_id: Optional[str] = None) -> None:
+    self.owner = owner
+    self.tab_id = tab_id
+    self._pending = asyncio.Event()
+
+
+  def notify(self) -> None:
+    self._pending.set()
+
+
+  async def wait(self, timeout: float) -> bool:
+    """Waits for a notification, returning False if `timeout` seconds pass first."""
+
+    try:
+      await asyncio.wait_for(self._pending.wait(), timeout)
+    except asyncio.TimeoutError:
+      return False
+
+    self._pending.clear()
+    return True
+
+
+# --------------------------------------------------------------------------------
+# ChangeHub Class
+# --------------------------------------------------------------------------------
+
+class ChangeHub:
+  """
+  Fans out change notifications to every subscription for the changed owner.
+  A publish costs O(subscribers for that owner), so idle streams for other owners cost nothing.
+  Changes made by other worker processes are not seen.
+
+  All methods must be called on the event loop thread.
+  """
+
+  def __init__(self) -> None:
+    self._subscriptions: Dict[str, Dict[Subscription, None]] = {}
+
+
+  def __len__(self) -> int:
+    return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+  def subscribe(self, owner: str, tab_id: Optional[str] = None) -> Subscription:
+    subscription = Subscription(owner, tab_id)
+    self._subscriptions.setdefault(owner, {})[subscription] = None
+    return subscription
+
+
+  def unsubscribe(self, subscription: Subscription) -> None:
+    subscriptions = self._subscriptions.get(subscription.owner, {})
+    subscriptions.pop(subscription, None)
+    if not subscriptions:
+      self._subscriptions.pop(subscription.owner, None)
+
+
+  def publish(self, owner: str, origin: Optional[str] = None) -> None:
+    """Notifies the owner's subscriptions, except the browser tab (`origin`) that made the change."""
+
+    for subscription in self._subscriptions.get(owner, ()):
+      if origin is None or subscription.tab_id != origin:
+        subscription.notify()
@@ -6,6 +6,8 @@ This module provides exceptions for the app.
 # Imports
 # --------------------------------------------------------------------------------
 
+import math
+
 from fastapi import HTTPException, status
 
 
@@ -31,3 +33,16 @@ class ForbiddenException(HTTPException):
 class NotFoundException(HTTPException):
   def __init__(self):
     super().__init__(status.HTTP_404_NOT_FOUND, "Not Found")
+
+
+class TooManyRequestsException(HTTPException):
+  def __init__(self, retry_after: float):
+    super().__init__(
+      status.HTTP_429_TOO_MANY_REQUESTS,
+      "Too Many Requests",
+      headers={"Retry-After": str(max(1, math.ceil(min(retry_after, 3600))))})
+
+
+class ConflictException(HTTPException):
+  def __init__(self, detail: str = "Conflict"):
+    super().__init__(status.HTTP_409_CONFLICT, detail)
@@ -0,0 +1,58 @@
+"""
+This module provides rate limiting for expensive routes like login.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import math
+import threading
+import time
+
+from app.utils.cache import LruCache
+
+from typing import Callable, Tuple
+
+
+# --------------------------------------------------------------------------------
+# TokenBucketLimiter Class
+# --------------------------------------------------------------------------------
+
+class TokenBucketLimiter:
+  """
+  Keeps one token bucket per key (such as a username or client IP).
+  Each bucket holds up to `burst` tokens and refills at `rate` tokens per second;
+  every attempt takes one token, and an empty bucket rejects the attempt.
+  At most `max_keys` buckets are kept, evicting the least recently used,
+  so a flood of made-up keys cannot grow memory without bound.
+  """
+
+  def __init__(
+    self,
+    rate: float,
+    burst: int,
+    max_keys: int = 10000,
+    clock: Callable[[], float] = time.monotonic
+  ) -> None:
+    self.rate = rate
+    self.burst = burst
+    self._clock = clock
+    self._buckets: LruCache[str, Tuple[float, float]] = LruCache(max_size=max_keys)
+    self._lock = threading.Lock()
+
+
+  def acquire(self, key: str) -> float:
+    """Takes a token for `key`, returning 0 on success or the seconds to wait before retrying."""
+
+    with self._lock:
+      now = self._clock()
+      tokens, updated = self._buckets.get(key) or (float(self.burst), now)
+      tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+
+      if tokens < 1:
+        self._buckets.put(key, (tokens, now))
+        return (1 - tokens) / self.rate if self.rate > 0 else math.inf
+
+      self._buckets.put(key, (tokens - 1, now))
+      return 0
@@ -0,0 +1,321 @@
+"""
+This module records request, template, auth, and storage metrics
+and renders them in the Prometheus text format for `/metrics`.
+
+Recording never takes a lock: each thread counts into its own preallocated shard,
+and shards are only summed when metrics are scraped.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import bisect
+import functools
+import threading
+import time
+
+from app.utils.tracing import record_span
+from starlette.datastructures import Headers
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+
+# --------------------------------------------------------------------------------
+# Parameters
+# --------------------------------------------------------------------------------
+
+# Seconds, from sub-millisecond storage calls to slow page loads
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+T = TypeVar('T')
+
+
+# --------------------------------------------------------------------------------
+# Metric Classes
+# --------------------------------------------------------------------------------
+
+class _HistogramShard:
+  __slots__ = ('counts', 'sum')
+
+  def __init__(self, size: int) -> None:
+    self.counts = [0] * size
+    self.sum = 0.0
+
+
+class HistogramChild:
+  """One labelled series of a histogram."""
+
+  def __init__(self, upper_bounds: Tuple[float, ...]) -> None:
+    self._upper_bounds = upper_bounds
+    self._local = threading.local()
+    self._shards: List[_HistogramShard] = []
+    self._shards_lock = threading.Lock()
+
+
+  def _new_shard(self) -> _HistogramShard:
+    # The last count is the +Inf bucket
+    shard = _HistogramShard(len(self._upper_bounds) + 1)
+    self._local.shard = shard
+    with self._shards_lock:
+      self._shards.append(shard)
+    return shard
+
+
+  def observe(self, value: float) -> None:
+    try:
+      shard = self._local.shard
+    except AttributeError:
+      shard = self._new_shard()
+
+    shard.counts[bisect.bisect_left(self._upper_bounds, value)] += 1
+    shard.sum += value
+
+
+  def snapshot(self) -> Tuple[List[int], float]:
+    counts = [0] * (len(self._upper_bounds) + 1)
+    total = 0.0
+    for shard in list(self._shards):
+      for i, count in enumerate(shard.counts):
+        counts[i] += count
+      total += shard.sum
+    return counts, total
+
+
+class CounterChild:
+  """One labelled series of a counter."""
+
+  def __init__(self) -> None:
+    self._local = threading.local()
+    self._shards: List[List[float]] = []
+    self._shards_lock = threading.Lock()
+
+
+  def inc(self, amount: float = 1) -> None:
+    try:
+      shard = self._local.shard
+    except AttributeError:
+      shard = self._local.shard = [0.0]
+      with self._shards_lock:
+        self._shards.append(shard)
+
+    shard[0] += amount
+
+
+  def value(self) -> float:
+    return sum(shard[0] for shard in list(self._shards))
+
+
+class _Metric:
+  kind = ''
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._children: Dict[Tuple[str, ...], Any] = {}
+    self._children_lock = threading.Lock()
+    registry.append(self)
+
+
+  def _new_child(self) -> Any:
+    raise NotImplementedError()
+
+
+  def labels(self, *values: str) -> Any:
+    child = self._children.get(values)
+    if child is None:
+      with self._children_lock:
+        child = self._children.setdefault(values, self._new_child())
+    return child
+
+
+  def children(self) -> List[Tuple[Tuple[str, ...], Any]]:
+    return sorted(self._children.items())
+
+
+class Histogram(_Metric):
+  kind = 'histogram'
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS
+  ) -> None:
+    self.upper_bounds = tuple(sorted(buckets))
+    super().__init__(name, documentation, labelnames)
+
+
+  def _new_child(self) -> HistogramChild:
+    return HistogramChild(self.upper_bounds)
+
+
+class Counter(_Metric):
+  kind = 'counter'
+
+  def _new_child(self) -> CounterChild:
+    return CounterChild()
+
+
+# --------------------------------------------------------------------------------
+# Registry
+# --------------------------------------------------------------------------------
+
+registry: List[_Metric] = []
+
+
+def _escape(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+  if not pairs:
+    return ''
+  return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def _format_number(value: float) -> str:
+  return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _render_metric(metric: _Metric) -> Iterator[str]:
+  yield f"# HELP {metric.name} {metric.documentation}"
+  yield f"# TYPE {metric.name} {metric.kind}"
+
+  for values, child in metric.children():
+    labels = list(zip(metric.labelnames, values))
+
+    if isinstance(metric, Histogram):
+      counts, total = child.snapshot()
+      cumulative = 0
+      for bound, count in zip(metric.upper_bounds + (float('inf'),), counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        yield f"{metric.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}"
+      yield f"{metric.name}_sum{_format_labels(labels)} {_format_number(total)}"
+      yield f"{metric.name}_count{_format_labels(labels)} {cumulative}"
+    else:
+      yield f"{metric.name}{_format_labels(labels)} {_format_number(child.value())}"
+
+
+def render_metrics() -> str:
+  return '\n'.join(line for metric in registry for line in _render_metric(metric)) + '\n'
+
+
+# --------------------------------------------------------------------------------
+# App Metrics
+# --------------------------------------------------------------------------------
+
+request_duration = Histogram(
+  'bulldoggy_request_duration_seconds', "Time to serve a request, by route template.", ('method', 'route'))
+requests_total = Counter(
+  'bulldoggy_requests_total', "Requests served, by route template and status code.", ('method', 'route', 'status'))
+template_render_duration = Histogram(
+  'bulldoggy_template_render_seconds', "Time to render a Jinja template.", ('template',))
+jwt_decode_duration = Histogram(
+  'bulldoggy_jwt_decode_seconds', "Time to decode and verify a session token.")
+storage_operation_duration = Histogram(
+  'bulldoggy_storage_operation_seconds', "Time spent in a ReminderStorage call.", ('operation',))
+storage_flush_duration = Histogram(
+  'bulldoggy_storage_flush_seconds', "Time to write changes to disk.", ('backend',))
+storage_bytes = Counter(
+  'bulldoggy_storage_bytes_total', "Bytes read from or written to database files.", ('backend', 'direction'))
+tier_loads = Counter(
+  'bulldoggy_storage_tier_loads_total', "Owners loaded into the tiered engine's memory.")
+tier_evictions = Counter(
+  'bulldoggy_storage_tier_evictions_total', "Owners dropped from the tiered engine's memory, by reason.", ('reason',))
+
+
+# --------------------------------------------------------------------------------
+# Timing Helpers
+# --------------------------------------------------------------------------------
+
+def timed(histogram: Histogram, *labelvalues: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+  """
+  Decorates a function to observe its run time, labelled with `labelvalues` or else its name.
+  The run time is also recorded as a span on the current request's trace.
+  """
+
+  def decorate(func: Callable[..., T]) -> Callable[..., T]:
+    span_name = func.__qualname__
+    if histogram.labelnames and not labelvalues:
+      child = histogram.labels(func.__name__)
+    else:
+      child = histogram.labels(*labelvalues)
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+      start = time.perf_counter()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        elapsed = time.perf_counter() - start
+        child.observe(elapsed)
+        record_span(span_name, start, elapsed)
+
+    return wrapper
+  return decorate
+
+
+# --------------------------------------------------------------------------------
+# MetricsMiddleware Class
+# --------------------------------------------------------------------------------
+
+class MetricsMiddleware:
+  """
+  Observes each request's duration under its route template (like `/api/reminders/{list_id}`),
+  so per-ID paths share one series.
+  Event streams are counted but not timed, since they stay open for as long as the page does.
+  """
+
+  def __init__(self, app: ASGIApp) -> None:
+    self.app = app
+    self._templates: Optional[Dict[Any, str]] = None
+
+
+  def _route_template(self, scope: Scope) -> str:
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+      return 'unmatched'
+
+    if self._templates is None:
+      templates = {}
+      for route in scope['app'].routes:
+        if isinstance(route, Mount):
+          templates[route.app] = route.path
+        elif hasattr(route, 'endpoint'):
+          templates[route.endpoint] = route.path
+      self._templates = templates
+
+    return self._templates.get(endpoint, 'unmatched')
+
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+
+    start = time.perf_counter()
+    status = 500
+    streaming = False
+
+    async def send_with_metrics(message: Message) -> None:
+      nonlocal status, streaming
+      if message['type'] == 'http.response.start':
+        status = message['status']
+        streaming = Headers(raw=message['headers']).get('content-type', '').startswith('text/event-stream')
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_with_metrics)
+    finally:
+      route = self._route_template(scope)
+      requests_total.labels(scope['method'], route, str(status)).inc()
+      if not streaming:
+        request_duration.labels(scope['method'], route).observe(time.perf_counter() - start)
@@ -0,0 +1,101 @@
+"""
+This module hashes and verifies user passwords with scrypt.
+
+Hashes are stored in `config.json` as `scrypt$<n>$<r>$<p>$<salt>$<hash>`,
+with the salt and hash in URL-safe base64.
+Run this module to hash a password for the config:
+
+  python -m app.utils.passwords
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import base64
+import getpass
+import hashlib
+import os
+import secrets
+
+from typing import NamedTuple
+
+
+# --------------------------------------------------------------------------------
+# Parameters
+# --------------------------------------------------------------------------------
+
+SCHEME = 'scrypt'
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+# --------------------------------------------------------------------------------
+# PasswordHash Class
+# --------------------------------------------------------------------------------
+
+class PasswordHash(NamedTuple):
+  n: int
+  r: int
+  p: int
+  salt: bytes
+  digest: bytes
+
+
+# --------------------------------------------------------------------------------
+# Hashing
+# --------------------------------------------------------------------------------
+
+def _b64encode(data: bytes) -> str:
+  return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+  return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password: str, n: int, r: int, p: int, salt: bytes, length: int) -> bytes:
+  return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=2 * 128 * r * n, dklen=length)
+
+
+def hash_password(password: str) -> str:
+  salt = os.urandom(SALT_BYTES)
+  digest = _scrypt(password, SCRYPT_N, SCRYPT_R, SCRYPT_P, salt, HASH_BYTES)
+  return f'{SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+def is_password_hash(value: str) -> bool:
+  return value.startswith(f'{SCHEME}$')
+
+
+def parse_password_hash(encoded: str) -> PasswordHash:
+  scheme, n, r, p, salt, digest = encoded.split('$')
+  if scheme != SCHEME:
+    raise ValueError(f"unsupported password hash scheme: {scheme}")
+
+  return PasswordHash(int(n), int(r), int(p), _b64decode(salt), _b64decode(digest))
+
+
+def verify_password(password: str, stored: PasswordHash) -> bool:
+  """Hashes `password` with the stored parameters; this is deliberately slow, so call it off the event loop."""
+
+  digest = _scrypt(password, stored.n, stored.r, stored.p, stored.salt, len(stored.digest))
+  return secrets.compare_digest(digest, stored.digest)
+
+
+# --------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Hash a password for the users in config.json.")
+  parser.parse_args()
+  print(hash_password(getpass.getpass('Password: ')))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,234 @@
+"""
+This module provides on-demand profiling for a live worker:
+a sampling profiler that writes flamegraph-collapsed stacks,
+a cProfile session that writes pstats,
+stack dumps of event loop tasks and threads,
+and tracemalloc snapshots of the app's own allocations.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import cProfile
+import collections
+import io
+import marshal
+import os
+import pickle
+import sys
+import threading
+import tracemalloc
+import traceback
+
+from types import FrameType
+from typing import Counter, Dict, List, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Parameters
+# --------------------------------------------------------------------------------
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --------------------------------------------------------------------------------
+# SamplingProfiler Class
+# --------------------------------------------------------------------------------
+
+def _frame_label(frame: FrameType) -> str:
+  code = frame.f_code
+  return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+  """
+  Samples every thread's stack each `interval` seconds from a background thread.
+  The profiled code runs untouched, so overhead stays low enough for production workers.
+  """
+
+  def __init__(self, interval: float = 0.005) -> None:
+    self.interval = interval
+    self.samples: Counter[Tuple[str, ...]] = collections.Counter()
+    self._stopping = threading.Event()
+    self._thread: Optional[threading.Thread] = None
+
+
+  def _sample(self) -> None:
+    own_id = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+    for thread_id, frame in sys._current_frames().items():
+      if thread_id == own_id:
+        continue
+
+      stack: List[str] = []
+      current: Optional[FrameType] = frame
+      while current is not None:
+        stack.append(_frame_label(current))
+        current = current.f_back
+
+      stack.append(names.get(thread_id, str(thread_id)))
+      self.samples[tuple(reversed(stack))] += 1
+
+
+  def _run(self) -> None:
+    while not self._stopping.wait(self.interval):
+      self._sample()
+
+
+  def start(self) -> None:
+    self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+    self._thread.start()
+
+
+  def stop(self) -> None:
+    self._stopping.set()
+    if self._thread:
+      self._thread.join()
+      self._thread = None
+
+
+  def collapsed(self) -> str:
+    """Returns the samples in the collapsed format read by flamegraph.pl and speedscope."""
+
+    return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.samples.items()))
+
+
+# --------------------------------------------------------------------------------
+# CPU Profiling
+# --------------------------------------------------------------------------------
+
+class ProfileSession:
+  """
+  One CPU profile at a time: either sampled stacks (`collapsed`)
+  or cProfile on the event loop thread (`pstats`).
+  """
+
+  def __init__(self, output: str, interval: float) -> None:
+    self.output = output
+    self.interval = interval
+    self._sampler: Optional[SamplingProfiler] = None
+    self._profile: Optional[cProfile.Profile] = None
+    self._stopped = asyncio.Event()
+
+
+  def start(self) -> None:
+    if self.output == 'pstats':
+      # cProfile hooks the thread that enables it, which is the event loop thread here
+      self._profile = cProfile.Profile()
+      self._profile.enable()
+    else:
+      self._sampler = SamplingProfiler(self.interval)
+      self._sampler.start()
+
+
+  def stop(self) -> None:
+    self._stopped.set()
+
+
+  async def run(self, seconds: float) -> bytes:
+    self.start()
+    try:
+      await asyncio.wait_for(self._stopped.wait(), seconds)
+    except asyncio.TimeoutError:
+      pass
+    finally:
+      if self._profile:
+        self._profile.disable()
+      if self._sampler:
+        self._sampler.stop()
+
+    if self._profile:
+      # This is the file format `pstats.Stats` loads
+      self._profile.create_stats()
+      return marshal.dumps(self._profile.stats)
+    return self._sampler.collapsed().encode()
+
+
+# --------------------------------------------------------------------------------
+# Stack Dumps
+# --------------------------------------------------------------------------------
+
+def dump_stacks() -> str:
+  """Formats the stack of every event loop task, then every thread."""
+
+  buffer = io.StringIO()
+
+  tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+  buffer.write(f"Event loop tasks: {len(tasks)}\n\n")
+  for task in tasks:
+    buffer.write(f"Task {task.get_name()}: {task.get_coro()!r}\n")
+    task.print_stack(file=buffer)
+    buffer.write("\n")
+
+  names = {thread.ident: thread.name for thread in threading.enumerate()}
+  frames = sys._current_frames()
+  buffer.write(f"Threads: {len(frames)}\n\n")
+  for thread_id, frame in frames.items():
+    buffer.write(f"Thread {names.get(thread_id, thread_id)}:\n")
+    buffer.write(''.join(traceback.format_stack(frame)))
+    buffer.write("\n")
+
+  return buffer.getvalue()
+
+
+# --------------------------------------------------------------------------------
+# Memory Snapshots
+# --------------------------------------------------------------------------------
+
+def start_tracing(frames: int = 10) -> None:
+  if not tracemalloc.is_tracing():
+    tracemalloc.start(frames)
+
+
+def stop_tracing() -> None:
+  tracemalloc.stop()
+
+
+def take_app_snapshot() -> tracemalloc.Snapshot:
+  """
+  Snapshots allocations with any app frame in their traceback,
+  which covers the storage engine's documents and indexes.
+  Allocations made by profiling itself are left out.
+  """
+
+  snapshot = tracemalloc.take_snapshot()
+  return snapshot.filter_traces([
+    tracemalloc.Filter(True, os.path.join(APP_DIR, '*'), all_frames=True),
+    tracemalloc.Filter(False, os.path.abspath(__file__), all_frames=True),
+  ])
+
+
+def summarize_snapshot(snapshot: tracemalloc.Snapshot, limit: int = 50) -> str:
+  """Totals allocations by the innermost app line that led to them, largest first."""
+
+  sites: Dict[Tuple[str, int], List[int]] = collections.defaultdict(lambda: [0, 0])
+  for trace in snapshot.traces:
+    # Traceback frames run from the oldest call to the most recent one
+    frame = next(
+      (frame for frame in reversed(trace.traceback) if frame.filename.startswith(APP_DIR)),
+      trace.traceback[-1])
+    site = sites[(frame.filename, frame.lineno)]
+    site[0] += trace.size
+    site[1] += 1
+
+  total = sum(size for size, _ in sites.values())
+  count = sum(blocks for _, blocks in sites.values())
+  lines = [f"App allocations: {total / 1024:.1f} KiB in {count} blocks", ""]
+
+  largest = sorted(sites.items(), key=lambda entry: entry[1][0], reverse=True)[:limit]
+  for (filename, lineno), (size, blocks) in largest:
+    lines.append(f"{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{lineno}: size={size / 1024:.1f} KiB, count={blocks}")
+  return '\n'.join(lines) + '\n'
+
+
+def dump_snapshot(snapshot: tracemalloc.Snapshot) -> bytes:
+  # This is the file format `tracemalloc.Snapshot.load` reads
+  return pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+
+
+def tracing_status() -> Dict[str, int]:
+  current, peak = tracemalloc.get_traced_memory()
+  return {'tracing': tracemalloc.is_tracing(), 'current_bytes': current, 'peak_bytes': peak}
@@ -0,0 +1,354 @@
+"""
+This module provides a SQLite storage engine for the app.
+
+`SqliteEngine` has the same interface as `StorageEngine`,
+so `ReminderStorage` (and therefore every router) works unchanged on top of it.
+Run this module to import an existing TinyDB JSON database:
+
+  python -m app.utils.sqlite_storage reminder_db.json reminder_db.sqlite3
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import json
+import sqlite3
+import threading
+
+from app.utils.storage import LISTS_TABLE, ITEMS_TABLE, SELECTED_TABLE, REVOKED_TABLE, VERSIONS
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Schema
+# --------------------------------------------------------------------------------
+
+COLUMNS = {
+  LISTS_TABLE: ('owner', 'name'),
+  ITEMS_TABLE: ('list_id', 'description', 'completed'),
+  SELECTED_TABLE: ('owner', 'list_id'),
+  REVOKED_TABLE: ('session_id', 'expires_at'),
+}
+
+BOOLEAN_COLUMNS = {'completed'}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {LISTS_TABLE} (
+  id INTEGER PRIMARY KEY,
+  owner TEXT NOT NULL,
+  name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {LISTS_TABLE}_owner ON {LISTS_TABLE} (owner);
+
+CREATE TABLE IF NOT EXISTS {ITEMS_TABLE} (
+  id INTEGER PRIMARY KEY,
+  list_id INTEGER NOT NULL,
+  description TEXT NOT NULL,
+  completed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {ITEMS_TABLE}_list_id ON {ITEMS_TABLE} (list_id);
+
+CREATE TABLE IF NOT EXISTS {SELECTED_TABLE} (
+  id INTEGER PRIMARY KEY,
+  owner TEXT NOT NULL UNIQUE,
+  list_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS {REVOKED_TABLE} (
+  id INTEGER PRIMARY KEY,
+  session_id TEXT NOT NULL UNIQUE,
+  expires_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS versions (
+  scope TEXT PRIMARY KEY,
+  version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO versions (scope, version) VALUES ('epoch', abs(random()));
+"""
+
+
+def _version_triggers() -> str:
+  # Triggers bump versions inside each writing transaction,
+  # so every process sharing the database sees the same versions
+  def bumps(row: str, table: str) -> str:
+    return ''.join(
+      f"INSERT INTO versions (scope, version) VALUES ('{table}:{field}:' || {row}.{field}, 1) "
+      f"ON CONFLICT (scope) DO UPDATE SET version = version + 1;\n"
+      for field in ('id',) + VERSIONS[table])
+
+  triggers = []
+  for table in VERSIONS:
+    triggers.append(f"CREATE TRIGGER IF NOT EXISTS {table}_insert_versions AFTER INSERT ON {table} BEGIN\n{bumps('NEW', table)}END;")
+    triggers.append(f"CREATE TRIGGER IF NOT EXISTS {table}_update_versions AFTER UPDATE ON {table} BEGIN\n{bumps('OLD', table)}{bumps('NEW', table)}END;")
+    triggers.append(f"CREATE TRIGGER IF NOT EXISTS {table}_delete_versions AFTER DELETE ON {table} BEGIN\n{bumps('OLD', table)}END;")
+  
+  return '\n'.join(triggers)
+
+
+VERSION_TRIGGERS = _version_triggers()
+
+
+# Scope of the per-owner versions, which `TieredEngine` reads through `version(OWNERS_SCOPE, 'owner', owner)`
+OWNERS_SCOPE = 'owners'
+
+
+def _owner_triggers() -> str:
+  # Any change to an owner's lists, items, or selection bumps one version for the owner,
+  # so a cached copy of everything the owner has can be checked with one lookup
+  def bumps(row: str, table: str) -> str:
+    if table == ITEMS_TABLE:
+      source = f"SELECT '{OWNERS_SCOPE}:owner:' || owner, 1 FROM {LISTS_TABLE} WHERE id = {row}.list_id"
+    else:
+      source = f"VALUES ('{OWNERS_SCOPE}:owner:' || {row}.owner, 1)"
+    return f"INSERT INTO versions (scope, version) {source} ON CONFLICT (scope) DO UPDATE SET version = version + 1;\n"
+
+  triggers = []
+  for table in (LISTS_TABLE, ITEMS_TABLE, SELECTED_TABLE):
+    triggers.append(f"CREATE TRIGGER IF NOT EXISTS {table}_insert_owner_versions AFTER INSERT ON {table} BEGIN\n{bumps('NEW', table)}END;")
+    triggers.append(f"CREATE TRIGGER IF NOT EXISTS {table}_update_owner_versions AFTER UPDATE ON {table} BEGIN\n{bumps('OLD', table)}{bumps('NEW', table)}END;")
+    triggers.append(f"CREATE TRIGGER IF NOT EXISTS {table}_delete_owner_versions AFTER DELETE ON {table} BEGIN\n{bumps('OLD', table)}END;")
+
+  return '\n'.join(triggers)
+
+
+OWNER_TRIGGERS = _owner_triggers()
+
+
+# --------------------------------------------------------------------------------
+# SqliteEngine Class
+# --------------------------------------------------------------------------------
+
+class SqliteEngine:
+  """
+  Stores reminders in SQLite tables with indexes on owner and list_id.
+  The database runs in WAL mode, so readers never block the writer,
+  and several processes (such as uvicorn workers) can share one database file.
+
+  Triggers keep the same version counters as `StorageEngine.version` in a `versions` table,
+  plus one per owner (see `OWNERS_SCOPE`) that covers all of the owner's data.
+
+  Each thread gets its own connection from a small per-thread pool.
+  Transactions nest the same way as in `StorageEngine`:
+  only the outermost one issues `BEGIN IMMEDIATE` and `COMMIT`,
+  or `ROLLBACK` if it raises.
+  With `fsync`, commits use `synchronous=FULL` instead of `NORMAL`.
+  """
+
+  def __init__(self, db_path: str = 'reminder_db.sqlite3', fsync: bool = False, busy_timeout: float = 5.0) -> None:
+    self.db_path = db_path
+    self.fsync = fsync
+    self.busy_timeout = busy_timeout
+
+    self._local = threading.local()
+    self._connections: List[sqlite3.Connection] = []
+    self._connections_lock = threading.Lock()
+
+    connection = self._connection()
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(SCHEMA)
+    connection.executescript(VERSION_TRIGGERS)
+    connection.executescript(OWNER_TRIGGERS)
+    self._epoch = self._read_version('epoch')
+
+
+  # Private Methods
+
+  def _connection(self) -> sqlite3.Connection:
+    connection = getattr(self._local, 'connection', None)
+
+    if connection is None:
+      connection = sqlite3.connect(
+        self.db_path,
+        timeout=self.busy_timeout,
+        isolation_level=None,
+        check_same_thread=False)
+      connection.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+      self._local.connection = connection
+      self._local.depth = 0
+      with self._connections_lock:
+        self._connections.append(connection)
+
+    return connection
+
+
+  def _to_doc(self, table: str, row: tuple) -> Tuple[int, dict]:
+    doc = dict(zip(COLUMNS[table], row[1:]))
+    for column in BOOLEAN_COLUMNS.intersection(doc):
+      doc[column] = bool(doc[column])
+    return row[0], doc
+
+
+  def _select(self, table: str, where: str = '', params: tuple = (), limit: Optional[int] = None) -> List[Tuple[int, dict]]:
+    columns = ', '.join(('id',) + COLUMNS[table])
+    limit_clause = '' if limit is None else f'LIMIT {int(limit)}'
+    rows = self._connection().execute(f'SELECT {columns} FROM {table} {where} ORDER BY id {limit_clause}', params)
+    return [self._to_doc(table, row) for row in rows]
+
+
+  def _read_version(self, scope: str) -> int:
+    row = self._connection().execute('SELECT version FROM versions WHERE scope = ?', (scope,)).fetchone()
+    return row[0] if row else 0
+
+
+  def _check_columns(self, table: str, fields) -> None:
+    unknown = set(fields) - set(COLUMNS[table])
+    if unknown:
+      raise ValueError(f"unknown columns for {table}: {sorted(unknown)}")
+
+
+  # Transactions
+
+  @contextmanager
+  def transaction(self) -> Iterator[None]:
+    connection = self._connection()
+    outermost = self._local.depth == 0
+
+    if outermost:
+      connection.execute('BEGIN IMMEDIATE')
+
+    self._local.depth += 1
+    try:
+      yield
+      if outermost:
+        connection.execute('COMMIT')
+    except BaseException:
+      if outermost and connection.in_transaction:
+        connection.execute('ROLLBACK')
+      raise
+    finally:
+      self._local.depth -= 1
+
+
+  # Reads
+
+  def get(self, table: str, doc_id: int) -> Optional[dict]:
+    docs = self._select(table, 'WHERE id = ?', (doc_id,))
+    return docs[0][1] if docs else None
+
+
+  def all(self, table: str) -> List[Tuple[int, dict]]:
+    return self._select(table)
+
+
+  def find(
+    self,
+    table: str,
+    field: str,
+    value: Any,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    where: Optional[dict] = None
+  ) -> List[Tuple[int, dict]]:
+    conditions = {field: value, **(where or {})}
+    self._check_columns(table, conditions)
+    clauses = [f'{column} IS ?' for column in conditions]
+    params = tuple(conditions.values())
+
+    if after is not None:
+      clauses.append('id > ?')
+      params += (after,)
+
+    return self._select(table, 'WHERE ' + ' AND '.join(clauses), params, limit)
+
+
+  def version(self, table: str, field: str, value: Any) -> str:
+    return f"{self._epoch}.{self._read_version(f'{table}:{field}:{value}')}"
+
+
+  def owner_docs(self, owner: str) -> Dict[str, List[Tuple[int, dict]]]:
+    """Returns the owner's lists, the items in them, and the owner's selection, each in id order."""
+
+    owned_lists = f'SELECT id FROM {LISTS_TABLE} WHERE owner = ?'
+    return {
+      LISTS_TABLE: self._select(LISTS_TABLE, 'WHERE owner = ?', (owner,)),
+      ITEMS_TABLE: self._select(ITEMS_TABLE, f'WHERE list_id IN ({owned_lists})', (owner,)),
+      SELECTED_TABLE: self._select(SELECTED_TABLE, 'WHERE owner = ?', (owner,))}
+
+
+  # Writes
+
+  def insert(self, table: str, doc: dict) -> int:
+    self._check_columns(table, doc)
+    columns = ', '.join(doc)
+    marks = ', '.join('?' for _ in doc)
+
+    with self.transaction():
+      cursor = self._connection().execute(
+        f'INSERT INTO {table} ({columns}) VALUES ({marks})',
+        tuple(doc.values()))
+      return cursor.lastrowid
+
+
+  def update(self, table: str, doc_id: int, fields: dict) -> None:
+    self._check_columns(table, fields)
+    assignments = ', '.join(f'{field} = ?' for field in fields)
+
+    with self.transaction():
+      self._connection().execute(
+        f'UPDATE {table} SET {assignments} WHERE id = ?',
+        tuple(fields.values()) + (doc_id,))
+
+
+  def remove(self, table: str, doc_ids: List[int]) -> None:
+    with self.transaction():
+      self._connection().executemany(
+        f'DELETE FROM {table} WHERE id = ?',
+        [(doc_id,) for doc_id in doc_ids])
+
+
+  # Lifecycle
+
+  def close(self) -> None:
+    with self._connections_lock:
+      for connection in self._connections:
+        connection.close()
+      self._connections = []
+    self._local = threading.local()
+
+
+# --------------------------------------------------------------------------------
+# Migration
+# --------------------------------------------------------------------------------
+
+def import_json(json_path: str, engine: SqliteEngine) -> Dict[str, int]:
+  with open(json_path) as db_json:
+    data = json.load(db_json)
+
+  counts = {}
+  connection = engine._connection()
+
+  with engine.transaction():
+    for table, columns in COLUMNS.items():
+      docs = data.get(table, {})
+      rows = [
+        (int(doc_id),) + tuple(doc.get(column) for column in columns)
+        for doc_id, doc in docs.items()]
+      connection.executemany(
+        f"INSERT OR REPLACE INTO {table} (id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})",
+        rows)
+      counts[table] = len(rows)
+
+  return counts
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Import a TinyDB JSON reminders database into SQLite.")
+  parser.add_argument('json_path', help="the existing JSON database, such as reminder_db.json")
+  parser.add_argument('sqlite_path', help="the SQLite database to create or update")
+  args = parser.parse_args()
+
+  engine = SqliteEngine(args.sqlite_path)
+  counts = import_json(args.json_path, engine)
+  engine.close()
+
+  for table, count in counts.items():
+    print(f"Imported {count} rows into {table}")
+
+
+if __name__ == '__main__':
+  main()
@@ -6,12 +6,22 @@ This module handles the persistence layer (the "database") for the app.
 # Imports
 # --------------------------------------------------------------------------------
 
+from app.utils.backends import Change, StorageBackend
 from app.utils.exceptions import NotFoundException, ForbiddenException
-
+from app.utils.metrics import storage_operation_duration, timed
+
+import asyncio
+import contextvars
+import functools
+import json
+import secrets
+import threading
+import time
+
+from concurrent.futures import Executor
+from contextlib import ExitStack, contextmanager
 from pydantic import BaseModel
-from tinydb import TinyDB, Query
-from tinydb.table import Document
-from typing import List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
 
 
 # --------------------------------------------------------------------------------
@@ -38,26 +48,399 @@ class SelectedList(BaseModel):
   items: List[ReminderItem]
 
 
+T = TypeVar('T')
+
+STREAM_PAGE_SIZE = 500
+
+
+# --------------------------------------------------------------------------------
+# Table Names
+# --------------------------------------------------------------------------------
+
+LISTS_TABLE = 'reminder_lists'
+ITEMS_TABLE = 'reminder_items'
+SELECTED_TABLE = 'selected_lists'
+REVOKED_TABLE = 'revoked_sessions'
+
+
+# --------------------------------------------------------------------------------
+# Secondary Indexes
+# --------------------------------------------------------------------------------
+
+INDEXES = {
+  LISTS_TABLE: ('owner',),
+  ITEMS_TABLE: ('list_id',),
+  SELECTED_TABLE: ('owner',),
+  REVOKED_TABLE: ('session_id',),
+}
+
+
+# --------------------------------------------------------------------------------
+# Versions
+# --------------------------------------------------------------------------------
+
+# Every change to a doc in these tables bumps the version of the doc's id
+# and of each listed field's value, such as all lists with one owner.
+VERSIONS = {
+  LISTS_TABLE: ('owner',),
+  ITEMS_TABLE: ('list_id',),
+  SELECTED_TABLE: ('owner',),
+}
+
+
+# --------------------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------------------
+
+def _sort_by_id(docs: Dict[int, Any]) -> None:
+  # Sorts a table or index bucket by doc id in place, so references to it stay valid
+  items = sorted(docs.items())
+  docs.clear()
+  docs.update(items)
+
+
+def _add_by_id(docs: Dict[int, Any], doc_id: int, value: Any, ordered: bool) -> None:
+  # New doc ids almost always come last, so only an id that lands out of order costs a sort
+  out_of_order = bool(docs) and doc_id not in docs and doc_id < next(reversed(docs))
+  docs[doc_id] = value
+  if out_of_order and ordered:
+    _sort_by_id(docs)
+
+
+# --------------------------------------------------------------------------------
+# StorageEngine Class
+# --------------------------------------------------------------------------------
+
+class StorageEngine:
+  """
+  Holds the whole reminder document set in memory for the life of the process.
+  The backend loads it once at startup and persists each committed transaction,
+  so reads never touch the disk.
+  One engine is shared by every request; see the app lifespan in `app.main`.
+
+  Every mutation runs in a transaction.
+  Nested transactions join the outermost one,
+  and the backend sees one change set per outermost transaction.
+  If the outermost transaction raises, its changes are undone in memory and never reach the backend.
+  If the backend fails to commit them, they are undone in memory as well.
+  With a shared backend, the outermost transaction also holds the backend's cross-process lock,
+  and reads first pick up any commits made by other processes.
+
+  Fields named in `indexes` get a secondary index (value -> doc ids)
+  that is kept in sync on every insert, update, and remove,
+  so `find` on them costs O(matches) instead of a scan over the whole table.
+  Tables and index buckets stay in doc id order, which keeps `find` cursors monotonic.
+
+  Tables named in `versions` also get version counters (see `version`),
+  bumped in memory as docs change, so callers can cache anything derived from them.
+  """
+
+  def __init__(
+    self,
+    backend: StorageBackend,
+    indexes: Dict[str, Tuple[str, ...]] = INDEXES,
+    versions: Dict[str, Tuple[str, ...]] = VERSIONS
+  ) -> None:
+    self._lock = threading.RLock()
+    self._backend = backend
+    self._depth = 0
+    self._changes: List[Change] = []
+    self._undo: List[Change] = []
+    self._saved_next_ids: Dict[str, int] = {}
+    self._tables: Dict[str, Dict[int, dict]] = {}
+    self._next_ids: Dict[str, int] = {}
+    self._index_fields = indexes
+    self._indexes: Dict[str, Dict[str, Dict[Any, Dict[int, None]]]] = {}
+    self._version_fields = versions
+    self._versions: Dict[Tuple[str, str, Any], int] = {}
+    self._version_clock = 0
+    self._epoch = ''
+    self._build(self._backend.load())
+
+
+  # Private Methods
+
+  def _build(self, data: dict) -> None:
+    for name in (LISTS_TABLE, ITEMS_TABLE, SELECTED_TABLE, REVOKED_TABLE):
+      data.setdefault(name, {})
+
+    self._tables = {
+      name: dict(sorted((int(doc_id), doc) for doc_id, doc in table.items()))
+      for name, table in data.items()}
+    self._next_ids = {
+      name: max(table, default=0) + 1
+      for name, table in self._tables.items()}
+
+    # A rebuild may change anything, so it starts a new epoch of versions
+    self._epoch = secrets.token_hex(4)
+    self._versions = {}
+
+    self._indexes = {}
+    for name, fields in self._index_fields.items():
+      self._indexes[name] = {field: {} for field in fields}
+      for doc_id, doc in self._tables[name].items():
+        self._index_doc(name, doc_id, doc)
+
+
+  def _index_doc(self, table: str, doc_id: int, doc: dict, ordered: bool = True) -> None:
+    # Doc ids are kept in dicts rather than sets to preserve their order
+    for field, index in self._indexes.get(table, {}).items():
+      _add_by_id(index.setdefault(doc.get(field), {}), doc_id, None, ordered)
+
+
+  def _unindex_doc(self, table: str, doc_id: int, doc: dict) -> None:
+    for field, index in self._indexes.get(table, {}).items():
+      doc_ids = index.get(doc.get(field))
+      if doc_ids is not None:
+        doc_ids.pop(doc_id, None)
+        if not doc_ids:
+          del index[doc.get(field)]
+
+
+  def _bump_versions(self, table: str, doc_id: int, doc: dict) -> None:
+    fields = self._version_fields.get(table)
+    if fields is None:
+      return
+
+    # One clock for all keys, so a version is never reused even if a doc id is
+    self._version_clock += 1
+    self._versions[(table, 'id', doc_id)] = self._version_clock
+    for field in fields:
+      self._versions[(table, field, doc.get(field))] = self._version_clock
+
+
+  def _put_doc(self, table: str, doc_id: int, doc: dict, ordered: bool = True) -> None:
+    # With `ordered` false, the caller re-sorts the touched table and buckets afterwards
+    docs = self._tables.setdefault(table, {})
+    old_doc = docs.get(doc_id)
+
+    if old_doc is not None:
+      self._bump_versions(table, doc_id, old_doc)
+    self._bump_versions(table, doc_id, doc)
+
+    # Only touch the indexes when an indexed value changes, so docs keep their order
+    fields = self._indexes.get(table, {})
+    if old_doc is None or any(old_doc.get(field) != doc.get(field) for field in fields):
+      if old_doc is not None:
+        self._unindex_doc(table, doc_id, old_doc)
+      self._index_doc(table, doc_id, doc, ordered)
+
+    _add_by_id(docs, doc_id, doc, ordered)
+    self._next_ids[table] = max(self._next_ids.get(table, 1), doc_id + 1)
+
+
+  def _pop_doc(self, table: str, doc_id: int) -> Optional[dict]:
+    doc = self._tables.setdefault(table, {}).pop(doc_id, None)
+    if doc is not None:
+      self._unindex_doc(table, doc_id, doc)
+      self._bump_versions(table, doc_id, doc)
+    return doc
+
+
+  def _sync(self) -> None:
+    update = self._backend.poll()
+    if update is None:
+      return
+
+    data, changes = update
+    if data is not None:
+      self._build(data)
+    for table, doc_id, doc in changes:
+      if doc is None:
+        self._pop_doc(table, doc_id)
+      else:
+        self._put_doc(table, doc_id, doc)
+
+
+  def _dump(self) -> str:
+    with self._lock:
+      data = {
+        name: {str(doc_id): doc for doc_id, doc in table.items()}
+        for name, table in self._tables.items()}
+      return json.dumps(data)
+
+
+  def _record(self, table: str, doc_id: int, old_doc: Optional[dict]) -> None:
+    doc = self._tables[table].get(doc_id)
+    self._changes.append((table, doc_id, dict(doc) if doc is not None else None))
+    self._undo.append((table, doc_id, old_doc))
+
+
+  def _rollback(self) -> None:
+    restored = []
+    for table, doc_id, old_doc in reversed(self._undo):
+      if old_doc is None:
+        self._pop_doc(table, doc_id)
+      else:
+        self._put_doc(table, doc_id, old_doc, ordered=False)
+        restored.append((table, old_doc))
+
+    # Undo re-adds removed docs at the end of their table and index buckets,
+    # so sort each of those once rather than once per doc
+    for table in {table for table, _ in restored}:
+      _sort_by_id(self._tables[table])
+    buckets = {
+      (table, field, doc.get(field))
+      for table, doc in restored
+      for field in self._indexes.get(table, {})}
+    for table, field, value in buckets:
+      _sort_by_id(self._indexes[table][field][value])
+
+    self._next_ids = self._saved_next_ids
+    self._changes = []
+    self._undo = []
+
+
+  # Transactions
+
+  @contextmanager
+  def transaction(self) -> Iterator[None]:
+    ticket = None
+
+    with self._lock, ExitStack() as stack:
+      if self._depth == 0:
+        stack.enter_context(self._backend.lock())
+        self._sync()
+        self._saved_next_ids = dict(self._next_ids)
+      
+      self._depth += 1
+      try:
+        yield
+        # A failed commit must undo the changes too, so it runs before the undo log is dropped
+        if self._depth == 1 and self._changes:
+          ticket = self._backend.commit(self._changes, self._dump)
+      except BaseException:
+        if self._depth == 1:
+          self._rollback()
+        raise
+      finally:
+        self._depth -= 1
+        if self._depth == 0:
+          self._changes, self._undo = [], []
+    
+    # Wait outside the lock so other requests can join the same flush
+    if ticket is not None:
+      self._backend.wait(ticket)
+
+
+  # Reads
+
+  def get(self, table: str, doc_id: int) -> Optional[dict]:
+    with self._lock:
+      self._sync()
+      doc = self._tables[table].get(doc_id)
+      return dict(doc) if doc is not None else None
+
+
+  def all(self, table: str) -> List[Tuple[int, dict]]:
+    with self._lock:
+      self._sync()
+      return [(doc_id, dict(doc)) for doc_id, doc in self._tables[table].items()]
+
+
+  def find(
+    self,
+    table: str,
+    field: str,
+    value: Any,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    where: Optional[dict] = None
+  ) -> List[Tuple[int, dict]]:
+    """
+    Finds docs whose `field` equals `value`, in doc id order.
+    `after`, `limit`, and `where` (extra field values to match) narrow the results
+    before any doc is copied, so a page costs O(limit) copies rather than O(matches).
+    """
+
+    with self._lock:
+      self._sync()
+      docs = self._tables[table]
+      index = self._indexes.get(table, {}).get(field)
+
+      if index is None:
+        doc_ids = (doc_id for doc_id, doc in docs.items() if doc.get(field) == value)
+      else:
+        doc_ids = index.get(value, ())
+      
+      matches = []
+      for doc_id in doc_ids:
+        if after is not None and doc_id <= after:
+          continue
+
+        doc = docs[doc_id]
+        if where and any(doc.get(key) != expected for key, expected in where.items()):
+          continue
+
+        matches.append((doc_id, dict(doc)))
+        if limit is not None and len(matches) >= limit:
+          break
+
+      return matches
+
+
+  def version(self, table: str, field: str, value: Any) -> str:
+    """
+    Returns an opaque version for the docs in `table` whose `field` (or `'id'`) equals `value`.
+    It changes whenever any of those docs is inserted, updated, or removed.
+    """
+
+    with self._lock:
+      self._sync()
+      return f"{self._epoch}.{self._versions.get((table, field, value), 0)}"
+
+
+  # Writes
+
+  def insert(self, table: str, doc: dict) -> int:
+    with self.transaction():
+      doc_id = self._next_ids[table]
+      self._put_doc(table, doc_id, dict(doc))
+      self._record(table, doc_id, None)
+      return doc_id
+
+
+  def update(self, table: str, doc_id: int, fields: dict) -> None:
+    with self.transaction():
+      old_doc = self._tables[table][doc_id]
+      self._put_doc(table, doc_id, {**old_doc, **fields})
+      self._record(table, doc_id, old_doc)
+
+
+  def remove(self, table: str, doc_ids: List[int]) -> None:
+    with self.transaction():
+      for doc_id in doc_ids:
+        old_doc = self._pop_doc(table, doc_id)
+        if old_doc is not None:
+          self._record(table, doc_id, old_doc)
+
+
+  # Lifecycle
+
+  def close(self) -> None:
+    self._backend.close()
+
+
 # --------------------------------------------------------------------------------
 # ReminderStorage Class
 # --------------------------------------------------------------------------------
 
 class ReminderStorage:
-  
+  """
+  An owner-scoped view over the shared storage engine
+  (a `StorageEngine` or a `SqliteEngine`, which have the same interface).
+  It is cheap to construct, so each request builds its own.
+  """
 
-  def __init__(self, owner: str, db_path: str = 'reminder_db.json') -> None:
+  def __init__(self, owner: str, engine: StorageEngine) -> None:
     self.owner = owner
-    self._db_path = db_path
-    self._db = TinyDB(db_path)
-    self._lists_table = self._db.table('reminder_lists')
-    self._items_table = self._db.table('reminder_items')
-    self._selected_table = self._db.table('selected_lists')
+    self._engine = engine
 
 
   # Private Methods
 
-  def _get_raw_list(self, list_id: int) -> Document:
-    reminder_list = self._lists_table.get(doc_id=list_id)
+  def _get_raw_list(self, list_id: int) -> dict:
+    reminder_list = self._engine.get(LISTS_TABLE, list_id)
 
     if not reminder_list:
       raise NotFoundException()
@@ -67,8 +450,8 @@ class ReminderStorage:
     return reminder_list
   
 
-  def _get_raw_item(self, item_id: int) -> Document:
-    item = self._items_table.get(doc_id=item_id)
+  def _get_raw_item(self, item_id: int) -> dict:
+    item = self._engine.get(ITEMS_TABLE, item_id)
     if not item:
       raise NotFoundException()
     
@@ -86,25 +469,44 @@ class ReminderStorage:
     self._get_raw_item(item_id)
 
 
+  def _get_raw_selected(self) -> Optional[Tuple[int, dict]]:
+    selected_lists = self._engine.find(SELECTED_TABLE, 'owner', self.owner)
+    return selected_lists[0] if selected_lists else None
+
+
+  # Transactions
+
+  def transaction(self):
+    # Groups several calls into one commit, and so one persistence flush
+    return self._engine.transaction()
+
+
   # Reminder Lists
 
+  @timed(storage_operation_duration)
   def create_list(self, name: str) -> int:
     reminder_list = {'name': name, 'owner': self.owner}
-    list_id = self._lists_table.insert(reminder_list)
+    list_id = self._engine.insert(LISTS_TABLE, reminder_list)
     return list_id
   
 
+  @timed(storage_operation_duration)
   def delete_list(self, list_id: int) -> None:
-    self._verify_list_exists(list_id)
-    self._lists_table.remove(doc_ids=[list_id])
-    self._items_table.remove(Query().list_id == list_id)
+    with self.transaction():
+      self._verify_list_exists(list_id)
+      self._engine.remove(LISTS_TABLE, [list_id])
+      item_ids = [item_id for item_id, _ in self._engine.find(ITEMS_TABLE, 'list_id', list_id)]
+      self._engine.remove(ITEMS_TABLE, item_ids)
 
 
+  @timed(storage_operation_duration)
   def delete_lists(self) -> None:
-    for rem_list in self.get_lists():
-      self.delete_list(rem_list.id)
+    with self.transaction():
+      for rem_list in self.get_lists():
+        self.delete_list(rem_list.id)
 
 
+  @timed(storage_operation_duration)
   def get_list(self, list_id: int) -> ReminderList:
     reminder_list = self._get_raw_list(list_id)
     reminder_list['id'] = list_id
@@ -112,20 +514,22 @@ class ReminderStorage:
     return model
 
 
-  def get_lists(self) -> List[ReminderList]:
-    reminder_lists = self._lists_table.search(Query().owner == self.owner)
-    models = [ReminderList(id=rems.doc_id, **rems) for rems in reminder_lists]
+  @timed(storage_operation_duration)
+  def get_lists(self, after: Optional[int] = None, limit: Optional[int] = None) -> List[ReminderList]:
+    reminder_lists = self._engine.find(LISTS_TABLE, 'owner', self.owner, after=after, limit=limit)
+    models = [ReminderList(id=list_id, **rems) for list_id, rems in reminder_lists]
     return models
   
 
+  @timed(storage_operation_duration)
   def update_list_name(self, list_id: int, new_name: str) -> None:
-    reminder_list = self._get_raw_list(list_id)
-    reminder_list['name'] = new_name
-    self._lists_table.update(reminder_list, doc_ids=[list_id])
+    self._verify_list_exists(list_id)
+    self._engine.update(LISTS_TABLE, list_id, {'name': new_name})
   
 
   # Reminder Items
 
+  @timed(storage_operation_duration)
   def add_item(self, list_id: int, description: str) -> int:
     reminder_item = {
       'list_id': list_id,
@@ -134,15 +538,17 @@ class ReminderStorage:
     }
 
     self._verify_list_exists(list_id)
-    item_id = self._items_table.insert(reminder_item)
+    item_id = self._engine.insert(ITEMS_TABLE, reminder_item)
     return item_id
   
 
+  @timed(storage_operation_duration)
   def delete_item(self, item_id: int) -> None:
     self._verify_item_exists(item_id)
-    self._items_table.remove(doc_ids=[item_id])
+    self._engine.remove(ITEMS_TABLE, [item_id])
 
 
+  @timed(storage_operation_duration)
   def get_item(self, item_id: int) -> ReminderItem:
     item = self._get_raw_item(item_id)
     item['id'] = item_id
@@ -150,36 +556,64 @@ class ReminderStorage:
     return model
 
 
-  def get_items(self, list_id: int) -> List[ReminderItem]:
+  @timed(storage_operation_duration)
+  def get_items(
+    self,
+    list_id: int,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    completed: Optional[bool] = None
+  ) -> List[ReminderItem]:
     self._verify_list_exists(list_id)
-    items = self._items_table.search(Query().list_id == list_id)
-    models = [ReminderItem(id=item.doc_id, ** item) for item in items]
+    where = None if completed is None else {'completed': completed}
+    items = self._engine.find(ITEMS_TABLE, 'list_id', list_id, after=after, limit=limit, where=where)
+    models = [ReminderItem(id=item_id, **item) for item_id, item in items]
     return models
   
 
+  def iter_items(
+    self,
+    list_id: int,
+    completed: Optional[bool] = None,
+    page_size: int = STREAM_PAGE_SIZE
+  ) -> Iterator[ReminderItem]:
+    """Yields a list's items one page at a time, so only one page is ever in memory."""
+
+    after = None
+    while True:
+      page = self.get_items(list_id, after, page_size, completed)
+      yield from page
+
+      if len(page) < page_size:
+        return
+      after = page[-1].id
+
+
+  @timed(storage_operation_duration)
   def strike_item(self, item_id: int) -> None:
     item = self._get_raw_item(item_id)
-    item['completed'] = not item['completed']
-    self._items_table.update(item, doc_ids=[item_id])
+    self._engine.update(ITEMS_TABLE, item_id, {'completed': not item['completed']})
   
 
+  @timed(storage_operation_duration)
   def update_item_description(self, item_id: int, new_description: str) -> None:
-    item = self._get_raw_item(item_id)
-    item['description'] = new_description
-    self._items_table.update(item, doc_ids=[item_id])
+    self._verify_item_exists(item_id)
+    self._engine.update(ITEMS_TABLE, item_id, {'description': new_description})
 
 
   # Selected Lists
 
+  @timed(storage_operation_duration)
   def get_selected_list_id(self) -> Optional[int]:
-    selected_list = self._selected_table.search(Query().owner == self.owner)
+    selected_list = self._get_raw_selected()
     if not selected_list:
       return None
     
-    list_id = selected_list[0]['list_id']
+    list_id = selected_list[1]['list_id']
     return list_id
 
 
+  @timed(storage_operation_duration)
   def get_selected_list(self) -> Optional[SelectedList]:
     list_id = self.get_selected_list_id()
     if list_id is None:
@@ -189,7 +623,7 @@ class ReminderStorage:
       reminder_list = self.get_list(list_id)
       reminder_items = self.get_items(list_id)
     except:
-      self._selected_table.update({'list_id': None}, Query().owner == self.owner)
+      self.set_selected_list(None)
       return None
 
     return SelectedList(
@@ -199,19 +633,294 @@ class ReminderStorage:
       items=reminder_items)
 
 
+  @timed(storage_operation_duration)
   def set_selected_list(self, list_id: Optional[int]) -> None:
-    selected_list = self._selected_table.search(Query().owner == self.owner)
+    selected_list = self._get_raw_selected()
 
     if selected_list:
-      self._selected_table.update({'list_id': list_id}, Query().owner == self.owner)
+      self._engine.update(SELECTED_TABLE, selected_list[0], {'list_id': list_id})
     else:
-      self._selected_table.insert({'owner': self.owner, 'list_id': list_id})
+      self._engine.insert(SELECTED_TABLE, {'owner': self.owner, 'list_id': list_id})
 
 
+  @timed(storage_operation_duration)
   def reset_selected_after_delete(self, deleted_id: int) -> None:
-    selected_list = self._selected_table.search(Query().owner == self.owner)
+    selected_list = self._get_raw_selected()
 
-    if selected_list and selected_list[0]['list_id'] == deleted_id:
-      reminder_lists = self._lists_table.all()
-      list_id = reminder_lists[0].doc_id if reminder_lists else None
+    if selected_list and selected_list[1]['list_id'] == deleted_id:
+      reminder_lists = self._engine.find(LISTS_TABLE, 'owner', self.owner)
+      list_id = reminder_lists[0][0] if reminder_lists else None
       self.set_selected_list(list_id)
+
+
+  # Versions
+
+  @timed(storage_operation_duration)
+  def get_lists_version(self) -> str:
+    return self._engine.version(LISTS_TABLE, 'owner', self.owner)
+
+
+  @timed(storage_operation_duration)
+  def get_items_version(self, list_id: int) -> str:
+    # The list's own version changes when it is deleted, even if it has no items
+    return '/'.join((
+      self._engine.version(LISTS_TABLE, 'id', list_id),
+      self._engine.version(ITEMS_TABLE, 'list_id', list_id)))
+
+
+  @timed(storage_operation_duration)
+  def get_item_version(self, item_id: int) -> str:
+    return self._engine.version(ITEMS_TABLE, 'id', item_id)
+
+
+  @timed(storage_operation_duration)
+  def get_list_version(self, list_id: int) -> str:
+    # A list row also shows whether it is the selected list
+    return '/'.join((
+      self._engine.version(LISTS_TABLE, 'id', list_id),
+      self._engine.version(SELECTED_TABLE, 'owner', self.owner)))
+
+
+  @timed(storage_operation_duration)
+  def get_selected_list_version(self) -> str:
+    list_id = self.get_selected_list_id()
+    return '/'.join((
+      self._engine.version(SELECTED_TABLE, 'owner', self.owner),
+      self._engine.version(LISTS_TABLE, 'id', list_id),
+      self._engine.version(ITEMS_TABLE, 'list_id', list_id)))
+
+
+  @timed(storage_operation_duration)
+  def get_page_version(self) -> str:
+    """Changes whenever the owner's lists, the selection, or the selected list's items change."""
+
+    list_id = self.get_selected_list_id()
+    return '/'.join((
+      self._engine.version(LISTS_TABLE, 'owner', self.owner),
+      self._engine.version(SELECTED_TABLE, 'owner', self.owner),
+      self._engine.version(ITEMS_TABLE, 'list_id', list_id)))
+
+
+# --------------------------------------------------------------------------------
+# SessionRevocations Class
+# --------------------------------------------------------------------------------
+
+class SessionRevocations:
+  """
+  Server-side record of revoked login sessions, keyed by session ID.
+  Every token renewed from one login shares its session ID, so one revocation covers them all.
+  Revocations are stored in the engine like any other table,
+  so they survive restarts and every worker sharing the database sees them.
+  Lookups go through the `session_id` index, so checking a token costs O(1).
+  A revocation only needs to outlive the session's last token, so expired ones can be purged.
+  Besides the purge at startup, every `purge_every`-th revocation purges expired ones,
+  so a long-running process keeps the table down to live sessions at an amortized O(1) per revocation.
+  """
+
+  def __init__(self, engine: StorageEngine, purge_every: int = 100) -> None:
+    self._engine = engine
+    self.purge_every = purge_every
+
+
+  def revoke(self, session_id: str, expires_at: int) -> None:
+    with self._engine.transaction():
+      if self.is_revoked(session_id):
+        return
+
+      # Doc ids are shared by every worker, so the workers take turns purging
+      doc_id = self._engine.insert(REVOKED_TABLE, {'session_id': session_id, 'expires_at': expires_at})
+      if doc_id % self.purge_every == 0:
+        self.purge_expired(time.time())
+
+
+  def is_revoked(self, session_id: str) -> bool:
+    return bool(self._engine.find(REVOKED_TABLE, 'session_id', session_id, limit=1))
+
+
+  def purge_expired(self, now: float) -> int:
+    with self._engine.transaction():
+      expired = [
+        doc_id for doc_id, doc in self._engine.all(REVOKED_TABLE)
+        if doc['expires_at'] <= now]
+      if expired:
+        self._engine.remove(REVOKED_TABLE, expired)
+    
+    return len(expired)
+
+
+# --------------------------------------------------------------------------------
+# AsyncReminderStorage Class
+# --------------------------------------------------------------------------------
+
+class AsyncReminderStorage:
+  """
+  Awaitable wrapper around `ReminderStorage` for the async route handlers.
+  Each call runs on the bounded storage executor created in the app lifespan,
+  so disk I/O, fsync waits, and SQLite queries never block the event loop.
+  Without an executor, calls run inline on the event loop.
+
+  A transaction must stay on one thread,
+  so multi-step work goes through `run_transaction` as a plain function.
+
+  After each successful mutation, `on_change` (if given) is called on the event loop.
+  """
+
+  def __init__(
+    self,
+    storage: ReminderStorage,
+    executor: Optional[Executor] = None,
+    on_change: Optional[Callable[[], None]] = None
+  ) -> None:
+    self.owner = storage.owner
+    self._storage = storage
+    self._executor = executor
+    self._on_change = on_change
+
+
+  # Private Methods
+
+  async def _run(self, func: Callable[..., T], *args: Any) -> T:
+    if self._executor is None:
+      return func(*args)
+    
+    # The copied context carries the request's trace, so storage spans land on it
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(self._executor, functools.partial(context.run, func, *args))
+
+
+  async def _write(self, func: Callable[..., T], *args: Any) -> T:
+    result = await self._run(func, *args)
+    if self._on_change is not None:
+      self._on_change()
+    return result
+
+
+  def _transaction(self, func: Callable[[ReminderStorage], T]) -> T:
+    with self._storage.transaction():
+      return func(self._storage)
+
+
+  # Transactions
+
+  async def run_transaction(self, func: Callable[[ReminderStorage], T]) -> T:
+    return await self._write(self._transaction, func)
+
+
+  # Reminder Lists
+
+  async def create_list(self, name: str) -> int:
+    return await self._write(self._storage.create_list, name)
+
+
+  async def delete_list(self, list_id: int) -> None:
+    return await self._write(self._storage.delete_list, list_id)
+
+
+  async def delete_lists(self) -> None:
+    return await self._write(self._storage.delete_lists)
+
+
+  async def get_list(self, list_id: int) -> ReminderList:
+    return await self._run(self._storage.get_list, list_id)
+
+
+  async def get_lists(self, after: Optional[int] = None, limit: Optional[int] = None) -> List[ReminderList]:
+    return await self._run(self._storage.get_lists, after, limit)
+
+
+  async def update_list_name(self, list_id: int, new_name: str) -> None:
+    return await self._write(self._storage.update_list_name, list_id, new_name)
+
+
+  # Reminder Items
+
+  async def add_item(self, list_id: int, description: str) -> int:
+    return await self._write(self._storage.add_item, list_id, description)
+
+
+  async def delete_item(self, item_id: int) -> None:
+    return await self._write(self._storage.delete_item, item_id)
+
+
+  async def get_item(self, item_id: int) -> ReminderItem:
+    return await self._run(self._storage.get_item, item_id)
+
+
+  async def get_items(
+    self,
+    list_id: int,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    completed: Optional[bool] = None
+  ) -> List[ReminderItem]:
+    return await self._run(self._storage.get_items, list_id, after, limit, completed)
+
+
+  async def iter_items(
+    self,
+    list_id: int,
+    completed: Optional[bool] = None,
+    page_size: int = STREAM_PAGE_SIZE
+  ) -> AsyncIterator[ReminderItem]:
+    after = None
+    while True:
+      page = await self.get_items(list_id, after, page_size, completed)
+      for item in page:
+        yield item
+
+      if len(page) < page_size:
+        return
+      after = page[-1].id
+
+
+  async def strike_item(self, item_id: int) -> None:
+    return await self._write(self._storage.strike_item, item_id)
+
+
+  async def update_item_description(self, item_id: int, new_description: str) -> None:
+    return await self._write(self._storage.update_item_description, item_id, new_description)
+
+
+  # Selected Lists
+
+  async def get_selected_list_id(self) -> Optional[int]:
+    return await self._run(self._storage.get_selected_list_id)
+
+
+  async def get_selected_list(self) -> Optional[SelectedList]:
+    return await self._run(self._storage.get_selected_list)
+
+
+  async def set_selected_list(self, list_id: Optional[int]) -> None:
+    return await self._write(self._storage.set_selected_list, list_id)
+
+
+  async def reset_selected_after_delete(self, deleted_id: int) -> None:
+    return await self._write(self._storage.reset_selected_after_delete, deleted_id)
+
+
+  # Versions
+
+  async def get_lists_version(self) -> str:
+    return await self._run(self._storage.get_lists_version)
+
+
+  async def get_items_version(self, list_id: int) -> str:
+    return await self._run(self._storage.get_items_version, list_id)
+
+
+  async def get_item_version(self, item_id: int) -> str:
+    return await self._run(self._storage.get_item_version, item_id)
+
+
+  async def get_list_version(self, list_id: int) -> str:
+    return await self._run(self._storage.get_list_version, list_id)
+
+
+  async def get_selected_list_version(self) -> str:
+    return await self._run(self._storage.get_selected_list_version)
+
+
+  async def get_page_version(self) -> str:
+    return await self._run(self._storage.get_page_version)
@@ -0,0 +1,119 @@
+"""
+This module builds the Jinja template layer.
+
+Templates are compiled once per process at startup instead of on their first request,
+and their compiled bytecode is kept on disk so restarts and other workers skip parsing.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import time
+
+from app.utils.assets import manifest, static_url
+from app.utils.metrics import template_render_duration
+from app.utils.tracing import record_span
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, Template
+
+from typing import Any, Dict, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# TimedTemplate Class
+# --------------------------------------------------------------------------------
+
+class TimedTemplate(Template):
+  """A template that records how long each render takes, in metrics and in request traces."""
+
+  def render(self, *args: Any, **kwargs: Any) -> str:
+    start = time.perf_counter()
+    try:
+      return super().render(*args, **kwargs)
+    finally:
+      elapsed = time.perf_counter() - start
+      name = self.name or '<string>'
+      template_render_duration.labels(name).observe(elapsed)
+      record_span(f"render {name}", start, elapsed)
+
+
+# --------------------------------------------------------------------------------
+# Template Creation
+# --------------------------------------------------------------------------------
+
+TEMPLATE_EXTENSIONS = ('.html',)
+
+
+def create_templates(
+  directory: str,
+  bytecode_cache_dir: Optional[str] = None,
+  auto_reload: bool = True
+) -> Jinja2Templates:
+  """
+  Builds templates that never evict compiled templates from memory.
+  With `auto_reload` off, Jinja also stops checking template files for changes on every render,
+  which suits production but not `uvicorn --reload`.
+  """
+
+  bytecode_cache = None
+  if bytecode_cache_dir:
+    os.makedirs(bytecode_cache_dir, exist_ok=True)
+    bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+
+  templates = Jinja2Templates(
+    directory=directory,
+    auto_reload=auto_reload,
+    bytecode_cache=bytecode_cache,
+    cache_size=-1)
+  templates.env.template_class = TimedTemplate
+  templates.env.globals['static_url'] = static_url
+  return templates
+
+
+def warm_templates(templates: Jinja2Templates) -> int:
+  """Compiles every page and partial up front, returning how many were loaded."""
+
+  names = templates.env.list_templates(extensions=[ext.lstrip('.') for ext in TEMPLATE_EXTENSIONS])
+  for name in names:
+    templates.get_template(name)
+  return len(names)
+
+
+# --------------------------------------------------------------------------------
+# Build Fingerprint
+# --------------------------------------------------------------------------------
+
+# Maps each template directory to its last (stamp, fingerprint), where the stamp is the manifest plus template mtimes
+_fingerprints: Dict[str, Tuple[tuple, str]] = {}
+
+
+def build_fingerprint(templates: Jinja2Templates) -> str:
+  """
+  Returns a short hash of the asset manifest and every template's source,
+  so anything cached by the data version alone can also tell one deploy's HTML from another's.
+  It is computed once, or again whenever a template's mtime changes while templates auto-reload.
+  """
+
+  directory = templates.env.loader.searchpath[0]
+  stamp, fingerprint = _fingerprints.get(directory, (None, ''))
+  if stamp is not None and not templates.env.auto_reload:
+    return fingerprint
+
+  names = sorted(templates.env.list_templates(extensions=[ext.lstrip('.') for ext in TEMPLATE_EXTENSIONS]))
+  paths = [os.path.join(directory, name) for name in names]
+  new_stamp = (json.dumps(manifest, sort_keys=True), tuple(os.stat(path).st_mtime_ns for path in paths))
+  if new_stamp == stamp:
+    return fingerprint
+
+  digest = hashlib.blake2b(new_stamp[0].encode(), digest_size=8)
+  for name, path in zip(names, paths):
+    with open(path, 'rb') as template_file:
+      digest.update(name.encode() + b'\0' + template_file.read() + b'\0')
+
+  fingerprint = digest.hexdigest()
+  _fingerprints[directory] = (new_stamp, fingerprint)
+  return fingerprint
@@ -0,0 +1,410 @@
+"""
+This module provides a tiered storage engine for the app.
+
+`TieredEngine` has the same interface as `StorageEngine`,
+but only keeps recently active owners' lists, items, and selections in memory.
+Everything else stays in a SQLite database and loads one owner at a time on first access,
+so memory scales with active users rather than with total users.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import sys
+import threading
+
+from app.utils.metrics import tier_evictions, tier_loads
+from app.utils.sqlite_storage import OWNERS_SCOPE, SqliteEngine
+from app.utils.storage import LISTS_TABLE, ITEMS_TABLE, SELECTED_TABLE
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------------------
+
+def _doc_size(doc: dict) -> int:
+  # Keys are shared field names, so only the dict and its values count
+  return sys.getsizeof(doc) + sum(sys.getsizeof(value) for value in doc.values())
+
+
+def _page(
+  docs: Iterable[Tuple[int, dict]],
+  after: Optional[int],
+  limit: Optional[int],
+  where: Optional[dict]
+) -> List[Tuple[int, dict]]:
+  matches = []
+  for doc_id, doc in docs:
+    if after is not None and doc_id <= after:
+      continue
+    if where and any(doc.get(key) != expected for key, expected in where.items()):
+      continue
+
+    matches.append((doc_id, dict(doc)))
+    if limit is not None and len(matches) >= limit:
+      break
+
+  return matches
+
+
+# --------------------------------------------------------------------------------
+# OwnerSet Class
+# --------------------------------------------------------------------------------
+
+class OwnerSet:
+  """One owner's resident docs: lists, items grouped by list, and the selection."""
+
+  def __init__(self, version: Optional[str]) -> None:
+    self.version = version
+    self.lists: Dict[int, dict] = {}
+    self.items: Dict[int, Dict[int, dict]] = {}
+    self.selected: Dict[int, dict] = {}
+    self.size = sys.getsizeof(self)
+
+
+# --------------------------------------------------------------------------------
+# TieredEngine Class
+# --------------------------------------------------------------------------------
+
+class TieredEngine:
+  """
+  Keeps a working set of owners in memory on top of a `SqliteEngine`, which holds every owner.
+  An owner's lists, items, and selection load together on first access
+  and stay resident, least recently used first out,
+  while at most `max_owners` owners totalling about `memory_budget` bytes are resident.
+  The most recently used owner always stays, even if it alone is over the budget.
+
+  Writes go through to SQLite in the same transaction and then update the resident copy,
+  so evicting an owner never loses data.
+  If a transaction raises, the owners it touched are evicted and reload on next access.
+  Versions, session revocations, and other tables are served by SQLite directly.
+
+  With `shared`, other processes may write to the same database,
+  so each access to a resident owner first checks the owner's version in SQLite (one lookup)
+  and reloads the owner if another process changed it.
+  """
+
+  def __init__(
+    self,
+    cold: SqliteEngine,
+    max_owners: int = 10000,
+    memory_budget: int = 64 * 1024 * 1024,
+    shared: bool = False
+  ) -> None:
+    self.max_owners = max_owners
+    self.memory_budget = memory_budget
+    self.shared = shared
+
+    self._cold = cold
+    self._lock = threading.RLock()
+    self._depth = 0
+    self._touched: Set[str] = set()
+    self._owners: OrderedDict[str, OwnerSet] = OrderedDict()
+    self._list_owners: Dict[int, str] = {}
+    self._item_lists: Dict[int, int] = {}
+    self._selected_owners: Dict[int, str] = {}
+    self._size = 0
+
+
+  # Properties
+
+  @property
+  def resident_owners(self) -> int:
+    return len(self._owners)
+
+
+  @property
+  def resident_bytes(self) -> int:
+    return self._size
+
+
+  # Private Methods
+
+  def _owner_version(self, owner: str) -> Optional[str]:
+    return self._cold.version(OWNERS_SCOPE, 'owner', owner) if self.shared else None
+
+
+  def _load(self, owner: str) -> OwnerSet:
+    # The version is read first, so a write landing mid-load only causes one more reload
+    owned = OwnerSet(self._owner_version(owner))
+    docs = self._cold.owner_docs(owner)
+
+    self._owners[owner] = owned
+    self._size += owned.size
+    for list_id, doc in docs[LISTS_TABLE]:
+      self._put(owned, owner, LISTS_TABLE, list_id, doc)
+    for item_id, doc in docs[ITEMS_TABLE]:
+      self._put(owned, owner, ITEMS_TABLE, item_id, doc)
+    for doc_id, doc in docs[SELECTED_TABLE]:
+      self._put(owned, owner, SELECTED_TABLE, doc_id, doc)
+
+    tier_loads.labels().inc()
+    return owned
+
+
+  def _evict(self, owner: str, reason: str) -> None:
+    owned = self._owners.pop(owner, None)
+    if owned is None:
+      return
+
+    for list_id, items in owned.items.items():
+      self._list_owners.pop(list_id, None)
+      for item_id in items:
+        self._item_lists.pop(item_id, None)
+    for doc_id in owned.selected:
+      self._selected_owners.pop(doc_id, None)
+
+    self._size -= owned.size
+    tier_evictions.labels(reason).inc()
+
+
+  def _trim(self) -> None:
+    while len(self._owners) > 1 and (len(self._owners) > self.max_owners or self._size > self.memory_budget):
+      self._evict(next(iter(self._owners)), 'budget')
+
+
+  def _resident(self, owner: str) -> OwnerSet:
+    owned = self._owners.get(owner)
+
+    if owned is not None and self.shared and owned.version != self._owner_version(owner):
+      self._evict(owner, 'stale')
+      owned = None
+
+    if owned is None:
+      owned = self._load(owner)
+      self._trim()
+    else:
+      self._owners.move_to_end(owner)
+
+    return owned
+
+
+  def _list_owner(self, list_id: int) -> Optional[str]:
+    owner = self._list_owners.get(list_id)
+    if owner is None:
+      reminder_list = self._cold.get(LISTS_TABLE, list_id)
+      owner = reminder_list['owner'] if reminder_list else None
+    return owner
+
+
+  def _resize(self, owned: OwnerSet, old_doc: Optional[dict], doc: Optional[dict]) -> None:
+    delta = (_doc_size(doc) if doc is not None else 0) - (_doc_size(old_doc) if old_doc is not None else 0)
+    owned.size += delta
+    self._size += delta
+
+
+  def _put(self, owned: OwnerSet, owner: str, table: str, doc_id: int, doc: dict) -> None:
+    if table == LISTS_TABLE:
+      self._resize(owned, owned.lists.get(doc_id), doc)
+      owned.lists[doc_id] = doc
+      owned.items.setdefault(doc_id, {})
+      self._list_owners[doc_id] = owner
+
+    elif table == ITEMS_TABLE:
+      old_list_id = self._item_lists.get(doc_id)
+      if old_list_id is not None and old_list_id != doc['list_id']:
+        self._pop(owned, ITEMS_TABLE, doc_id)
+
+      items = owned.items.setdefault(doc['list_id'], {})
+      self._resize(owned, items.get(doc_id), doc)
+      items[doc_id] = doc
+      self._item_lists[doc_id] = doc['list_id']
+
+    else:
+      self._resize(owned, owned.selected.get(doc_id), doc)
+      owned.selected[doc_id] = doc
+      self._selected_owners[doc_id] = owner
+
+
+  def _pop(self, owned: OwnerSet, table: str, doc_id: int) -> None:
+    if table == LISTS_TABLE:
+      # A removed list's items can no longer be reached, so they go with it
+      for item_id in list(owned.items.get(doc_id, {})):
+        self._pop(owned, ITEMS_TABLE, item_id)
+      self._resize(owned, owned.lists.pop(doc_id, None), None)
+      owned.items.pop(doc_id, None)
+      self._list_owners.pop(doc_id, None)
+
+    elif table == ITEMS_TABLE:
+      list_id = self._item_lists.pop(doc_id, None)
+      items = owned.items.get(list_id, {})
+      self._resize(owned, items.pop(doc_id, None), None)
+      if not items and list_id not in owned.lists:
+        owned.items.pop(list_id, None)
+
+    else:
+      self._resize(owned, owned.selected.pop(doc_id, None), None)
+      self._selected_owners.pop(doc_id, None)
+
+
+  def _writable(self, owner: Optional[str]) -> Optional[OwnerSet]:
+    # Returns the owner's resident docs, if any, for a write to update once SQLite has it.
+    # With `shared`, they are checked first: the write transaction keeps other processes out,
+    # so the checked docs plus this write match SQLite.
+    if owner is None:
+      return None
+
+    self._touched.add(owner)
+    if self.shared and owner in self._owners:
+      return self._resident(owner)
+    return self._owners.get(owner)
+
+
+  def _resident_doc(self, owned: OwnerSet, table: str, doc_id: int) -> Optional[dict]:
+    if table == LISTS_TABLE:
+      return owned.lists.get(doc_id)
+    elif table == ITEMS_TABLE:
+      return owned.items.get(self._item_lists.get(doc_id), {}).get(doc_id)
+    return owned.selected.get(doc_id)
+
+
+  def _new_doc_owner(self, table: str, doc: dict) -> Optional[str]:
+    if table in (LISTS_TABLE, SELECTED_TABLE):
+      return doc.get('owner')
+    elif table == ITEMS_TABLE:
+      return self._list_owner(doc['list_id'])
+    return None
+
+
+  def _doc_owner(self, table: str, doc_id: int) -> Optional[str]:
+    if table == LISTS_TABLE:
+      return self._list_owner(doc_id)
+    elif table == ITEMS_TABLE:
+      list_id = self._item_lists.get(doc_id)
+      if list_id is None:
+        item = self._cold.get(ITEMS_TABLE, doc_id)
+        list_id = item['list_id'] if item else None
+      return self._list_owner(list_id) if list_id is not None else None
+    elif table == SELECTED_TABLE:
+      owner = self._selected_owners.get(doc_id)
+      if owner is None:
+        selected = self._cold.get(SELECTED_TABLE, doc_id)
+        owner = selected['owner'] if selected else None
+      return owner
+    return None
+
+
+  def _stamp_touched(self) -> None:
+    # Inside the write transaction no other process can commit,
+    # so the owners' versions now cover exactly this process's view of them
+    for owner in self._touched:
+      owned = self._owners.get(owner)
+      if owned is not None:
+        owned.version = self._owner_version(owner)
+
+
+  # Transactions
+
+  @contextmanager
+  def transaction(self) -> Iterator[None]:
+    with self._lock:
+      outermost = self._depth == 0
+      self._depth += 1
+      try:
+        with self._cold.transaction():
+          yield
+          if outermost and self.shared:
+            self._stamp_touched()
+      except BaseException:
+        if outermost:
+          for owner in self._touched:
+            self._evict(owner, 'rollback')
+        raise
+      finally:
+        self._depth -= 1
+        if outermost:
+          self._touched = set()
+
+
+  # Reads
+
+  def get(self, table: str, doc_id: int) -> Optional[dict]:
+    if table not in (LISTS_TABLE, ITEMS_TABLE):
+      return self._cold.get(table, doc_id)
+
+    with self._lock:
+      owner = self._doc_owner(table, doc_id)
+      if owner is None:
+        return None
+
+      doc = self._resident_doc(self._resident(owner), table, doc_id)
+      return dict(doc) if doc is not None else None
+
+
+  def all(self, table: str) -> List[Tuple[int, dict]]:
+    return self._cold.all(table)
+
+
+  def find(
+    self,
+    table: str,
+    field: str,
+    value: Any,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    where: Optional[dict] = None
+  ) -> List[Tuple[int, dict]]:
+    """Finds docs like `StorageEngine.find`, from memory for lookups by owner or list."""
+
+    with self._lock:
+      if table in (LISTS_TABLE, SELECTED_TABLE) and field == 'owner':
+        owned = self._resident(value)
+        docs = owned.lists if table == LISTS_TABLE else owned.selected
+        return _page(docs.items(), after, limit, where)
+
+      if table == ITEMS_TABLE and field == 'list_id':
+        owner = self._list_owner(value)
+        if owner is not None:
+          owned = self._resident(owner)
+          return _page(owned.items.get(value, {}).items(), after, limit, where)
+
+      return self._cold.find(table, field, value, after, limit, where)
+
+
+  def version(self, table: str, field: str, value: Any) -> str:
+    return self._cold.version(table, field, value)
+
+
+  # Writes
+
+  def insert(self, table: str, doc: dict) -> int:
+    with self.transaction():
+      owner = self._new_doc_owner(table, doc)
+      owned = self._writable(owner)
+      doc_id = self._cold.insert(table, doc)
+      if owned is not None:
+        self._put(owned, owner, table, doc_id, dict(doc))
+        self._trim()
+      return doc_id
+
+
+  def update(self, table: str, doc_id: int, fields: dict) -> None:
+    with self.transaction():
+      owner = self._doc_owner(table, doc_id)
+      owned = self._writable(owner)
+      self._cold.update(table, doc_id, fields)
+      old_doc = self._resident_doc(owned, table, doc_id) if owned is not None else None
+      if old_doc is not None:
+        self._put(owned, owner, table, doc_id, {**old_doc, **fields})
+        self._trim()
+
+
+  def remove(self, table: str, doc_ids: List[int]) -> None:
+    with self.transaction():
+      targets = [(doc_id, self._doc_owner(table, doc_id)) for doc_id in doc_ids]
+      resident = [(doc_id, self._writable(owner)) for doc_id, owner in targets]
+      self._cold.remove(table, doc_ids)
+      for doc_id, owned in resident:
+        if owned is not None:
+          self._pop(owned, table, doc_id)
+
+
+  # Lifecycle
+
+  def close(self) -> None:
+    self._cold.close()
@@ -0,0 +1,214 @@
+"""
+This module traces slow requests.
+
+A sampled request collects timed spans for its auth check, storage setup, storage calls,
+template renders, and response serialization.
+If the request turns out slower than the threshold, its spans are logged as one JSON record;
+otherwise they are dropped. Requests that are not sampled record nothing.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import functools
+import json
+import logging
+import random
+import time
+
+from contextvars import ContextVar
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from typing import Any, Callable, Coroutine, List, Optional, Tuple, TypeVar
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+# --------------------------------------------------------------------------------
+# RequestTrace Class
+# --------------------------------------------------------------------------------
+
+class RequestTrace:
+  """The spans recorded for one sampled request, as (name, start, duration) in seconds."""
+
+  def __init__(self, max_spans: int) -> None:
+    self.start = time.perf_counter()
+    self.spans: List[Tuple[str, float, float]] = []
+    self.dropped = 0
+    self.max_spans = max_spans
+
+
+  def add(self, name: str, start: float, duration: float) -> None:
+    # Spans may come from storage threads, and list appends are atomic
+    if len(self.spans) < self.max_spans:
+      self.spans.append((name, start - self.start, duration))
+    else:
+      self.dropped += 1
+
+
+  def to_record(self, method: str, path: str, status: int, duration: float) -> dict:
+    spans = sorted(self.spans, key=lambda span: span[1])
+    return {
+      'method': method,
+      'path': path,
+      'status': status,
+      'duration_ms': round(duration * 1000, 3),
+      'spans': [
+        {'name': name, 'start_ms': round(start * 1000, 3), 'duration_ms': round(elapsed * 1000, 3)}
+        for name, start, elapsed in spans],
+      'dropped_spans': self.dropped}
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)
+
+
+# --------------------------------------------------------------------------------
+# Span Helpers
+# --------------------------------------------------------------------------------
+
+def record_span(name: str, start: float, duration: float) -> None:
+  """Adds a span to the current request's trace, if it is being traced."""
+
+  trace = _current_trace.get()
+  if trace is not None:
+    trace.add(name, start, duration)
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable[..., T]], Callable[..., T]]:
+  """Decorates a function to record a span named `name` or else its qualified name."""
+
+  def decorate(func: Callable[..., T]) -> Callable[..., T]:
+    span_name = name or func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+      if _current_trace.get() is None:
+        return func(*args, **kwargs)
+
+      start = time.perf_counter()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        record_span(span_name, start, time.perf_counter() - start)
+
+    return wrapper
+  return decorate
+
+
+def _traced_endpoint(call: Callable[..., Any]) -> Callable[..., Any]:
+  # FastAPI awaits the endpoint only if it is a coroutine function, so the wrapper must match
+  if asyncio.iscoroutinefunction(call):
+    @functools.wraps(call)
+    async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+      start = time.perf_counter()
+      try:
+        return await call(*args, **kwargs)
+      finally:
+        record_span('endpoint', start, time.perf_counter() - start)
+    return async_wrapper
+
+  return traced('endpoint')(call)
+
+
+# --------------------------------------------------------------------------------
+# TracedRoute Class
+# --------------------------------------------------------------------------------
+
+class TracedRoute(APIRoute):
+  """
+  A route that splits a traced request into `dependencies`, `endpoint`, and `serialization` spans.
+  Serialization covers response model validation, JSON encoding, and building the response.
+  """
+
+  def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+    self.dependant.call = _traced_endpoint(self.dependant.call)
+    handler = super().get_route_handler()
+
+    async def traced_handler(request: Request) -> Response:
+      trace = _current_trace.get()
+      if trace is None:
+        return await handler(request)
+
+      start = time.perf_counter()
+      marker = len(trace.spans)
+      try:
+        return await handler(request)
+      finally:
+        end = time.perf_counter()
+        endpoint = next((span for span in trace.spans[marker:] if span[0] == 'endpoint'), None)
+        if endpoint:
+          endpoint_start = trace.start + endpoint[1]
+          endpoint_end = endpoint_start + endpoint[2]
+          trace.add('dependencies', start, endpoint_start - start)
+          trace.add('serialization', endpoint_end, end - endpoint_end)
+
+    return traced_handler
+
+
+# --------------------------------------------------------------------------------
+# TracingMiddleware Class
+# --------------------------------------------------------------------------------
+
+class TracingMiddleware:
+  """
+  Traces a `sample_rate` fraction of requests and logs those slower than `threshold` seconds.
+  The `send` span runs from the response start to its last body chunk,
+  which includes streamed serialization and compression.
+  Event streams are never logged, since they stay open for as long as the page does.
+  """
+
+  def __init__(
+    self,
+    app: ASGIApp,
+    threshold: float = 0.5,
+    sample_rate: float = 0.1,
+    max_spans: int = 200
+  ) -> None:
+    self.app = app
+    self.threshold = threshold
+    self.sample_rate = sample_rate
+    self.max_spans = max_spans
+
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope['type'] != 'http' or random.random() >= self.sample_rate:
+      await self.app(scope, receive, send)
+      return
+
+    trace = RequestTrace(self.max_spans)
+    token = _current_trace.set(trace)
+    status = 500
+    streaming = False
+    send_start = 0.0
+
+    async def send_with_trace(message: Message) -> None:
+      nonlocal status, streaming, send_start
+      if message['type'] == 'http.response.start':
+        status = message['status']
+        streaming = Headers(raw=message['headers']).get('content-type', '').startswith('text/event-stream')
+        send_start = time.perf_counter()
+      await send(message)
+      if message['type'] == 'http.response.body' and not message.get('more_body', False):
+        trace.add('send', send_start, time.perf_counter() - send_start)
+
+    try:
+      await self.app(scope, receive, send_with_trace)
+    finally:
+      _current_trace.reset(token)
+      duration = time.perf_counter() - trace.start
+      if duration >= self.threshold and not streaming:
+        record = trace.to_record(scope['method'], scope['path'], status, duration)
+        logger.warning("Slow request: %s", json.dumps(record), extra={'slow_request': record})
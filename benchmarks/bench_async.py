@@ -0,0 +1,113 @@
+"""
+This module load-tests read latency while other clients write, with and without storage offloading.
+
+Writers toggle items through the API while readers load the reminders page.
+The storage is a durable write-behind JSON backend, so every write waits for an fsync.
+With storage calls running inline, those waits stall the event loop and every reader queues behind them.
+With the storage executor, only the writers wait.
+
+Run it from the project root:
+
+  python -m benchmarks.bench_async --writers 8 --readers 8 --seconds 5
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from app.main import app
+from app.utils.auth import auth_cookie_name, serialize_token
+from app.utils.backends import JsonBackend
+from app.utils.events import ChangeHub
+from app.utils.storage import ReminderStorage, StorageEngine
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+
+# --------------------------------------------------------------------------------
+# Load Generation
+# --------------------------------------------------------------------------------
+
+async def write_loop(client: httpx.AsyncClient, item_ids: List[int], deadline: float) -> None:
+  i = 0
+  while time.monotonic() < deadline:
+    await client.patch(f'/api/reminders/items/strike/{item_ids[i % len(item_ids)]}')
+    i += 1
+
+
+async def read_loop(client: httpx.AsyncClient, deadline: float, latencies: List[float]) -> None:
+  while time.monotonic() < deadline:
+    start = time.perf_counter()
+    await client.get('/reminders')
+    latencies.append(time.perf_counter() - start)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+  return statistics.quantiles(samples, n=100)[int(pct) - 1] if len(samples) > 1 else samples[0]
+
+
+async def run_mode(db_path: str, threads: int, args: argparse.Namespace) -> List[float]:
+  backend = JsonBackend(db_path, write_behind=True, max_delay=args.max_delay, fsync=True)
+  engine = StorageEngine(backend)
+  storage = ReminderStorage(owner='pythonista', engine=engine)
+  list_id = storage.create_list('Load test')
+  storage.set_selected_list(list_id)
+  item_ids = [storage.add_item(list_id, f'Item {i}') for i in range(50)]
+
+  app.state.storage_engine = engine
+  app.state.storage_executor = ThreadPoolExecutor(threads) if threads else None
+  app.state.change_hub = ChangeHub()
+
+  cookies = {auth_cookie_name: serialize_token('pythonista')}
+  transport = httpx.ASGITransport(app=app)
+  latencies: List[float] = []
+  deadline = time.monotonic() + args.seconds
+
+  async with httpx.AsyncClient(transport=transport, base_url='http://bench', cookies=cookies) as client:
+    await asyncio.gather(
+      *[write_loop(client, item_ids, deadline) for _ in range(args.writers)],
+      *[read_loop(client, deadline, latencies) for _ in range(args.readers)])
+
+  if app.state.storage_executor:
+    app.state.storage_executor.shutdown()
+  engine.close()
+  return latencies
+
+
+# --------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument('--writers', type=int, default=8)
+  parser.add_argument('--readers', type=int, default=8)
+  parser.add_argument('--seconds', type=float, default=5.0)
+  parser.add_argument('--threads', type=int, default=8)
+  parser.add_argument('--max-delay', type=float, default=0.01)
+  args = parser.parse_args()
+
+  print(f"writers={args.writers} readers={args.readers} seconds={args.seconds}")
+
+  for mode, threads in (('inline', 0), ('executor', args.threads)):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      latencies = asyncio.run(run_mode(os.path.join(tmp_dir, 'reminder_db.json'), threads, args))
+
+    print(
+      f"  {mode:>8}: {len(latencies):6d} page loads, "
+      f"p50 {percentile(latencies, 50) * 1000:8.2f} ms, "
+      f"p99 {percentile(latencies, 99) * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,151 @@
+"""
+This module measures what response compression costs and saves for real Bulldoggy payloads.
+
+It renders the reminders page and the items JSON for lists of growing size,
+then runs each body through CompressionMiddleware with gzip and brotli.
+For each payload it prints the bytes saved, the CPU time spent per response,
+and the break-even link speed: on links slower than that, compressing finishes the response sooner.
+The smallest payload that breaks even on `--link-mbps` is a good `minimum_size` for config.json.
+
+Run it from the project root:
+
+  python -m benchmarks.bench_compression --link-mbps 100
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from app.main import app
+from app.utils.auth import auth_cookie_name, serialize_token
+from app.utils.backends import JsonBackend
+from app.utils.compression import CompressionMiddleware
+from app.utils.events import ChangeHub
+from app.utils.storage import ReminderStorage, StorageEngine
+
+from typing import List, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Payloads
+# --------------------------------------------------------------------------------
+
+async def render_payloads(db_path: str, sizes: List[int]) -> List[Tuple[str, str, bytes]]:
+  engine = StorageEngine(JsonBackend(db_path))
+  storage = ReminderStorage(owner='pythonista', engine=engine)
+  app.state.storage_engine = engine
+  app.state.storage_executor = None
+  app.state.change_hub = ChangeHub()
+
+  cookies = {auth_cookie_name: serialize_token('pythonista')}
+  headers = {'Accept-Encoding': 'identity'}
+  transport = httpx.ASGITransport(app=app)
+  payloads = []
+
+  async with httpx.AsyncClient(transport=transport, base_url='http://bench', cookies=cookies, headers=headers) as client:
+    for size in sizes:
+      list_id = storage.create_list(f'{size} items')
+      storage.set_selected_list(list_id)
+      for i in range(size):
+        storage.add_item(list_id, f'Reminder number {i} for the week')
+
+      page = await client.get('/reminders')
+      items = await client.get(f'/api/reminders/{list_id}/items')
+      payloads.append((f'page/{size}', page.headers['content-type'], page.content))
+      payloads.append((f'items/{size}', items.headers['content-type'], items.content))
+
+  engine.close()
+  return payloads
+
+
+# --------------------------------------------------------------------------------
+# Measurement
+# --------------------------------------------------------------------------------
+
+def body_app(content_type: str, body: bytes):
+  async def send_body(scope, receive, send):
+    await send({
+      'type': 'http.response.start',
+      'status': 200,
+      'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+  return send_body
+
+
+async def measure(content_type: str, body: bytes, encoding: str, iterations: int) -> Tuple[int, float]:
+  middleware = CompressionMiddleware(body_app(content_type, body), minimum_size=0)
+  scope = {'type': 'http', 'headers': [(b'accept-encoding', encoding.encode())]}
+  sent: List[bytes] = []
+
+  async def receive():
+    return {'type': 'http.request', 'body': b''}
+
+  async def send(message):
+    if message['type'] == 'http.response.body':
+      sent.append(message['body'])
+
+  start = time.perf_counter()
+  for _ in range(iterations):
+    sent.clear()
+    await middleware(scope, receive, send)
+  elapsed = (time.perf_counter() - start) / iterations
+
+  return sum(len(chunk) for chunk in sent), elapsed
+
+
+def break_even_mbps(original: int, compressed: int, seconds: float) -> Optional[float]:
+  saved_bits = (original - compressed) * 8
+  return saved_bits / seconds / 1e6 if saved_bits > 0 else None
+
+
+# --------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument('--sizes', type=int, nargs='+', default=[0, 1, 5, 20, 100, 500])
+  parser.add_argument('--iterations', type=int, default=200)
+  parser.add_argument('--link-mbps', type=float, default=100.0)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    payloads = asyncio.run(render_payloads(os.path.join(tmp_dir, 'reminder_db.json'), args.sizes))
+
+  print(f"{'payload':>12} {'enc':>5} {'bytes':>8} {'sent':>8} {'cpu us':>9} {'break-even':>12}")
+  results: List[Tuple[int, bool]] = []
+
+  for name, content_type, body in payloads:
+    pays_off = False
+    for encoding in ('gzip', 'br'):
+      sent, seconds = asyncio.run(measure(content_type, body, encoding, args.iterations))
+      mbps = break_even_mbps(len(body), sent, seconds)
+      pays_off = pays_off or bool(mbps and mbps >= args.link_mbps)
+      print(
+        f"{name:>12} {encoding:>5} {len(body):8d} {sent:8d} {seconds * 1e6:9.1f} "
+        f"{f'{mbps:8.0f} Mbps' if mbps else 'never':>12}")
+    results.append((len(body), pays_off))
+
+  # The threshold is the smallest size from which every larger payload also pays off
+  threshold = None
+  for size, pays_off in sorted(results, reverse=True):
+    if not pays_off:
+      break
+    threshold = size
+
+  if threshold is None:
+    print(f"Compression does not pay off on a {args.link_mbps:g} Mbps link for the largest payload")
+  else:
+    print(f"Compression pays off on a {args.link_mbps:g} Mbps link from about {threshold} bytes")
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,97 @@
+"""
+This module benchmarks reminder page loads with and without secondary indexes.
+
+Run it from the project root:
+
+  python -m benchmarks.bench_indexes --items 1000000
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from app.utils.backends import JsonBackend
+from app.utils.storage import INDEXES, ReminderStorage, StorageEngine
+
+
+# --------------------------------------------------------------------------------
+# Seeding
+# --------------------------------------------------------------------------------
+
+def seed_db(db_path: str, users: int, lists_per_user: int, items: int) -> None:
+  lists = {}
+  selected = {}
+  for user in range(users):
+    for _ in range(lists_per_user):
+      list_id = len(lists) + 1
+      lists[str(list_id)] = {'name': f'List {list_id}', 'owner': f'user{user}'}
+    selected[str(user + 1)] = {'owner': f'user{user}', 'list_id': list_id}
+
+  reminder_items = {
+    str(item_id): {
+      'list_id': (item_id - 1) % len(lists) + 1,
+      'description': f'Item {item_id}',
+      'completed': item_id % 3 == 0}
+    for item_id in range(1, items + 1)}
+
+  data = {'reminder_lists': lists, 'reminder_items': reminder_items, 'selected_lists': selected}
+  with open(db_path, 'w') as db_json:
+    json.dump(data, db_json)
+
+
+# --------------------------------------------------------------------------------
+# Measurement
+# --------------------------------------------------------------------------------
+
+def time_page_loads(engine: StorageEngine, users: int, loads: int) -> float:
+  owners = [f'user{random.randrange(users)}' for _ in range(loads)]
+
+  start = time.perf_counter()
+  for owner in owners:
+    storage = ReminderStorage(owner=owner, engine=engine)
+    storage.get_lists()
+    storage.get_selected_list()
+  
+  return (time.perf_counter() - start) / loads
+
+
+# --------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument('--items', type=int, default=1_000_000)
+  parser.add_argument('--users', type=int, default=10_000)
+  parser.add_argument('--lists-per-user', type=int, default=5)
+  parser.add_argument('--loads', type=int, default=20)
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  random.seed(args.seed)
+  results = {}
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    db_path = os.path.join(tmp_dir, 'reminder_db.json')
+    seed_db(db_path, args.users, args.lists_per_user, args.items)
+
+    for mode, indexes in (('scan', {}), ('index', INDEXES)):
+      engine = StorageEngine(JsonBackend(db_path), indexes=indexes)
+      results[mode] = time_page_loads(engine, args.users, args.loads)
+      engine.close()
+  
+  print(f"items={args.items} users={args.users} lists/user={args.lists_per_user}")
+  for mode, seconds in results.items():
+    print(f"  {mode:>5}: {seconds * 1000:10.3f} ms per page load")
+  print(f"  speedup: {results['scan'] / results['index']:.0f}x")
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,385 @@
+"""
+This module load-tests the reminders app by replaying a weighted trace of requests.
+
+It seeds a database with synthetic users, lists, and items in a scratch directory,
+boots `app.main:app` in-process (through httpx) or under uvicorn,
+and runs concurrent virtual users that each pick requests from the trace.
+It reports RPS and p50/p95/p99 latency per route as JSON,
+so runs on different commits can be compared with `--baseline`.
+
+A trace is JSON lines, one request shape per line:
+
+  {"name": "api-items", "method": "GET", "path": "/api/reminders/{list_id}/items", "weight": 10}
+
+Paths may use `{list_id}` and `{item_id}`, which are filled with the virtual user's own data.
+Lines may also give a `json` or `form` body, and `"htmx": true` to send HTMX request headers.
+
+Run it from the project root:
+
+  python -m benchmarks.bench_load --items 100000 --seconds 10 --output results.json
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+
+# --------------------------------------------------------------------------------
+# Parameters
+# --------------------------------------------------------------------------------
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TRACE = os.path.join(ROOT, 'benchmarks', 'traces', 'default.jsonl')
+
+
+# --------------------------------------------------------------------------------
+# Traces
+# --------------------------------------------------------------------------------
+
+@dataclass
+class TraceEntry:
+  name: str
+  method: str
+  path: str
+  weight: float = 1.0
+  json: Optional[Any] = None
+  form: Optional[Dict[str, str]] = None
+  htmx: bool = False
+
+
+def load_trace(trace_path: str) -> List[TraceEntry]:
+  with open(trace_path) as trace_file:
+    return [TraceEntry(**json.loads(line)) for line in trace_file if line.strip()]
+
+
+# --------------------------------------------------------------------------------
+# Seeding
+# --------------------------------------------------------------------------------
+
+@dataclass
+class Dataset:
+  users: int
+  lists_per_user: int
+  items: int
+
+  @property
+  def list_count(self) -> int:
+    return self.users * self.lists_per_user
+
+
+  def username(self, user: int) -> str:
+    return f'user{user}'
+
+
+  def pick_list(self, user: int, rng: random.Random) -> int:
+    return user * self.lists_per_user + rng.randrange(self.lists_per_user) + 1
+
+
+  def pick_item(self, user: int, rng: random.Random) -> Optional[int]:
+    # Seeded items are dealt round-robin, so list L holds items L, L + lists, L + 2 * lists, ...
+    list_id = self.pick_list(user, rng)
+    if list_id > self.items:
+      return None
+    count = (self.items - list_id) // self.list_count + 1
+    return list_id + rng.randrange(count) * self.list_count
+
+
+def prepare_workdir(workdir: str, dataset: Dataset, backend: str) -> None:
+  """Writes a config.json for the app, linking in the real templates and static files."""
+
+  with open(os.path.join(ROOT, 'config.json')) as config_json:
+    config = json.load(config_json)
+
+  # Virtual users sign their own tokens, so they share one password hash just to be known users
+  password_hash = next(iter(config['users'].values()))
+  config['users'] = {dataset.username(user): password_hash for user in range(dataset.users)}
+  config['db_backend'] = backend
+  config['db_path'] = 'reminder_db.sqlite' if backend in ('sqlite', 'tiered') else 'reminder_db.json'
+
+  with open(os.path.join(workdir, 'config.json'), 'w') as config_json:
+    json.dump(config, config_json, indent=2)
+  for name in ('templates', 'static'):
+    os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+
+
+def seed_workdir(workdir: str, dataset: Dataset, backend: str) -> None:
+  """Seeds the database; call it from inside `workdir`, since importing the app reads its config."""
+
+  from app.utils.sqlite_storage import SqliteEngine, import_json
+  from benchmarks.bench_indexes import seed_db
+
+  json_path = os.path.join(workdir, 'reminder_db.json')
+  seed_db(json_path, dataset.users, dataset.lists_per_user, dataset.items)
+
+  if backend in ('sqlite', 'tiered'):
+    engine = SqliteEngine(os.path.join(workdir, 'reminder_db.sqlite'))
+    import_json(json_path, engine)
+    engine.close()
+
+
+# --------------------------------------------------------------------------------
+# Targets
+# --------------------------------------------------------------------------------
+
+@contextlib.asynccontextmanager
+async def in_process_target() -> AsyncIterator[Dict[str, Any]]:
+  from app.main import app
+
+  async with app.router.lifespan_context(app):
+    yield {'transport': httpx.ASGITransport(app=app), 'base_url': 'http://bench'}
+
+
+def _free_port() -> int:
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def uvicorn_target(workdir: str, workers: int) -> AsyncIterator[Dict[str, Any]]:
+  port = _free_port()
+  env = dict(os.environ, PYTHONPATH=ROOT)
+  command = [
+    sys.executable, '-m', 'uvicorn', 'app.main:app',
+    '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+  server = subprocess.Popen(command, cwd=workdir, env=env)
+  base_url = f'http://127.0.0.1:{port}'
+
+  try:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+      for _ in range(300):
+        if server.poll() is not None:
+          raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+        try:
+          await client.get('/login')
+          break
+        except httpx.TransportError:
+          await asyncio.sleep(0.1)
+
+    yield {'base_url': base_url}
+  finally:
+    server.terminate()
+    server.wait()
+
+
+# --------------------------------------------------------------------------------
+# Load Generation
+# --------------------------------------------------------------------------------
+
+@dataclass
+class RouteSamples:
+  latencies: List[float] = field(default_factory=list)
+  errors: int = 0
+
+
+async def virtual_user(
+  client: httpx.AsyncClient,
+  user: int,
+  dataset: Dataset,
+  trace: List[TraceEntry],
+  rng: random.Random,
+  measure_from: float,
+  deadline: float,
+  samples: Dict[str, RouteSamples]
+) -> None:
+  weights = [entry.weight for entry in trace]
+
+  while time.monotonic() < deadline:
+    entry = rng.choices(trace, weights)[0]
+    item_id = dataset.pick_item(user, rng) if '{item_id}' in entry.path else None
+    if '{item_id}' in entry.path and item_id is None:
+      await asyncio.sleep(0)
+      continue
+
+    path = entry.path.format(list_id=dataset.pick_list(user, rng), item_id=item_id)
+    headers = {'HX-Request': 'true'} if entry.htmx else None
+
+    start = time.perf_counter()
+    try:
+      response = await client.request(entry.method, path, json=entry.json, data=entry.form, headers=headers)
+      failed = response.status_code >= 400
+    except httpx.HTTPError:
+      failed = True
+    elapsed = time.perf_counter() - start
+
+    if time.monotonic() >= measure_from:
+      route = samples.setdefault(entry.name, RouteSamples())
+      route.latencies.append(elapsed)
+      route.errors += failed
+
+
+async def run_load(args: argparse.Namespace, workdir: str, dataset: Dataset, trace: List[TraceEntry]) -> Dict[str, RouteSamples]:
+  from app.utils.auth import auth_cookie_name, serialize_token
+
+  if args.target == 'uvicorn':
+    target = uvicorn_target(workdir, args.workers)
+  else:
+    target = in_process_target()
+
+  samples: Dict[str, RouteSamples] = {}
+  rng = random.Random(args.seed)
+
+  async with target as client_options:
+    clients = []
+    users = []
+    for i in range(args.concurrency):
+      user = i % dataset.users
+      cookies = {auth_cookie_name: serialize_token(dataset.username(user))}
+      clients.append(httpx.AsyncClient(cookies=cookies, timeout=30.0, **client_options))
+      users.append(user)
+
+    measure_from = time.monotonic() + args.warmup
+    deadline = measure_from + args.seconds
+    try:
+      await asyncio.gather(*[
+        virtual_user(client, user, dataset, trace, random.Random(rng.random()), measure_from, deadline, samples)
+        for client, user in zip(clients, users)])
+    finally:
+      for client in clients:
+        await client.aclose()
+
+  return samples
+
+
+# --------------------------------------------------------------------------------
+# Reporting
+# --------------------------------------------------------------------------------
+
+def percentile(samples: List[float], pct: float) -> float:
+  return statistics.quantiles(samples, n=100)[int(pct) - 1] if len(samples) > 1 else samples[0]
+
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> Dict[str, float]:
+  return {
+    'requests': len(latencies),
+    'errors': errors,
+    'rps': round(len(latencies) / seconds, 2),
+    'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+    'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+    'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+  }
+
+
+def git_commit() -> Optional[str]:
+  try:
+    result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def build_report(args: argparse.Namespace, samples: Dict[str, RouteSamples]) -> Dict[str, Any]:
+  all_latencies = [latency for route in samples.values() for latency in route.latencies]
+  all_errors = sum(route.errors for route in samples.values())
+
+  return {
+    'meta': {
+      'commit': git_commit(),
+      'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+      'python': platform.python_version(),
+      'target': args.target,
+      'workers': args.workers if args.target == 'uvicorn' else None,
+      'backend': args.backend,
+      'users': args.users,
+      'lists_per_user': args.lists_per_user,
+      'items': args.items,
+      'concurrency': args.concurrency,
+      'seconds': args.seconds,
+      'seed': args.seed,
+      'trace': os.path.relpath(os.path.abspath(args.trace), ROOT),
+    },
+    'total': summarize(all_latencies, all_errors, args.seconds) if all_latencies else None,
+    'routes': {
+      name: summarize(route.latencies, route.errors, args.seconds)
+      for name, route in sorted(samples.items()) if route.latencies},
+  }
+
+
+def print_table(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+  rows = dict(report['routes'], total=report['total'])
+  base_rows = dict(baseline['routes'], total=baseline['total']) if baseline else {}
+
+  print(f"{'route':>22} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}", file=sys.stderr)
+  for name, row in rows.items():
+    if not row:
+      continue
+    line = f"{name:>22} {row['rps']:9.1f} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['p99_ms']:9.2f} {row['errors']:7d}"
+    base = base_rows.get(name)
+    if base:
+      line += f"   p95 {row['p95_ms'] / base['p95_ms'] - 1:+7.1%}  rps {row['rps'] / base['rps'] - 1:+7.1%}"
+    print(line, file=sys.stderr)
+
+
+# --------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument('--target', choices=['inprocess', 'uvicorn'], default='inprocess')
+  parser.add_argument('--workers', type=int, default=1)
+  parser.add_argument('--backend', choices=['json', 'oplog', 'sqlite', 'tiered'], default='json')
+  parser.add_argument('--users', type=int, default=100)
+  parser.add_argument('--lists-per-user', type=int, default=5)
+  parser.add_argument('--items', type=int, default=10_000)
+  parser.add_argument('--trace', default=DEFAULT_TRACE)
+  parser.add_argument('--concurrency', type=int, default=16)
+  parser.add_argument('--warmup', type=float, default=2.0)
+  parser.add_argument('--seconds', type=float, default=10.0)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help="write the JSON report here instead of stdout")
+  parser.add_argument('--baseline', help="a previous JSON report to compare against")
+  args = parser.parse_args()
+
+  trace = load_trace(args.trace)
+  dataset = Dataset(args.users, args.lists_per_user, args.items)
+  baseline = None
+  if args.baseline:
+    with open(args.baseline) as baseline_json:
+      baseline = json.load(baseline_json)
+
+  with tempfile.TemporaryDirectory() as workdir:
+    prepare_workdir(workdir, dataset, args.backend)
+
+    # The app reads config.json from the working directory when it is first imported
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+      seed_workdir(workdir, dataset, args.backend)
+      samples = asyncio.run(run_load(args, workdir, dataset, trace))
+    finally:
+      os.chdir(previous_dir)
+
+  report = build_report(args, samples)
+  print_table(report, baseline)
+
+  if args.output:
+    with open(args.output, 'w') as output_json:
+      json.dump(report, output_json, indent=2)
+  else:
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+  main()
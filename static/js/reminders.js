@@ -0,0 +1,35 @@
+// Keeps the reminders page in sync with changes made in other tabs or devices.
+// The server pushes a "change" event over /reminders/events,
+// and the page re-fetches its grid unless a row is being edited.
+
+(function () {
+  const tabId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+  let stale = false;
+
+  // Requests from this tab carry its ID, so the server does not echo our own changes back
+  document.body.setAttribute("hx-headers", JSON.stringify({ "X-Tab-Id": tabId }));
+
+  function isEditing() {
+    return document.querySelector(".reminder-row-with-input") !== null;
+  }
+
+  function refresh() {
+    if (isEditing()) {
+      stale = true;
+      return;
+    }
+
+    stale = false;
+    htmx.ajax("GET", "/reminders/content", { target: ".reminders-content", swap: "outerHTML" });
+  }
+
+  // Catch up on deferred changes once the open edit row is saved or cancelled
+  document.body.addEventListener("htmx:afterSettle", function () {
+    if (stale) {
+      refresh();
+    }
+  });
+
+  const events = new EventSource("/reminders/events?tab=" + encodeURIComponent(tabId));
+  events.addEventListener("change", refresh);
+})();
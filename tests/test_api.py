@@ -6,6 +6,10 @@ This module contains API tests for the Bulldoggy app.
 # Imports
 # --------------------------------------------------------------------------------
 
+import json
+import pytest
+import re
+
 from playwright.sync_api import APIRequestContext
 from testlib.inputs import User
 
@@ -22,3 +26,174 @@ def test_successful_api_login(bulldoggy_api: APIRequestContext, user: User, base
   cookie = bulldoggy_api.storage_state()['cookies'][0]
   assert cookie['name'] == 'reminders_session'
   assert cookie['value']
+
+
+def test_batch_applies_all_operations(bulldoggy_api: APIRequestContext, user: User):
+  bulldoggy_api.post('/login', form={'username': user.username, 'password': user.password})
+
+  response = bulldoggy_api.post('/api/batch', data=[
+    {'op': 'create_list', 'name': 'Batch list'},
+    {'op': 'add_item', 'list_id': '$0', 'description': 'First'},
+    {'op': 'strike_item', 'item_id': '$1'},
+  ])
+  assert response.ok
+
+  results = response.json()['results']
+  list_id = results[0]['reminder_list']['id']
+  assert results[2]['reminder_item']['completed'] is True
+  assert results[2]['reminder_item']['list_id'] == list_id
+
+  bulldoggy_api.delete(f'/api/reminders/{list_id}')
+
+
+def test_batch_is_all_or_nothing(bulldoggy_api: APIRequestContext, user: User):
+  bulldoggy_api.post('/login', form={'username': user.username, 'password': user.password})
+  lists_before = bulldoggy_api.get('/api/reminders').json()
+
+  response = bulldoggy_api.post('/api/batch', data=[
+    {'op': 'create_list', 'name': 'Doomed list'},
+    {'op': 'delete_item', 'item_id': 999999999},
+  ])
+  assert response.status == 404
+  assert response.json()['detail']['index'] == 1
+
+  assert bulldoggy_api.get('/api/reminders').json() == lists_before
+
+
+def test_batch_references_must_match_their_kind(bulldoggy_api: APIRequestContext, user: User):
+  bulldoggy_api.post('/login', form={'username': user.username, 'password': user.password})
+  lists_before = bulldoggy_api.get('/api/reminders').json()
+
+  response = bulldoggy_api.post('/api/batch', data=[
+    {'op': 'create_list', 'name': 'Mixed-up list'},
+    {'op': 'add_item', 'list_id': '$0', 'description': 'Item'},
+    {'op': 'delete_list', 'list_id': '$1'},
+  ])
+  assert response.status == 422
+  assert response.json()['detail']['index'] == 2
+
+  response = bulldoggy_api.post('/api/batch', data=[
+    {'op': 'create_list', 'name': 'Mixed-up list'},
+    {'op': 'strike_item', 'item_id': '$0'},
+  ])
+  assert response.status == 422
+  assert response.json()['detail']['index'] == 1
+
+  assert bulldoggy_api.get('/api/reminders').json() == lists_before
+
+
+def test_items_are_paginated_and_filtered(bulldoggy_api: APIRequestContext, user: User):
+  bulldoggy_api.post('/login', form={'username': user.username, 'password': user.password})
+
+  response = bulldoggy_api.post('/api/batch', data=[
+    {'op': 'create_list', 'name': 'Paged list'},
+    {'op': 'add_item', 'list_id': '$0', 'description': 'One'},
+    {'op': 'add_item', 'list_id': '$0', 'description': 'Two'},
+    {'op': 'add_item', 'list_id': '$0', 'description': 'Three'},
+    {'op': 'strike_item', 'item_id': '$2'},
+  ])
+  list_id = response.json()['results'][0]['reminder_list']['id']
+
+  first = bulldoggy_api.get(f'/api/reminders/{list_id}/items', params={'limit': 2})
+  assert [item['description'] for item in first.json()] == ['One', 'Two']
+  cursor = first.headers['x-next-cursor']
+
+  second = bulldoggy_api.get(f'/api/reminders/{list_id}/items', params={'limit': 2, 'cursor': cursor})
+  assert [item['description'] for item in second.json()] == ['Three']
+  assert 'x-next-cursor' not in second.headers
+
+  completed = bulldoggy_api.get(f'/api/reminders/{list_id}/items', params={'completed': 'true'})
+  assert [item['description'] for item in completed.json()] == ['Two']
+
+  bulldoggy_api.delete(f'/api/reminders/{list_id}')
+
+
+def test_items_stream_as_ndjson(bulldoggy_api: APIRequestContext, user: User):
+  bulldoggy_api.post('/login', form={'username': user.username, 'password': user.password})
+
+  response = bulldoggy_api.post('/api/batch', data=[
+    {'op': 'create_list', 'name': 'Streamed list'},
+    *[{'op': 'add_item', 'list_id': '$0', 'description': f'Item {i}'} for i in range(250)],
+  ])
+  list_id = response.json()['results'][0]['reminder_list']['id']
+
+  response = bulldoggy_api.get(f'/api/reminders/{list_id}/items', headers={'Accept': 'application/x-ndjson'})
+  assert response.headers['content-type'] == 'application/x-ndjson'
+
+  lines = response.text().splitlines()
+  assert len(lines) == 250
+  assert json.loads(lines[-1])['description'] == 'Item 249'
+
+  bulldoggy_api.delete(f'/api/reminders/{list_id}')
+
+
+def test_selecting_a_list_swaps_only_changed_rows(bulldoggy_api: APIRequestContext, user: User):
+  bulldoggy_api.post('/login', form={'username': user.username, 'password': user.password})
+
+  response = bulldoggy_api.post('/api/batch', data=[
+    {'op': 'create_list', 'name': 'First'},
+    {'op': 'create_list', 'name': 'Second'},
+    {'op': 'select_list', 'list_id': '$0'},
+  ])
+  first_id, second_id = [result['reminder_list']['id'] for result in response.json()['results'][:2]]
+
+  response = bulldoggy_api.post(f'/reminders/select/{second_id}')
+  assert response.ok
+
+  html = response.text()
+  assert html.startswith('<div\n  class="reminders-content-items"')
+  assert f"hx-swap-oob=\"outerHTML:[data-id='reminder-row-{first_id}']\"" in html
+  assert f"hx-swap-oob=\"outerHTML:[data-id='reminder-row-{second_id}']\"" in html
+  assert 'reminders-content-lists' not in html
+
+  bulldoggy_api.delete(f'/api/reminders/{first_id}')
+  bulldoggy_api.delete(f'/api/reminders/{second_id}')
+
+
+def test_unchanged_lists_are_not_modified(bulldoggy_api: APIRequestContext, user: User):
+  bulldoggy_api.post('/login', form={'username': user.username, 'password': user.password})
+
+  response = bulldoggy_api.get('/api/reminders')
+  etag = response.headers['etag']
+  assert bulldoggy_api.get('/api/reminders', headers={'If-None-Match': etag}).status == 304
+
+  list_id = bulldoggy_api.post('/api/reminders', data={'name': 'Conditional'}).json()['id']
+  response = bulldoggy_api.get('/api/reminders', headers={'If-None-Match': etag})
+  assert response.status == 200
+  assert response.headers['etag'] != etag
+
+  bulldoggy_api.delete(f'/api/reminders/{list_id}')
+
+
+def test_static_assets_are_fingerprinted_and_precompressed(bulldoggy_api: APIRequestContext):
+  html = bulldoggy_api.get('/login').text()
+  stylesheet = re.search(r'/static/dist/css/shared\.[0-9a-f]+\.css', html).group()
+
+  response = bulldoggy_api.get(stylesheet, headers={'Accept-Encoding': 'br, gzip'})
+  assert response.ok
+  assert response.headers['content-encoding'] == 'br'
+  assert 'immutable' in response.headers['cache-control']
+  assert re.search(r'/static/dist/font/PlayfairDisplay-VariableFont_wght\.[0-9a-f]+\.ttf', response.text())
+
+  response = bulldoggy_api.get(stylesheet, headers={'Accept-Encoding': 'identity'})
+  assert 'content-encoding' not in response.headers
+
+
+def test_metrics_use_route_templates(bulldoggy_api: APIRequestContext, user: User):
+  bulldoggy_api.post('/login', form={'username': user.username, 'password': user.password})
+  list_id = bulldoggy_api.post('/api/reminders', data={'name': 'Measured'}).json()['id']
+  bulldoggy_api.get(f'/api/reminders/{list_id}/items')
+
+  # Without the metrics route, the not-found handler redirects instead
+  response = bulldoggy_api.get('/metrics', max_redirects=0)
+  if response.headers.get('location') == '/not-found':
+    bulldoggy_api.delete(f'/api/reminders/{list_id}')
+    pytest.skip("metrics are disabled in config.json")
+
+  text = response.text()
+  assert 'bulldoggy_request_duration_seconds_count{method="GET",route="/api/reminders/{list_id}/items"}' in text
+  assert f'/api/reminders/{list_id}/items' not in text
+  assert 'bulldoggy_storage_operation_seconds_count{operation="get_items"}' in text
+  assert 'bulldoggy_jwt_decode_seconds_count' in text
+
+  bulldoggy_api.delete(f'/api/reminders/{list_id}')
@@ -6,7 +6,34 @@ This module contains unit tests for the Bulldoggy app.
 # Imports
 # --------------------------------------------------------------------------------
 
-from app.utils.auth import serialize_token, deserialize_token
+import asyncio
+import gzip
+import json
+import marshal
+import os
+import pytest
+import threading
+import time
+import zlib
+
+from app.utils.assets import manifest
+from app.utils.auth import authenticate_token, forget_session, serialize_token, deserialize_token, session_cache, token_lifetime
+from app.utils.backends import JsonBackend, OpLogBackend
+from app.utils.cache import LruCache
+from app.utils.compression import CompressionMiddleware
+from app.utils.events import ChangeHub
+from app.utils.limits import TokenBucketLimiter
+from app.utils.metrics import Histogram, MetricsMiddleware, registry, render_metrics
+from app.utils.profiling import ProfileSession, SamplingProfiler, dump_stacks
+from app.utils.passwords import hash_password, parse_password_hash, verify_password
+from app.utils.sqlite_storage import SqliteEngine, import_json
+from app.utils.storage import AsyncReminderStorage, ReminderStorage, SessionRevocations, StorageEngine
+from app.utils.templating import build_fingerprint, create_templates, warm_templates
+from app.utils.tiered_storage import TieredEngine
+from app.utils.tracing import TracingMiddleware, traced
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
 from testlib.inputs import User
 
 
@@ -22,3 +49,582 @@ def test_token_serialization(user: User):
 
   username = deserialize_token(token)
   assert username == user.username
+
+
+def test_auth_cookie_is_cached_until_logout(tmp_path, user: User):
+  revocations = SessionRevocations(StorageEngine(JsonBackend(str(tmp_path / 'reminder_db.json'))))
+  token = serialize_token(user.username)
+  cookie = authenticate_token(token, revocations)
+  assert cookie.username == user.username
+  assert authenticate_token(token, revocations) is cookie
+
+  forget_session(token)
+  assert session_cache.get(token) is None
+
+
+def test_tokens_expire_and_sessions_can_be_revoked(tmp_path, user: User):
+  db_path = str(tmp_path / 'reminder_db.json')
+  revocations = SessionRevocations(StorageEngine(JsonBackend(db_path)))
+
+  expired = serialize_token(user.username, now=time.time() - token_lifetime - 1)
+  assert deserialize_token(expired) is None
+
+  token = serialize_token(user.username)
+  cookie = authenticate_token(token, revocations)
+  renewed = serialize_token(user.username, cookie.session_id)
+  revocations.revoke(cookie.session_id, cookie.expires_at)
+  assert authenticate_token(token, revocations) is None
+  assert authenticate_token(renewed, revocations) is None
+
+  reloaded = SessionRevocations(StorageEngine(JsonBackend(db_path)))
+  assert reloaded.is_revoked(cookie.session_id)
+  assert reloaded.purge_expired(cookie.expires_at) == 1
+
+
+def test_revocations_purge_expired_sessions_as_they_go(tmp_path):
+  engine = StorageEngine(JsonBackend(str(tmp_path / 'reminder_db.json')))
+  revocations = SessionRevocations(engine, purge_every=3)
+  revocations.revoke('expired-1', int(time.time()) - 1)
+  revocations.revoke('expired-2', int(time.time()) - 1)
+  assert len(engine.all('revoked_sessions')) == 2
+
+  revocations.revoke('live', int(time.time()) + 60)
+  assert [doc['session_id'] for _, doc in engine.all('revoked_sessions')] == ['live']
+  engine.close()
+
+
+def test_password_hashes_verify(user: User):
+  encoded = hash_password(user.password)
+  assert user.password not in encoded
+
+  stored = parse_password_hash(encoded)
+  assert verify_password(user.password, stored)
+  assert not verify_password(user.password + '!', stored)
+
+
+def test_token_bucket_limits_bursts_and_refills():
+  now = [0.0]
+  limiter = TokenBucketLimiter(rate=1.0, burst=2, clock=lambda: now[0])
+  assert limiter.acquire('pythonista') == 0
+  assert limiter.acquire('pythonista') == 0
+  assert limiter.acquire('pythonista') == pytest.approx(1.0)
+  assert limiter.acquire('engineer') == 0
+
+  now[0] = 1.0
+  assert limiter.acquire('pythonista') == 0
+
+
+def test_templates_warm_into_bytecode_cache(tmp_path):
+  cache_dir = tmp_path / 'jinja_cache'
+  templates = create_templates('templates', bytecode_cache_dir=str(cache_dir))
+  count = warm_templates(templates)
+
+  assert count == len(templates.env.list_templates(extensions=['html']))
+  assert len(list(cache_dir.iterdir())) == count
+
+  restarted = create_templates('templates', bytecode_cache_dir=str(cache_dir))
+  assert warm_templates(restarted) == count
+  assert restarted.get_template('pages/login.html').render(request=None)
+
+
+def test_build_fingerprint_tracks_templates_and_assets(tmp_path, monkeypatch):
+  page = tmp_path / 'page.html'
+  page.write_text('<p>{{ text }}</p>')
+  templates = create_templates(str(tmp_path), auto_reload=True)
+  first = build_fingerprint(templates)
+  assert build_fingerprint(templates) == first
+
+  page.write_text('<div>{{ text }}</div>')
+  os.utime(page, ns=(page.stat().st_atime_ns, page.stat().st_mtime_ns + 10**9))
+  second = build_fingerprint(templates)
+  assert second != first
+
+  monkeypatch.setitem(manifest, 'css/shared.css', 'dist/css/shared.0123456789ab.css')
+  assert build_fingerprint(templates) not in (first, second)
+
+
+def _run_asgi(app, accept_encoding: str):
+  messages = []
+
+  async def receive():
+    return {'type': 'http.request', 'body': b''}
+
+  async def send(message):
+    messages.append(message)
+
+  scope = {'type': 'http', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+  asyncio.run(app(scope, receive, send))
+  return dict(messages[0]['headers']), [message.get('body', b'') for message in messages[1:]]
+
+
+def _body_app(content_type: str, *chunks: bytes):
+  async def app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', content_type.encode())]})
+    for i, chunk in enumerate(chunks):
+      await send({'type': 'http.response.body', 'body': chunk, 'more_body': i < len(chunks) - 1})
+  return app
+
+
+def test_compression_respects_threshold_types_and_streams():
+  html = b'<div class="reminder-row">Mow the lawn</div>' * 100
+
+  headers, bodies = _run_asgi(CompressionMiddleware(_body_app('text/html', html)), 'gzip')
+  assert headers[b'content-encoding'] == b'gzip'
+  assert gzip.decompress(bodies[0]) == html
+
+  headers, bodies = _run_asgi(CompressionMiddleware(_body_app('text/html', html[:100])), 'gzip')
+  assert b'content-encoding' not in headers
+  assert bodies == [html[:100]]
+
+  headers, bodies = _run_asgi(CompressionMiddleware(_body_app('text/event-stream', html)), 'gzip')
+  assert b'content-encoding' not in headers
+
+  # Each streamed chunk is flushed, so it decodes before the stream ends
+  lines = [b'{"id": %d}\n' % i for i in range(3)]
+  headers, bodies = _run_asgi(CompressionMiddleware(_body_app('application/x-ndjson', *lines)), 'gzip')
+  decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+  assert [decoder.decompress(body) for body in bodies] == lines
+
+
+def test_histograms_merge_thread_shards_into_prometheus_text():
+  histogram = Histogram('test_wait_seconds', "Test waits.", ('op',), buckets=(0.1, 1.0))
+  try:
+    histogram.labels('read').observe(0.05)
+    with ThreadPoolExecutor(4) as executor:
+      list(executor.map(histogram.labels('read').observe, [0.5] * 8))
+    histogram.labels('read').observe(5.0)
+
+    text = render_metrics()
+    assert '# TYPE test_wait_seconds histogram' in text
+    assert 'test_wait_seconds_bucket{op="read",le="0.1"} 1' in text
+    assert 'test_wait_seconds_bucket{op="read",le="1.0"} 9' in text
+    assert 'test_wait_seconds_bucket{op="read",le="+Inf"} 10' in text
+    assert 'test_wait_seconds_count{op="read"} 10' in text
+    assert 'test_wait_seconds_sum{op="read"} 9.05' in text
+  finally:
+    registry.remove(histogram)
+
+
+def test_metrics_middleware_labels_requests_by_route_template():
+  app = FastAPI()
+
+  @app.get('/widgets/{widget_id}')
+  async def get_widget(widget_id: int):
+    return {'id': widget_id}
+
+  app.add_middleware(MetricsMiddleware)
+  client = TestClient(app)
+  assert client.get('/widgets/8675309').status_code == 200
+
+  text = render_metrics()
+  assert 'bulldoggy_request_duration_seconds_count{method="GET",route="/widgets/{widget_id}"}' in text
+  assert '8675309' not in text
+
+
+def test_slow_requests_log_their_spans(caplog):
+  @traced('storage call')
+  def slow_call():
+    time.sleep(0.02)
+
+  async def traced_app(scope, receive, send):
+    # Spans from executor threads land on the trace through the copied context
+    await asyncio.to_thread(slow_call)
+    await _body_app('text/html', b'done')(scope, receive, send)
+
+  scope = {'type': 'http', 'method': 'GET', 'path': '/reminders', 'headers': []}
+
+  async def receive():
+    return {'type': 'http.request', 'body': b''}
+
+  async def discard(message):
+    pass
+
+  with caplog.at_level('WARNING', logger='app.utils.tracing'):
+    asyncio.run(TracingMiddleware(traced_app, threshold=0.01, sample_rate=1.0)(scope, receive, discard))
+    asyncio.run(TracingMiddleware(traced_app, threshold=1.0, sample_rate=1.0)(scope, receive, discard))
+    asyncio.run(TracingMiddleware(traced_app, threshold=0.0, sample_rate=0.0)(scope, receive, discard))
+
+  assert len(caplog.records) == 1
+  record = caplog.records[0].slow_request
+  assert record['path'] == '/reminders' and record['status'] == 200
+  assert [span['name'] for span in record['spans']] == ['storage call', 'send']
+  assert record['spans'][0]['duration_ms'] >= 20
+
+
+def test_sampling_profiler_collapses_thread_stacks():
+  # A plain flag rather than an Event, so samples land in busy_wait itself
+  stopping = [False]
+
+  def busy_wait():
+    while not stopping[0]:
+      pass
+
+  worker = threading.Thread(target=busy_wait, name='busy')
+  worker.start()
+  profiler = SamplingProfiler(interval=0.001)
+  profiler.start()
+  deadline = time.monotonic() + 5
+  while not any(stack[0] == 'busy' for stack in list(profiler.samples)) and time.monotonic() < deadline:
+    time.sleep(0.01)
+  profiler.stop()
+  stopping[0] = True
+  worker.join()
+
+  lines = profiler.collapsed().splitlines()
+  assert any(line.startswith('busy;') and 'test_unit.py:busy_wait ' in line for line in lines)
+  assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+def test_profile_session_writes_pstats_and_dumps_tasks():
+  async def profile():
+    session = ProfileSession('pstats', interval=0.001)
+    profiled = asyncio.create_task(session.run(5.0))
+    await asyncio.sleep(0.01)
+    stacks = dump_stacks()
+    session.stop()
+    return await profiled, stacks
+
+  content, stacks = asyncio.run(profile())
+  assert any(function == 'dump_stacks' for _, _, function in marshal.loads(content))
+  assert '<coroutine object ProfileSession.run' in stacks
+  assert 'Thread MainThread:' in stacks
+
+
+def test_lru_cache_evicts_and_expires():
+  now = [0.0]
+  cache = LruCache(max_size=2, ttl=10, clock=lambda: now[0])
+  cache.put('a', 1)
+  cache.put('b', 2)
+  cache.get('a')
+  cache.put('c', 3)
+  assert cache.get('b') is None
+  assert cache.get('a') == 1
+
+  now[0] = 11
+  assert cache.get('a') is None
+  assert cache.get('c') is None
+
+
+def test_lru_cache_bounds_total_weight():
+  cache = LruCache(max_size=10, max_weight=10)
+  cache.put('a', 'aaaa')
+  cache.put('b', 'bbbb')
+  cache.put('c', 'cccc')
+  assert cache.get('a') is None
+  assert cache.weight == 8
+
+  cache.put('huge', 'x' * 11)
+  assert cache.get('huge') is None
+  cache.put('b', 'b')
+  assert cache.weight == 5
+  cache.clear()
+  assert cache.weight == 0
+
+
+def test_storage_engine_persists_and_reads_from_memory(tmp_path, user: User):
+  db_path = tmp_path / 'reminder_db.json'
+  engine = StorageEngine(JsonBackend(str(db_path)))
+  storage = ReminderStorage(owner=user.username, engine=engine)
+  list_id = storage.create_list('Chores')
+  item_id = storage.add_item(list_id, 'Mow the lawn')
+  engine.close()
+
+  reloaded = StorageEngine(JsonBackend(str(db_path)))
+  db_path.write_text('{}')
+  storage = ReminderStorage(owner=user.username, engine=reloaded)
+  assert [rem_list.name for rem_list in storage.get_lists()] == ['Chores']
+  assert storage.get_item(item_id).description == 'Mow the lawn'
+  reloaded.close()
+
+
+def test_storage_engine_indexes_stay_in_sync(tmp_path):
+  engine = StorageEngine(JsonBackend(str(tmp_path / 'reminder_db.json')))
+  first = engine.insert('reminder_items', {'list_id': 1, 'description': 'a', 'completed': False})
+  second = engine.insert('reminder_items', {'list_id': 1, 'description': 'b', 'completed': False})
+  engine.update('reminder_items', first, {'list_id': 2})
+  engine.remove('reminder_items', [second])
+
+  assert engine.find('reminder_items', 'list_id', 1) == []
+  assert [doc_id for doc_id, _ in engine.find('reminder_items', 'list_id', 2)] == [first]
+  engine.close()
+
+
+def test_rollback_restores_doc_order(tmp_path, user: User):
+  engine = StorageEngine(JsonBackend(str(tmp_path / 'reminder_db.json')))
+  storage = ReminderStorage(owner=user.username, engine=engine)
+  list_ids = [storage.create_list(f'List {i}') for i in range(3)]
+  item_ids = [storage.add_item(list_ids[0], f'Item {i}') for i in range(3)]
+
+  with pytest.raises(RuntimeError):
+    with storage.transaction():
+      storage.delete_lists()
+      raise RuntimeError('abort')
+
+  assert [rem_list.id for rem_list in storage.get_lists()] == list_ids
+  assert [doc_id for doc_id, _ in engine.all('reminder_lists')] == list_ids
+  assert [item.id for item in storage.get_items(list_ids[0])] == item_ids
+  engine.close()
+
+
+def test_find_pages_in_doc_id_order(tmp_path):
+  engine = StorageEngine(JsonBackend(str(tmp_path / 'reminder_db.json')))
+  moved = engine.insert('reminder_items', {'list_id': 2, 'description': 'moved', 'completed': False})
+  item_ids = [
+    engine.insert('reminder_items', {'list_id': 1, 'description': str(i), 'completed': False})
+    for i in range(5)]
+
+  with pytest.raises(RuntimeError):
+    with engine.transaction():
+      engine.remove('reminder_items', item_ids[1::2])
+      raise RuntimeError('abort')
+  engine.update('reminder_items', moved, {'list_id': 1})
+
+  pages, after = [], None
+  while page := engine.find('reminder_items', 'list_id', 1, after=after, limit=2):
+    pages.append([doc_id for doc_id, _ in page])
+    after = page[-1][0]
+  
+  assert pages == [[moved, item_ids[0]], item_ids[1:3], item_ids[3:]]
+  engine.close()
+
+
+def test_failed_backend_commit_rolls_back_memory(tmp_path, monkeypatch):
+  backend = JsonBackend(str(tmp_path / 'reminder_db.json'))
+  engine = StorageEngine(backend)
+  kept = engine.insert('reminder_lists', {'owner': 'pythonpam', 'name': 'Kept'})
+
+  def fail(changes, dump):
+    raise OSError('disk full')
+
+  monkeypatch.setattr(backend, 'commit', fail)
+  with pytest.raises(OSError):
+    engine.insert('reminder_lists', {'owner': 'pythonpam', 'name': 'Lost'})
+  
+  assert [doc_id for doc_id, _ in engine.find('reminder_lists', 'owner', 'pythonpam')] == [kept]
+  monkeypatch.undo()
+  assert engine.insert('reminder_lists', {'owner': 'pythonpam', 'name': 'Next'}) == kept + 1
+  engine.close()
+
+
+def test_write_behind_coalesces_into_one_flush(tmp_path, user: User):
+  db_path = tmp_path / 'reminder_db.json'
+  backend = JsonBackend(str(db_path), write_behind=True, max_delay=60, max_batch=1000, fsync=False)
+  engine = StorageEngine(backend)
+  storage = ReminderStorage(owner=user.username, engine=engine)
+  list_id = storage.create_list('Chores')
+  for i in range(30):
+    storage.add_item(list_id, f'Chore {i}')
+  
+  assert json.loads(db_path.read_text()) == {}
+  engine.close()
+
+  data = json.loads(db_path.read_text())
+  assert len(data['reminder_items']) == 30
+
+
+def test_failed_flush_fails_its_waiters_and_retries(tmp_path, monkeypatch):
+  db_path = tmp_path / 'reminder_db.json'
+  backend = JsonBackend(str(db_path), write_behind=True, max_delay=0.01)
+  engine = StorageEngine(backend)
+  flush = backend._flush
+  failures = [OSError('disk full')]
+
+  def flaky_flush(dump):
+    if failures:
+      raise failures.pop()
+    flush(dump)
+
+  monkeypatch.setattr(backend, '_flush', flaky_flush)
+  with pytest.raises(OSError) as error:
+    engine.insert('reminder_lists', {'owner': 'pythonpam', 'name': 'Chores'})
+  assert str(error.value.__cause__) == 'disk full'
+
+  engine.insert('reminder_lists', {'owner': 'pythonpam', 'name': 'Errands'})
+  assert len(json.loads(db_path.read_text())['reminder_lists']) == 2
+  engine.close()
+
+
+def test_oplog_replays_and_compacts(tmp_path, user: User):
+  db_path = tmp_path / 'reminder_db.json'
+  engine = StorageEngine(OpLogBackend(str(db_path), compact_threshold=10**9, fsync=False))
+  storage = ReminderStorage(owner=user.username, engine=engine)
+  list_id = storage.create_list('Chores')
+  item_id = storage.add_item(list_id, 'Mow the lawn')
+  storage.strike_item(item_id)
+  engine.close()
+
+  assert not db_path.exists()
+  assert len((tmp_path / 'reminder_db.json.log').read_text().splitlines()) == 3
+
+  log_path = tmp_path / 'reminder_db.json.log'
+  log_ino = log_path.stat().st_ino
+  engine = StorageEngine(OpLogBackend(str(db_path), compact_threshold=0, fsync=False))
+  storage = ReminderStorage(owner=user.username, engine=engine)
+  assert storage.get_item(item_id).completed
+  storage.update_item_description(item_id, 'Mow the yard')
+  engine.close()
+
+  assert json.loads(db_path.read_text())['reminder_items'][str(item_id)]['description'] == 'Mow the yard'
+  assert log_path.stat().st_ino != log_ino
+  assert log_path.read_text() == ''
+
+
+def test_sqlite_engine_imports_json_database(tmp_path, user: User):
+  json_path = tmp_path / 'reminder_db.json'
+  engine = StorageEngine(JsonBackend(str(json_path)))
+  storage = ReminderStorage(owner=user.username, engine=engine)
+  list_id = storage.create_list('Chores')
+  item_id = storage.add_item(list_id, 'Mow the lawn')
+  storage.strike_item(item_id)
+  storage.set_selected_list(list_id)
+  engine.close()
+
+  sqlite_engine = SqliteEngine(str(tmp_path / 'reminder_db.sqlite3'))
+  import_json(str(json_path), sqlite_engine)
+  storage = ReminderStorage(owner=user.username, engine=sqlite_engine)
+  selected_list = storage.get_selected_list()
+  assert selected_list.name == 'Chores'
+  assert selected_list.items[0].completed is True
+
+  storage.delete_list(list_id)
+  assert storage.get_lists() == []
+  assert sqlite_engine.find('reminder_items', 'list_id', list_id) == []
+  sqlite_engine.close()
+
+
+def test_async_storage_runs_on_executor(tmp_path, user: User):
+  engine = StorageEngine(JsonBackend(str(tmp_path / 'reminder_db.json')))
+  executor = ThreadPoolExecutor(2, thread_name_prefix='storage')
+  storage = AsyncReminderStorage(ReminderStorage(owner=user.username, engine=engine), executor)
+
+  async def create_and_read():
+    list_id = await storage.create_list('Chores')
+    await storage.run_transaction(lambda sync_storage: sync_storage.add_item(list_id, 'Mow the lawn'))
+    return await storage.get_items(list_id)
+
+  items = asyncio.run(create_and_read())
+  assert [item.description for item in items] == ['Mow the lawn']
+  executor.shutdown()
+  engine.close()
+
+
+def test_storage_writes_publish_to_other_tabs(tmp_path, user: User):
+  engine = StorageEngine(JsonBackend(str(tmp_path / 'reminder_db.json')))
+
+  async def write_and_listen():
+    hub = ChangeHub()
+    this_tab = hub.subscribe(user.username, 'this-tab')
+    other_tab = hub.subscribe(user.username, 'other-tab')
+    other_owner = hub.subscribe('someone-else')
+    storage = AsyncReminderStorage(
+      ReminderStorage(owner=user.username, engine=engine),
+      on_change=lambda: hub.publish(user.username, 'this-tab'))
+
+    list_id = await storage.create_list('Chores')
+    await storage.add_item(list_id, 'Mow the lawn')
+    await storage.get_items(list_id)
+
+    notified = [await sub.wait(0.01) for sub in (this_tab, other_tab, other_owner)]
+    repeated = await other_tab.wait(0.01)
+    for sub in (this_tab, other_tab, other_owner):
+      hub.unsubscribe(sub)
+    return notified, repeated, len(hub)
+
+  notified, repeated, remaining = asyncio.run(write_and_listen())
+  assert notified == [False, True, False]
+  assert repeated is False
+  assert remaining == 0
+  engine.close()
+
+
+def test_tiered_engine_keeps_recent_owners_and_loads_others_lazily(tmp_path):
+  db_path = str(tmp_path / 'reminder_db.sqlite3')
+  engine = TieredEngine(SqliteEngine(db_path), max_owners=2)
+  owners = {name: ReminderStorage(owner=name, engine=engine) for name in ('ann', 'bob', 'cat')}
+
+  for name, storage in owners.items():
+    list_id = storage.create_list(f"{name}'s chores")
+    storage.add_item(list_id, 'Mow the lawn')
+    storage.set_selected_list(list_id)
+  assert engine.resident_owners == 2
+
+  # The least recently used owner was evicted, and loads again on first access
+  ann_list = owners['ann'].get_selected_list()
+  assert ann_list.name == "ann's chores"
+  assert [item.description for item in ann_list.items] == ['Mow the lawn']
+  assert engine.resident_owners == 2
+
+  # A failed transaction leaves neither SQLite nor memory changed
+  with pytest.raises(RuntimeError):
+    with owners['ann'].transaction():
+      owners['ann'].add_item(ann_list.id, 'Rake the leaves')
+      raise RuntimeError()
+  assert len(owners['ann'].get_items(ann_list.id)) == 1
+
+  # With `shared`, another process's commits are picked up on next access
+  first = TieredEngine(SqliteEngine(db_path), shared=True)
+  second = TieredEngine(SqliteEngine(db_path), shared=True)
+  assert len(ReminderStorage(owner='bob', engine=first).get_lists()) == 1
+  ReminderStorage(owner='bob', engine=second).create_list('Groceries')
+  assert len(ReminderStorage(owner='bob', engine=first).get_lists()) == 2
+
+  budgeted = TieredEngine(SqliteEngine(db_path), memory_budget=1)
+  for name in owners:
+    ReminderStorage(owner=name, engine=budgeted).get_lists()
+  assert budgeted.resident_owners == 1
+
+  for closing in (engine, first, second, budgeted):
+    closing.close()
+
+
+@pytest.mark.parametrize('backend_class', [JsonBackend, OpLogBackend])
+def test_shared_engines_see_each_others_commits(tmp_path, user: User, backend_class):
+  db_path = str(tmp_path / 'reminder_db.json')
+  first_engine = StorageEngine(backend_class(db_path, fsync=False, shared=True))
+  second_engine = StorageEngine(backend_class(db_path, fsync=False, shared=True))
+  first = ReminderStorage(owner=user.username, engine=first_engine)
+  second = ReminderStorage(owner=user.username, engine=second_engine)
+
+  chores_id = first.create_list('Chores')
+  groceries_id = second.create_list('Groceries')
+  assert groceries_id != chores_id
+
+  first.update_list_name(chores_id, 'Housework')
+  assert [rem_list.name for rem_list in second.get_lists()] == ['Housework', 'Groceries']
+
+  second.delete_list(groceries_id)
+  assert [rem_list.name for rem_list in first.get_lists()] == ['Housework']
+
+  first_engine.close()
+  second_engine.close()
+
+
+@pytest.mark.parametrize('engine_factory', [
+  lambda path: StorageEngine(JsonBackend(str(path / 'reminder_db.json'))),
+  lambda path: SqliteEngine(str(path / 'reminder_db.sqlite3')),
+  lambda path: TieredEngine(SqliteEngine(str(path / 'reminder_db.sqlite3')), max_owners=1),
+])
+def test_versions_change_only_with_their_docs(tmp_path, user: User, engine_factory):
+  engine = engine_factory(tmp_path)
+  storage = ReminderStorage(owner=user.username, engine=engine)
+  chores_id = storage.create_list('Chores')
+  groceries_id = storage.create_list('Groceries')
+  item_id = storage.add_item(chores_id, 'Mow the lawn')
+  storage.set_selected_list(chores_id)
+
+  item_version = storage.get_item_version(item_id)
+  groceries_version = storage.get_list_version(groceries_id)
+  page_version = storage.get_page_version()
+  assert storage.get_page_version() == page_version
+
+  storage.strike_item(item_id)
+  assert storage.get_item_version(item_id) != item_version
+  assert storage.get_list_version(groceries_id) == groceries_version
+  assert storage.get_page_version() != page_version
+
+  page_version = storage.get_page_version()
+  storage.set_selected_list(groceries_id)
+  assert storage.get_list_version(groceries_id) != groceries_version
+  assert storage.get_page_version() != page_version
+
+  engine.close()